@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from discord_blue.doodads.every_code.codec import BINARY_CODECS, JSON_CODECS
+from discord_blue.doodads.every_code.protocol import RemoteCommand, SessionStatus
+
+TURN_COMPLETE = {
+    "type": "turn_complete",
+    "session_id": "11111111-2222-3333-4444-555555555555",
+    "session_epoch": "epoch-1",
+    "message": "turn complete",
+    "assistant_message": "Here is what I changed:\n" + "- updated the parser and added tests for edge cases\n" * 60,
+}
+REPLY_COMMAND = RemoteCommand(
+    command_id="c" * 36,
+    session_id="s" * 36,
+    session_epoch="epoch-1",
+    kind="reply",
+    text="please continue with the next step " * 5,
+    issued_by="1234",
+).to_message()
+
+
+def decode_status(loads: Callable[[bytes], object], frame: bytes) -> SessionStatus:
+    return SessionStatus.from_payload(payload_object(loads(frame)))
+
+
+def payload_object(payload: object) -> dict[str, Any]:
+    if not isinstance(payload, dict):
+        raise TypeError("frame did not decode to an object")
+    return payload
+
+
+def microseconds(call: Callable[[], object], iterations: int) -> float:
+    return timeit.timeit(call, number=iterations) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare agent session frame codecs.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    iterations = parser.parse_args().iterations
+
+    codecs: dict[str, tuple[Callable[[bytes], object], Callable[[object], bytes]]] = {
+        name: (codec.loads, codec.dumps) for name, codec in JSON_CODECS.items()
+    }
+    codecs.update({name: (codec.loads, codec.dumps) for name, codec in BINARY_CODECS.items()})
+
+    print(f"turn_complete frame: {len(json.dumps(TURN_COMPLETE))} bytes as JSON, {iterations} iterations")
+    for name, (loads, dumps) in codecs.items():
+        decode = microseconds(partial(decode_status, loads, dumps(TURN_COMPLETE)), iterations)
+        encode = microseconds(partial(dumps, REPLY_COMMAND), iterations)
+        print(f"{name:>8}: decode + SessionStatus.from_payload {decode:6.2f} us, encode reply command {encode:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -70,6 +70,24 @@ class EveryCodeConfig(Serializable):
     auto_join_user_ids: list[int]
     heartbeat_timeout_seconds: int = 120
     heartbeat_check_interval_seconds: int = 30
+    state_dir: str = ""
+    notification_scan_limit: int = 500
+    inbound_queue_size: int = 256
+    control_refresh_debounce_seconds: float = 0.5
+    control_anchor_mode: str = "respawn"
+    thread_scan_concurrency: int = 8
+    json_codec: str = "auto"
+    websocket_compression: bool = True
+    websocket_max_message_bytes: int = 4 * 1024 * 1024
+    websocket_receive_timeout_seconds: float = 0.0
+    session_resume_grace_seconds: float = 30.0
+    session_replay_buffer_size: int = 256
+    pending_command_ttl_seconds: float = 1800.0
+    pending_prompt_ttl_seconds: float = 86400.0
+    pending_items_limit: int = 200
+    loop_lag_interval_seconds: float = 0.5
+    loop_lag_warning_seconds: float = 0.25
+    loop_lag_detect_blocking: bool = False
 
     def __init__(self) -> None:
         self.auto_join_user_ids = []
@@ -1,24 +1,37 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import re
 import shlex
-import subprocess
+import time
 import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import suppress
-from datetime import UTC, datetime, timedelta
+from functools import partial
 from pathlib import Path
 from typing import Literal, cast
 
 import discord
-from aiohttp import WSMsgType, web
+from aiohttp import WSMessage, WSMsgType, web
 
+from discord_blue.doodads.every_code.codec import BINARY_CODEC_MSGPACK
+from discord_blue.doodads.every_code.codec import BINARY_CODECS
+from discord_blue.doodads.every_code.codec import select_json_codec
+from discord_blue.doodads.every_code.messages import BridgeMessageCache
 from discord_blue.doodads.every_code.messages import edit_every_code_message
 from discord_blue.doodads.every_code.messages import every_code_allowed_mentions
 from discord_blue.doodads.every_code.messages import send_every_code_message
+from discord_blue.doodads.every_code.metrics import PROMETHEUS_CONTENT_TYPE
+from discord_blue.doodads.every_code.metrics import BridgeMetrics
+from discord_blue.doodads.every_code.outbound import AppliedReactions
+from discord_blue.doodads.every_code.outbound import OutboundPriority
+from discord_blue.doodads.every_code.outbound import OutboundScheduler
+from discord_blue.doodads.every_code.outbound import reaction_diff
+from discord_blue.doodads.every_code.processes import resume_session_id_for_pid
 from discord_blue.doodads.every_code.protocol import (
+    PROTOCOL_VERSION_JSON,
+    PROTOCOL_VERSION_MSGPACK,
     RequestUserInputQuestion,
     RemoteApprovalDecision,
     RemoteApprovalRequest,
@@ -28,22 +41,38 @@ from discord_blue.doodads.every_code.protocol import (
     SessionStatus,
     UserMessage,
 )
+from discord_blue.doodads.every_code.rollouts import catalog_rollout_path
+from discord_blue.doodads.every_code.rollouts import latest_agent_message
 from discord_blue.doodads.every_code.sessions import (
     EveryCodeSession,
     EveryCodeSessionRegistry,
+    HeartbeatDeadlines,
+    InboundWork,
     PendingRemoteApproval,
     PendingRemoteCommand,
     PendingRemoteUserInput,
     RejectedCommandMessage,
+    SessionAttachLocks,
 )
+from discord_blue.doodads.every_code.state import STATE_FILE_NAME
+from discord_blue.doodads.every_code.state import EveryCodeStateIndex
+from discord_blue.doodads.every_code.state import SessionNotificationIndex
+from discord_blue.doodads.every_code.state import default_state_dir
+from discord_blue.doodads.every_code.threads import ASSISTANT_MESSAGE_PREFIX
+from discord_blue.doodads.every_code.threads import THREAD_HISTORY_SAMPLE_LIMIT
+from discord_blue.doodads.every_code.threads import ChannelSnapshot
 from discord_blue.doodads.every_code.threads import SessionThread
+from discord_blue.doodads.every_code.threads import ThreadFingerprint
+from discord_blue.doodads.every_code.threads import ThreadFingerprintCache
 from discord_blue.doodads.every_code.threads import auto_join_configured_users
 from discord_blue.doodads.every_code.threads import create_session_thread
 from discord_blue.doodads.every_code.threads import get_every_code_channel
 from discord_blue.doodads.every_code.threads import session_notification_message
 from discord_blue.doodads.every_code.threads import session_thread_name
 from discord_blue.doodads.every_code.threads import session_start_message
-from discord_blue.health import health_payload
+from discord_blue.doodads.every_code.threads import session_start_without_pid
+from discord_blue.health import HealthPayloadEncoder
+from discord_blue.loop_monitor import LoopLagMonitor
 from discord_blue.plugs.discord_plug import BlueBot
 
 logger = logging.getLogger(__name__)
@@ -57,7 +86,7 @@ SHUTDOWN_RUNNER_CLEANUP_TIMEOUT_SECONDS = 5
 SHUTDOWN_THREAD_CLEANUP_TIMEOUT_SECONDS = 5
 AGENT_SESSION_CONNECT_PATH = "/agent-session/connect"
 EVERY_CODE_CONNECT_PATH = "/every-code/connect"
-SESSION_START_PREFIX = "Every Code session connected"
+CONTROL_ANCHOR_EDIT = "edit"
 SESSION_NOTIFICATION_PREFIX = "Every Code session connected for "
 SESSION_NOTIFICATION_PREFIXES = (
     SESSION_NOTIFICATION_PREFIX,
@@ -65,18 +94,32 @@ SESSION_NOTIFICATION_PREFIXES = (
 )
 CONTINUE_AUTONOMOUSLY_DELIVERED = "Asked the agent session to go ahead until it needs you."
 PAUSE_CURRENT_TURN_DELIVERED = "Asked the agent session to pause what it is doing now."
+INBOUND_MESSAGE_TYPES = frozenset(
+    {
+        "hello",
+        "resume",
+        "heartbeat",
+        "user_message",
+        "status_changed",
+        "turn_complete",
+        "error",
+        "approval_request",
+        "request_user_input",
+        "approval_decision_ack",
+        "approval_decision_reject",
+        "command_ack",
+        "command_reject",
+    }
+)
 SESSION_NOTIFICATION_THREAD_RE = re.compile(r"<#(?P<thread_id>\d+)>")
 MARKDOWN_CODE_FENCE_RE = re.compile(r"^[ \t]{0,3}(?P<fence>`{3,}|~{3,})(?P<info>[^`~\n]*)$")
-RESUME_SESSION_RE = re.compile(
-    r"\bresume\s+([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\b",
-    re.IGNORECASE,
-)
 REACTION_QUEUED = "⏳"
 REACTION_DELIVERED = "📬"
 REACTION_IN_PROGRESS = "🔄"
 REACTION_COMPACTING = "🧹"
 REACTION_FINISHED = "✅"
 REACTION_REJECTED = "❌"
+REACTION_EXPIRED = "⌛"
 STATUS_REACTIONS = {
     REACTION_QUEUED,
     REACTION_DELIVERED,
@@ -84,6 +127,7 @@ STATUS_REACTIONS = {
     REACTION_COMPACTING,
     REACTION_FINISHED,
     REACTION_REJECTED,
+    REACTION_EXPIRED,
 }
 REACTION_CONTROL_CONTINUE = "▶️"
 REACTION_CONTROL_STATUS = "\N{INFORMATION SOURCE}\N{VARIATION SELECTOR-16}"
@@ -277,17 +321,35 @@ class EveryCodeBridge:
         self._site: web.TCPSite | None = None
         self._cleanup_task: asyncio.Task[None] | None = None
         self._heartbeat_task: asyncio.Task[None] | None = None
-        self._session_attach_lock = asyncio.Lock()
+        self.heartbeat_deadlines = HeartbeatDeadlines()
+        self.metrics = BridgeMetrics()
+        self.json_codec = select_json_codec()
+        self.attach_locks = SessionAttachLocks(on_wait=self.metrics.attach_lock_wait_seconds.observe)
+        self._state_index: EveryCodeStateIndex | None = None
+        self._notification_index: SessionNotificationIndex | None = None
+        self._notification_index_warm = False
+        self._notification_index_lock = asyncio.Lock()
+        self.outbound = OutboundScheduler()
+        self.applied_reactions = AppliedReactions()
+        self.message_cache = BridgeMessageCache()
+        self.latest_thread_messages: dict[int, int] = {}
+        self.thread_fingerprints = ThreadFingerprintCache(observer=self.metrics.observe_discord_request)
+        self._startup_snapshot: ChannelSnapshot | None = None
+        self.loop_monitor: LoopLagMonitor | None = None
+        self._health_encoder: HealthPayloadEncoder | None = None
         self._stopping = False
 
     async def start(self) -> None:
         if self._runner is not None:
             return
         self._stopping = False
+        self.json_codec = select_json_codec(self.bot.config.every_code.json_codec)
 
         app = web.Application()
         self.register_routes(app)
         self._runner = web.AppRunner(app, shutdown_timeout=SHUTDOWN_RUNNER_CLEANUP_TIMEOUT_SECONDS)
+        self.health_encoder()
+        await self.warm_startup_state()
         await self._runner.setup()
         self._site = web.TCPSite(
             self._runner,
@@ -302,23 +364,67 @@ class EveryCodeBridge:
         )
         self._cleanup_task = asyncio.create_task(self.cleanup_stale_sessions())
         self._heartbeat_task = asyncio.create_task(self.monitor_heartbeats())
+        self.start_loop_monitor()
+
+    def start_loop_monitor(self) -> None:
+        config = self.bot.config.every_code
+        self.loop_monitor = LoopLagMonitor(
+            interval_seconds=config.loop_lag_interval_seconds,
+            warning_seconds=config.loop_lag_warning_seconds,
+            detect_blocking=config.loop_lag_detect_blocking,
+            on_sample=self.metrics.loop_lag_seconds.observe,
+            on_stall=self.metrics.loop_stalls.inc,
+        )
+        self.loop_monitor.start()
 
     def register_routes(self, app: web.Application) -> None:
         app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/metrics", self.handle_metrics)
         app.router.add_get(AGENT_SESSION_CONNECT_PATH, self.handle_connect)
         app.router.add_get(EVERY_CODE_CONNECT_PATH, self.handle_connect)
 
     async def handle_health(self, _request: web.Request) -> web.Response:
         discord_ready = self.discord_ready()
-        return web.json_response(
-            health_payload(
+        return web.Response(
+            body=self.health_encoder().encode(
                 discord_status="ok" if discord_ready else "unhealthy",
                 every_code_enabled=self.bot.config.every_code.enabled,
                 active_every_code_sessions=len(self.sessions.by_session),
+                event_loop=self.event_loop_health(),
             ),
             status=200 if discord_ready else 503,
+            content_type="application/json",
         )
 
+    def health_encoder(self) -> HealthPayloadEncoder:
+        if self._health_encoder is None:
+            self._health_encoder = HealthPayloadEncoder()
+        return self._health_encoder
+
+    async def handle_metrics(self, _request: web.Request) -> web.Response:
+        self.update_session_metrics()
+        return web.Response(
+            body=self.metrics.render().encode(),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
+
+    def update_session_metrics(self) -> None:
+        sessions = list(self.sessions.by_session.values())
+        self.metrics.sessions.set(len(sessions))
+        self.metrics.pending.set(sum(len(session.pending_commands) for session in sessions), "command")
+        self.metrics.pending.set(sum(len(session.pending_approvals) for session in sessions), "approval")
+        self.metrics.pending.set(sum(len(session.pending_user_inputs) for session in sessions), "user_input")
+
+    def event_loop_health(self) -> dict[str, object] | None:
+        monitor = self.loop_monitor
+        if monitor is None:
+            return None
+        return {
+            "status": "lagging" if monitor.lagging else "ok",
+            "lag_seconds": round(monitor.lag_seconds, 4),
+            "max_lag_seconds": round(monitor.max_lag_seconds, 4),
+        }
+
     def discord_ready(self) -> bool:
         if self.bot.user is None:
             return False
@@ -342,6 +448,9 @@ class EveryCodeBridge:
             with suppress(asyncio.CancelledError):
                 await self._heartbeat_task
             self._heartbeat_task = None
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+            self.loop_monitor = None
         await self.disconnect_active_sessions()
         try:
             await asyncio.wait_for(self._runner.cleanup(), timeout=SHUTDOWN_RUNNER_CLEANUP_TIMEOUT_SECONDS)
@@ -350,9 +459,96 @@ class EveryCodeBridge:
         finally:
             self._runner = None
             self._site = None
+            await self.outbound.close()
+            if self._state_index is not None:
+                self._state_index.close()
+
+    def state_index(self) -> EveryCodeStateIndex:
+        if self._state_index is None:
+            configured_state_dir = self.bot.config.every_code.state_dir
+            state_dir = Path(configured_state_dir).expanduser() if configured_state_dir else default_state_dir()
+            self._state_index = EveryCodeStateIndex(state_dir / STATE_FILE_NAME)
+        return self._state_index
+
+    def notification_index(self) -> SessionNotificationIndex:
+        if self._notification_index is None:
+            self._notification_index = SessionNotificationIndex(self.state_index())
+        return self._notification_index
+
+    async def warm_notification_index(self) -> None:
+        async with self._notification_index_lock:
+            if self._notification_index_warm:
+                return
+            bot_user = self.bot.user
+            if bot_user is None:
+                return
+            try:
+                channel = await get_every_code_channel(self.bot)
+            except ValueError:
+                return
+            if await self.scan_session_notifications(channel, bot_user.id) is not None:
+                self._notification_index_warm = True
+
+    async def warm_startup_state(self) -> None:
+        bot_user = self.bot.user
+        if bot_user is None:
+            return
+        try:
+            channel = await get_every_code_channel(self.bot)
+        except ValueError:
+            logger.warning("Unable to warm Every Code state: channel is unavailable")
+            return
+        async with self._notification_index_lock:
+            notifications = await self.scan_session_notifications(channel, bot_user.id)
+            if notifications is None:
+                return
+            self._notification_index_warm = True
+        threads = self.unique_threads(await self.session_thread_candidates(channel))
+        semaphore = self.thread_scan_semaphore()
+        fingerprints = await asyncio.gather(*(self.thread_fingerprint(thread, semaphore=semaphore) for thread in threads))
+        self._startup_snapshot = ChannelSnapshot(
+            notifications=notifications,
+            threads=threads,
+            fingerprints={
+                thread.id: fingerprint for thread, fingerprint in zip(threads, fingerprints, strict=True) if fingerprint is not None
+            },
+        )
+        logger.info(
+            "Warmed Every Code state with %s notification(s) and %s thread(s)",
+            len(notifications),
+            len(threads),
+        )
+
+    async def scan_session_notifications(
+        self,
+        channel: discord.TextChannel,
+        bot_user_id: int,
+    ) -> list[discord.Message] | None:
+        messages: list[discord.Message] = []
+        messages_by_thread: dict[int, list[int]] = {}
+        try:
+            with self.metrics.discord_request("channel_history"):
+                async for message in channel.history(limit=self.bot.config.every_code.notification_scan_limit):
+                    if message.author.id != bot_user_id:
+                        continue
+                    if not message.content.startswith(SESSION_NOTIFICATION_PREFIXES):
+                        continue
+                    messages.append(message)
+                    thread_id = self.notification_thread_id(message.content)
+                    if thread_id is not None:
+                        messages_by_thread.setdefault(thread_id, []).append(message.id)
+        except discord.DiscordException:
+            logger.warning("Unable to scan Every Code channel for session notifications")
+            return None
+
+        notification_index = self.notification_index()
+        for thread_id, message_ids in messages_by_thread.items():
+            if notification_index.get(thread_id) not in message_ids:
+                notification_index.record(thread_id, message_ids[0])
+        return messages
 
     async def disconnect_active_sessions(self) -> None:
-        async with self._session_attach_lock:
+        async with self.attach_locks.exclusive():
             close_tasks: list[asyncio.Task[None]] = []
             for session_id in list(self.sessions.by_session):
                 session = self.sessions.remove(session_id)
@@ -364,6 +560,9 @@ class EveryCodeBridge:
                 await asyncio.gather(*close_tasks)
 
     async def disconnect_active_session(self, session_id: str, session: EveryCodeSession) -> None:
+        if session.detached_task is not None:
+            session.detached_task.cancel()
+            session.detached_task = None
         if not session.websocket.closed:
             await self.close_session_websocket(session_id, session)
         try:
@@ -400,36 +599,71 @@ class EveryCodeBridge:
                 await self.close_session_thread(session)
 
     async def cleanup_stale_sessions(self) -> None:
-        await asyncio.sleep(STARTUP_RECONNECT_GRACE_SECONDS)
-        await self.cleanup_stale_session_notifications()
-        await self.cleanup_stale_session_threads()
+        try:
+            await asyncio.sleep(STARTUP_RECONNECT_GRACE_SECONDS)
+            await self.cleanup_stale_session_notifications()
+            await self.cleanup_stale_session_threads()
+        finally:
+            self._startup_snapshot = None
 
     async def monitor_heartbeats(self) -> None:
+        deadlines = self.heartbeat_deadlines
         while True:
-            await asyncio.sleep(self.bot.config.every_code.heartbeat_check_interval_seconds)
             await self.close_timed_out_sessions()
+            deadlines.changed.clear()
+            next_deadline = deadlines.next_deadline()
+            delay = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+            with suppress(TimeoutError, asyncio.TimeoutError):
+                await asyncio.wait_for(deadlines.changed.wait(), timeout=delay)
+
+    def track_session_heartbeat(self, session: EveryCodeSession) -> None:
+        self.heartbeat_deadlines.track(session, session.last_seen + self.bot.config.every_code.heartbeat_timeout_seconds)
 
     async def close_timed_out_sessions(self) -> None:
-        timeout = timedelta(seconds=self.bot.config.every_code.heartbeat_timeout_seconds)
-        now = datetime.now(UTC)
-        for session_id, session in list(self.sessions.by_session.items()):
-            if now - session.last_seen <= timeout:
+        timeout = self.bot.config.every_code.heartbeat_timeout_seconds
+        now = time.monotonic()
+        for session in self.heartbeat_deadlines.pop_due(now):
+            if self.sessions.get(session.session_id) is not session:
+                continue
+            if session.last_seen + timeout > now:
+                self.track_session_heartbeat(session)
+                self.schedule_pending_sweep(session)
+                continue
+            work_started_at = session.inbound_work_started_at
+            handler_stuck = work_started_at is not None and now - work_started_at > timeout
+            if session.inbound_queue_depth and not handler_stuck:
+                self.heartbeat_deadlines.track(session, now + self.bot.config.every_code.heartbeat_check_interval_seconds)
+                continue
+            if handler_stuck and session.inbound_task is not None:
+                logger.warning(
+                    "Every Code session %s handler has run for more than %s seconds; abandoning queued work",
+                    session.session_id,
+                    timeout,
+                )
+                session.inbound_task.cancel()
+            if self.detach_resumable_session(session):
+                logger.warning(
+                    "Every Code session %s timed out after %s seconds without heartbeat; holding it for resume",
+                    session.session_id,
+                    timeout,
+                )
+                await session.websocket.close(message=b"heartbeat timeout", drain=False)
                 continue
 
-            removed = self.sessions.remove(session_id)
+            removed = self.sessions.remove_if_current(session)
             if removed is None:
                 continue
 
             logger.warning(
                 "Every Code session %s timed out after %s seconds without heartbeat",
-                session_id,
-                self.bot.config.every_code.heartbeat_timeout_seconds,
+                session.session_id,
+                timeout,
             )
             await removed.websocket.close(message=b"heartbeat timeout")
             await self.close_session_thread(removed)
 
     async def cleanup_stale_session_notifications(self) -> None:
-        async with self._session_attach_lock:
+        async with self.attach_locks.exclusive():
             await self.cleanup_stale_session_notifications_locked()
 
     async def cleanup_stale_session_notifications_locked(self) -> None:
@@ -443,35 +677,33 @@ class EveryCodeBridge:
         if bot_user is None:
             return
 
+        snapshot = self._startup_snapshot
+        if snapshot is not None:
+            scanned_messages: list[discord.Message] | None = list(snapshot.notifications)
+        else:
+            scanned_messages = await self.scan_session_notifications(channel, bot_user.id)
+        if scanned_messages is None:
+            logger.warning("Unable to scan Every Code channel for stale notifications")
+            return
+        self._notification_index_warm = True
+
+        notification_index = self.notification_index()
         deleted = 0
         deferred_live_notices: dict[int, list[discord.Message]] = {}
         stored_live_notice_thread_ids: set[int] = set()
-        try:
-            async for message in channel.history(limit=None):
-                if message.author.id != bot_user.id:
-                    continue
-                if not message.content.startswith(SESSION_NOTIFICATION_PREFIXES):
-                    continue
-                thread_id = self.notification_thread_id(message.content)
-                if thread_id is not None:
-                    session = self.sessions.get_by_thread(thread_id)
-                    if session is not None:
-                        if session.notification_message_id == message.id:
-                            stored_live_notice_thread_ids.add(thread_id)
-                            continue
-                        deferred_live_notices.setdefault(thread_id, []).append(message)
+        for message in scanned_messages:
+            thread_id = self.notification_thread_id(message.content)
+            if thread_id is not None:
+                session = self.sessions.get_by_thread(thread_id)
+                if session is not None:
+                    if session.notification_message_id == message.id:
+                        stored_live_notice_thread_ids.add(thread_id)
+                        notification_index.record(thread_id, message.id)
                         continue
-                try:
-                    await message.delete()
-                    deleted += 1
-                except discord.DiscordException:
-                    logger.warning(
-                        "Unable to delete stale Every Code notification %s",
-                        message.id,
-                    )
-        except discord.DiscordException:
-            logger.warning("Unable to scan Every Code channel for stale notifications")
-            return
+                    deferred_live_notices.setdefault(thread_id, []).append(message)
+                    continue
+            if await self.delete_stale_session_notification(message):
+                deleted += 1
 
         for thread_id, messages in deferred_live_notices.items():
             session = self.sessions.get_by_thread(thread_id)
@@ -480,21 +712,35 @@ class EveryCodeBridge:
             else:
                 keep_message = messages[0]
                 session.notification_message_id = messages[0].id
+                notification_index.record(thread_id, messages[0].id)
             for message in messages:
                 if message is keep_message:
                     continue
-                try:
-                    await message.delete()
+                if await self.delete_stale_session_notification(message):
                     deleted += 1
-                except discord.DiscordException:
-                    logger.warning(
-                        "Unable to delete stale Every Code notification %s",
-                        message.id,
-                    )
+
+        scanned_message_ids = {message.id for message in scanned_messages}
+        for thread_id, message_id in list(notification_index.by_thread.items()):
+            if message_id in scanned_message_ids or self.sessions.get_by_thread(thread_id) is not None:
+                continue
+            if await self.delete_session_notification(message_id):
+                deleted += 1
 
         if deleted:
             logger.info("Deleted %s stale Every Code notification(s)", deleted)
 
+    async def delete_stale_session_notification(self, message: discord.Message) -> bool:
+        self.notification_index().forget_message(message.id)
+        try:
+            await self.delete_message(message)
+        except discord.DiscordException:
+            logger.warning(
+                "Unable to delete stale Every Code notification %s",
+                message.id,
+            )
+            return False
+        return True
+
     async def cleanup_stale_session_threads(self) -> None:
         try:
             channel = await get_every_code_channel(self.bot)
@@ -502,19 +748,17 @@ class EveryCodeBridge:
             logger.warning("Unable to clean Every Code threads: channel is unavailable")
             return
 
-        candidates = await self.session_thread_candidates(channel)
+        candidates = [
+            thread for thread in await self.known_session_thread_candidates(channel) if thread.id not in self.sessions.by_thread
+        ]
+        semaphore = self.thread_scan_semaphore()
+        is_session_thread = await asyncio.gather(
+            *(self.is_every_code_session_thread(thread, semaphore=semaphore) for thread in candidates)
+        )
 
         closed = 0
-        seen: set[int] = set()
-        for thread in candidates:
-            if thread.id in seen:
-                continue
-            seen.add(thread.id)
-            if thread.id in self.sessions.by_thread:
-                continue
-            if not await self.is_every_code_session_thread(thread):
-                continue
-            if thread.id in self.sessions.by_thread:
+        for thread, is_session in zip(candidates, is_session_thread, strict=True):
+            if not is_session or thread.id in self.sessions.by_thread:
                 continue
             await self.close_thread(thread)
             closed += 1
@@ -522,146 +766,588 @@ class EveryCodeBridge:
         if closed:
             logger.info("Closed %s stale Every Code thread(s)", closed)
 
-    async def is_every_code_session_thread(self, thread: discord.Thread) -> bool:
+    async def is_every_code_session_thread(
+        self,
+        thread: discord.Thread,
+        *,
+        semaphore: asyncio.Semaphore | None = None,
+    ) -> bool:
+        fingerprint = await self.thread_fingerprint(thread, semaphore=semaphore)
+        return fingerprint is not None and fingerprint.is_session_thread
+
+    async def thread_fingerprint(
+        self,
+        thread: discord.Thread,
+        *,
+        semaphore: asyncio.Semaphore | None = None,
+    ) -> ThreadFingerprint | None:
         bot_user = self.bot.user
         if bot_user is None:
-            return False
-        try:
-            async for message in thread.history(limit=10, oldest_first=True):
-                if message.author.id != bot_user.id:
-                    continue
-                if message.content.startswith(SESSION_START_PREFIX):
-                    return True
-        except discord.DiscordException:
-            logger.warning("Unable to inspect Every Code thread %s", thread.id)
-        return False
+            return None
+        snapshot = self._startup_snapshot
+        if snapshot is not None and thread.id in snapshot.fingerprints:
+            return snapshot.fingerprints[thread.id]
+        return await self.thread_fingerprints.get(thread, bot_user.id, semaphore=semaphore)
+
+    async def known_session_thread_candidates(self, channel: discord.TextChannel) -> list[discord.Thread]:
+        snapshot = self._startup_snapshot
+        if snapshot is not None:
+            return list(snapshot.threads)
+        return self.unique_threads(await self.session_thread_candidates(channel))
+
+    def thread_scan_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(max(1, self.bot.config.every_code.thread_scan_concurrency))
+
+    @staticmethod
+    def unique_threads(threads: list[discord.Thread]) -> list[discord.Thread]:
+        return list({thread.id: thread for thread in reversed(threads)}.values())[::-1]
 
     async def handle_connect(self, request: web.Request) -> web.WebSocketResponse:
         if not self._authorized(request):
             raise web.HTTPUnauthorized()
 
-        websocket = web.WebSocketResponse()
+        config = self.bot.config.every_code
+        websocket = web.WebSocketResponse(
+            compress=config.websocket_compression,
+            max_msg_size=max(0, config.websocket_max_message_bytes),
+            receive_timeout=config.websocket_receive_timeout_seconds or None,
+            decode_text=False,
+        )
         await websocket.prepare(request)
+        self.metrics.websocket_connections.inc("deflate" if websocket.compress else "none")
+        await self.serve_session_websocket(websocket)
+        return websocket
+
+    async def serve_session_websocket(self, websocket: web.WebSocketResponse) -> None:
         session: EveryCodeSession | None = None
 
-        async for message in websocket:
-            if message.type != WSMsgType.TEXT:
-                continue
-            try:
-                payload = json.loads(message.data)
-            except json.JSONDecodeError:
-                logger.warning("Invalid Every Code bridge JSON: %s", message.data)
+        async for message in self.receive_session_frames(websocket):
+            payload = self.decode_session_frame(message)
+            if payload is None:
                 continue
 
             message_type = payload.get("type")
-            if message_type == "hello":
-                hello = SessionHello.from_payload(payload)
-                rejecting_stopping_session = False
-                session_thread: SessionThread | None = None
-                async with self._session_attach_lock:
-                    if self._stopping:
-                        rejecting_stopping_session = True
-                    else:
-                        session = EveryCodeSession(hello=hello, websocket=websocket)
-                        self.sessions.register(session)
-                        session_thread = await self.find_or_create_session_thread(hello)
-                        self.sessions.bind_thread(
-                            hello.session_id,
-                            session_thread.thread.id,
-                            session_thread.notification_message_id,
-                        )
-                        await self.backfill_latest_assistant_message(
-                            session_thread.thread,
-                            hello,
-                        )
-                if rejecting_stopping_session:
-                    await websocket.close(message=b"bridge shutdown", drain=False)
-                    break
-                if session_thread is not None:
-                    await websocket.send_json({"type": "hello_ack", "thread_id": session_thread.thread.id})
-            elif message_type == "heartbeat" and session is not None:
-                session.touch()
-            elif message_type == "user_message":
-                user_message = UserMessage.from_payload(payload)
-                await self.handle_user_message(user_message)
-            elif message_type in {"status_changed", "turn_complete", "error"}:
-                status = SessionStatus.from_payload(payload)
-                await self.handle_session_status(message_type, status)
-            elif message_type == "approval_request":
-                approval = RemoteApprovalRequest.from_payload(payload)
-                await self.handle_approval_request(approval)
-            elif message_type == "request_user_input":
-                request_user_input = RemoteRequestUserInput.from_payload(payload)
-                await self.handle_request_user_input(request_user_input)
-            elif message_type == "approval_decision_ack":
-                logger.info("Every Code approval decision ack: %s", payload.get("approval_id"))
-                await self.handle_approval_decision_ack(payload)
-            elif message_type == "approval_decision_reject":
-                logger.warning("Every Code approval decision reject: %s", payload)
-                await self.handle_approval_decision_reject(payload)
-            elif message_type == "command_ack":
-                logger.info("Every Code command ack: %s", payload.get("command_id"))
-                await self.handle_command_ack(payload)
-            elif message_type == "command_reject":
-                logger.warning("Every Code command reject: %s", payload)
-                await self.handle_command_reject(payload)
+            self.metrics.inbound_messages.inc(message_type if message_type in INBOUND_MESSAGE_TYPES else "unknown")
+            if session is not None and not self.accept_inbound_sequence(session, payload):
+                continue
+            seq = payload.get("seq")
+            inbound_seq = seq if isinstance(seq, int) else None
+            if message_type == "heartbeat":
+                if session is not None:
+                    session.touch()
+                    self.finish_inline_sequence(session, inbound_seq)
+                continue
+            if message_type == "resume":
+                if session is None:
+                    session = await self.resume_session(websocket, payload)
+                else:
+                    await self.reject_resume(websocket, payload, "session already attached to this socket")
+                continue
+            try:
+                if message_type == "hello":
+                    hello = SessionHello.from_payload(payload)
+                    if session is not None:
+                        await self.stop_session_inbound(session, drain=False)
+                    session = EveryCodeSession(hello=hello, websocket=websocket)
+                    self.start_session_inbound(session)
+                    work: Callable[[], Awaitable[None]] | None = partial(self.attach_session, session)
+                else:
+                    work = self.inbound_work(str(message_type), payload)
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Invalid Every Code bridge %s message: %s", message_type, payload)
+                if session is not None:
+                    self.finish_inline_sequence(session, inbound_seq)
+                continue
+            if work is None:
+                if session is not None:
+                    self.finish_inline_sequence(session, inbound_seq)
+                continue
+            if session is None:
+                await work()
+            else:
+                await self.enqueue_session_inbound(session, str(message_type), work, seq=inbound_seq)
 
         if session is not None:
+            if session.resuming or session.websocket is not websocket:
+                return
+            await self.stop_session_inbound(session, drain=True)
+            if self.detach_resumable_session(session):
+                return
             removed = self.sessions.remove_if_current(session)
             if removed is not None:
                 await self.close_session_thread(removed)
 
-        return websocket
+    def accept_inbound_sequence(self, session: EveryCodeSession, payload: dict[str, object]) -> bool:
+        ack = payload.get("ack")
+        if isinstance(ack, int):
+            session.replay.acknowledge(ack)
+        seq = payload.get("seq")
+        if not isinstance(seq, int):
+            return True
+        if seq <= session.last_inbound_seq:
+            self.metrics.inbound_duplicates.inc()
+            return False
+        session.last_inbound_seq = seq
+        return True
+
+    @staticmethod
+    def finish_inline_sequence(session: EveryCodeSession, seq: int | None) -> None:
+        if seq is None or session.inbound_queue_depth or session.inbound_work_started_at is not None:
+            return
+        session.handled_inbound_seq = max(session.handled_inbound_seq, seq)
+
+    def detach_resumable_session(self, session: EveryCodeSession) -> bool:
+        if session.detached_task is not None:
+            return True
+        grace_seconds = self.bot.config.every_code.session_resume_grace_seconds
+        if self._stopping or grace_seconds <= 0 or not session.hello.resumable:
+            return False
+        if self.sessions.get(session.session_id) is not session:
+            return False
+        session.detached_task = asyncio.create_task(self.expire_detached_session(session, grace_seconds))
+        return True
+
+    async def expire_detached_session(self, session: EveryCodeSession, grace_seconds: float) -> None:
+        await asyncio.sleep(grace_seconds)
+        session.detached_task = None
+        removed = self.sessions.remove_if_current(session)
+        if removed is None:
+            return
+        self.metrics.session_resumes.inc("expired")
+        await self.close_session_thread(removed)
+
+    async def resume_session(self, websocket: web.WebSocketResponse, payload: dict[str, object]) -> EveryCodeSession | None:
+        session = self.sessions.get(self.payload_string(payload, "session_id"))
+        last_seq = payload.get("last_seq")
+        if session is None or not session.hello.resumable or session.resuming:
+            await self.reject_resume(websocket, payload, "session is not resumable")
+            return None
+        if session.session_epoch != self.payload_string(payload, "session_epoch"):
+            await self.reject_resume(websocket, payload, "session epoch changed")
+            return None
+        if not isinstance(last_seq, int) or not session.replay.covers(last_seq):
+            await self.reject_resume(websocket, payload, "replay buffer no longer covers last_seq")
+            return None
+
+        session.resuming = True
+        if session.detached_task is not None:
+            session.detached_task.cancel()
+            session.detached_task = None
+        session.touch()
+        session.replay.acknowledge(last_seq)
+        try:
+            if not session.websocket.closed:
+                logger.info("Every Code session %s resumed while its previous socket was still open", session.session_id)
+                await session.websocket.close(message=b"session resumed", drain=False)
+            drain_timeout = self.bot.config.every_code.heartbeat_timeout_seconds
+            await self.stop_session_inbound(session, drain=True, timeout=drain_timeout if drain_timeout > 0 else None)
+            session.last_inbound_seq = session.handled_inbound_seq
+            await self.write_session_frame(
+                websocket,
+                PROTOCOL_VERSION_JSON,
+                {
+                    "type": "resume_ack",
+                    "session_id": session.session_id,
+                    "thread_id": session.thread_id,
+                    "last_seq": session.handled_inbound_seq,
+                    "protocol_version": session.protocol_version,
+                },
+            )
+            replayed_seq = last_seq
+            while pending := session.replay.after(replayed_seq):
+                for message_seq, message in pending:
+                    await self.write_session_frame(websocket, session.protocol_version, message)
+                    replayed_seq = message_seq
+            session.websocket = websocket
+        finally:
+            session.resuming = False
+        self.track_session_heartbeat(session)
+        self.start_session_inbound(session)
+        self.metrics.session_resumes.inc("resumed")
+        logger.info("Every Code session %s resumed after seq %s", session.session_id, last_seq)
+        return session
+
+    async def reject_resume(self, websocket: web.WebSocketResponse, payload: dict[str, object], reason: str) -> None:
+        self.metrics.session_resumes.inc("rejected")
+        await self.write_session_frame(
+            websocket,
+            PROTOCOL_VERSION_JSON,
+            {"type": "resume_reject", "session_id": self.payload_string(payload, "session_id"), "reason": reason},
+        )
+
+    async def receive_session_frames(self, websocket: web.WebSocketResponse) -> AsyncIterator[WSMessage]:
+        try:
+            async for message in websocket:
+                yield message
+        except (TimeoutError, asyncio.TimeoutError):
+            logger.warning(
+                "Every Code session socket idle for %s seconds; closing",
+                self.bot.config.every_code.websocket_receive_timeout_seconds,
+            )
+            await websocket.close(message=b"receive timeout")
+
+    def decode_session_frame(self, message: WSMessage) -> dict[str, object] | None:
+        if message.type == WSMsgType.TEXT:
+            self.metrics.websocket_payload_bytes.inc("inbound", "json", amount=len(message.data))
+            try:
+                payload = self.json_codec.loads(message.data)
+            except ValueError:
+                logger.warning("Invalid Every Code bridge JSON: %s", message.data)
+                return None
+        elif message.type == WSMsgType.BINARY:
+            binary_codec = BINARY_CODECS.get(BINARY_CODEC_MSGPACK)
+            if binary_codec is None:
+                logger.warning("Dropping binary Every Code bridge frame: MessagePack is not installed")
+                return None
+            self.metrics.websocket_payload_bytes.inc("inbound", binary_codec.name, amount=len(message.data))
+            try:
+                payload = binary_codec.loads(message.data)
+            except ValueError:
+                logger.warning("Invalid Every Code bridge MessagePack frame of %s bytes", len(message.data))
+                return None
+        else:
+            return None
+        if not isinstance(payload, dict):
+            logger.warning("Invalid Every Code bridge message: %s", message.data)
+            return None
+        return payload
+
+    @staticmethod
+    def negotiate_protocol_version(hello: SessionHello) -> int:
+        if hello.protocol_version >= PROTOCOL_VERSION_MSGPACK and BINARY_CODEC_MSGPACK in BINARY_CODECS:
+            return PROTOCOL_VERSION_MSGPACK
+        return PROTOCOL_VERSION_JSON
+
+    async def send_session_message(self, session: EveryCodeSession, message: dict[str, object]) -> None:
+        if session.hello.resumable:
+            message = session.replay.record(message, self.bot.config.every_code.session_replay_buffer_size)
+            if session.detached_task is not None or session.resuming:
+                return
+        await self.write_session_frame(session.websocket, session.protocol_version, message)
+
+    async def write_session_frame(
+        self,
+        websocket: web.WebSocketResponse,
+        protocol_version: int,
+        message: dict[str, object],
+    ) -> None:
+        if protocol_version >= PROTOCOL_VERSION_MSGPACK:
+            encoding = BINARY_CODEC_MSGPACK
+            opcode = WSMsgType.BINARY
+            payload = BINARY_CODECS[BINARY_CODEC_MSGPACK].dumps(message)
+        else:
+            encoding = "json"
+            opcode = WSMsgType.TEXT
+            payload = self.json_codec.dumps(message)
+        self.metrics.observe_outbound_frame(websocket, encoding, payload, bool(websocket.compress))
+        await websocket.send_frame(payload, opcode)
+
+    def inbound_work(self, message_type: str, payload: dict[str, object]) -> Callable[[], Awaitable[None]] | None:
+        if message_type == "user_message":
+            return partial(self.handle_user_message, UserMessage.from_payload(payload))
+        if message_type in {"status_changed", "turn_complete", "error"}:
+            return partial(self.handle_session_status, message_type, SessionStatus.from_payload(payload))
+        if message_type == "approval_request":
+            return partial(self.handle_approval_request, RemoteApprovalRequest.from_payload(payload))
+        if message_type == "request_user_input":
+            return partial(self.handle_request_user_input, RemoteRequestUserInput.from_payload(payload))
+        if message_type == "approval_decision_ack":
+            logger.info("Every Code approval decision ack: %s", payload.get("approval_id"))
+            return partial(self.handle_approval_decision_ack, payload)
+        if message_type == "approval_decision_reject":
+            logger.warning("Every Code approval decision reject: %s", payload)
+            return partial(self.handle_approval_decision_reject, payload)
+        if message_type == "command_ack":
+            logger.info("Every Code command ack: %s", payload.get("command_id"))
+            return partial(self.handle_command_ack, payload)
+        if message_type == "command_reject":
+            logger.warning("Every Code command reject: %s", payload)
+            return partial(self.handle_command_reject, payload)
+        return None
+
+    def start_session_inbound(self, session: EveryCodeSession) -> None:
+        session.inbound_queue = asyncio.Queue(maxsize=max(1, self.bot.config.every_code.inbound_queue_size))
+        session.inbound_closed = False
+        session.inbound_task = asyncio.create_task(self.consume_session_inbound(session))
+
+    async def enqueue_session_inbound(
+        self,
+        session: EveryCodeSession,
+        message_type: str,
+        work: Callable[[], Awaitable[None]],
+        *,
+        seq: int | None = None,
+    ) -> None:
+        if session.inbound_queue is None:
+            await work()
+            return
+        await session.inbound_queue.put(InboundWork(message_type=message_type, run=work, seq=seq))
+
+    async def consume_session_inbound(self, session: EveryCodeSession) -> None:
+        queue = session.inbound_queue
+        if queue is None:
+            return
+        while True:
+            work = await queue.get()
+            started_at = time.monotonic()
+            try:
+                if work is None:
+                    return
+                session.inbound_work_started_at = started_at
+                await work.run()
+            except Exception:
+                if work is not None:
+                    self.metrics.handler_errors.inc(work.message_type)
+                logger.exception(
+                    "Every Code %s handler failed for session %s",
+                    work.message_type if work is not None else "inbound",
+                    session.session_id,
+                )
+            finally:
+                session.inbound_work_started_at = None
+                if work is not None:
+                    self.metrics.handler_seconds.observe(time.monotonic() - started_at, work.message_type)
+                queue.task_done()
+            if work is not None and work.seq is not None:
+                session.handled_inbound_seq = max(session.handled_inbound_seq, work.seq)
+            if self.pending_items_over_limit(session):
+                await self.expire_pending_items(session)
+
+    def pending_items_over_limit(self, session: EveryCodeSession) -> bool:
+        limit = self.bot.config.every_code.pending_items_limit
+        if limit <= 0:
+            return False
+        return (
+            len(session.pending_commands) > limit
+            or len(session.pending_approvals) > limit
+            or len(session.pending_user_inputs) > limit
+            or len(session.rejected_command_messages) > limit
+        )
+
+    def schedule_pending_sweep(self, session: EveryCodeSession) -> None:
+        queue = session.inbound_queue
+        if queue is None or not session.inbound_open:
+            return
+        with suppress(asyncio.QueueFull):
+            queue.put_nowait(InboundWork(message_type="pending_sweep", run=partial(self.expire_pending_items, session)))
+
+    async def expire_pending_items(self, session: EveryCodeSession) -> None:
+        config = self.bot.config.every_code
+        limit = config.pending_items_limit
+        evictions = self.metrics.pending_evictions
+        for command_id, reason in session.pending_commands.evictions(
+            config.pending_command_ttl_seconds,
+            limit,
+            keep=session.active_command_id,
+        ):
+            command = session.pending_commands.pop(command_id, None)
+            if command is None:
+                continue
+            evictions.inc("command", reason)
+            if command.message_id is not None and command.message_id != session.control_message_id:
+                await self.set_message_reaction(command.thread_id, command.message_id, REACTION_EXPIRED)
+        for approval_id, reason in session.pending_approvals.evictions(config.pending_prompt_ttl_seconds, limit):
+            approval = session.pending_approvals.pop(approval_id, None)
+            if approval is None:
+                continue
+            evictions.inc("approval", reason)
+            if approval.decision is None:
+                await self.send_expired_item_to_session(
+                    session,
+                    RemoteApprovalDecision(
+                        approval_id=approval_id,
+                        session_id=session.session_id,
+                        session_epoch=session.session_epoch,
+                        decision="denied",
+                    ).to_message(),
+                )
+            await self.edit_approval_message(approval, "**Approval expired**\nThe bridge stopped waiting on this request.")
+        for turn_id, reason in session.pending_user_inputs.evictions(config.pending_prompt_ttl_seconds, limit):
+            pending = session.pending_user_inputs.pop(turn_id, None)
+            if pending is None:
+                continue
+            evictions.inc("user_input", reason)
+            await self.send_expired_item_to_session(
+                session,
+                RemoteCommand(
+                    command_id=str(uuid.uuid4()),
+                    session_id=session.session_id,
+                    session_epoch=session.session_epoch,
+                    kind="request_user_input_response",
+                    call_id=pending.call_id,
+                    turn_id=turn_id,
+                    response={"answers": {}},
+                ).to_message(),
+            )
+            await self.edit_user_input_message(pending, "The bridge stopped waiting on this prompt.")
+        if limit > 0 and len(session.rejected_command_messages) > limit:
+            overflow = len(session.rejected_command_messages) - limit
+            stale_messages = session.rejected_command_messages[:overflow]
+            del session.rejected_command_messages[:overflow]
+            evictions.inc("rejected_command", "limit", amount=overflow)
+            for rejected_message in stale_messages:
+                await self.clear_message_transient_reactions(rejected_message.thread_id, rejected_message.message_id)
+
+    async def send_expired_item_to_session(self, session: EveryCodeSession, message: dict[str, object]) -> None:
+        try:
+            await self.send_session_message(session, message)
+        except ConnectionResetError:
+            logger.info("Every Code session %s closed before it was told %s expired", session.session_id, message["type"])
+
+    async def stop_session_inbound(
+        self,
+        session: EveryCodeSession,
+        *,
+        drain: bool,
+        timeout: float | None = None,
+    ) -> None:
+        queue = session.inbound_queue
+        task = session.inbound_task
+        if queue is None or task is None or task.done():
+            return
+        if not drain:
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+        session.inbound_closed = True
+        await queue.put(None)
+        if drain:
+            done, _pending = await asyncio.wait({task}, timeout=timeout)
+            if not done:
+                logger.warning(
+                    "Every Code session %s inbound work did not drain within %s seconds; abandoning it",
+                    session.session_id,
+                    timeout,
+                )
+                task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def attach_session(self, session: EveryCodeSession) -> None:
+        hello = session.hello
+        rejecting_stopping_session = False
+        session_thread: SessionThread | None = None
+        async with self.attach_locks.attaching(hello):
+            started_at = time.monotonic()
+            if self._stopping:
+                rejecting_stopping_session = True
+            else:
+                self.sessions.register(session)
+                self.track_session_heartbeat(session)
+                try:
+                    session_thread = await self.find_or_create_session_thread(hello)
+                    self.bind_session_thread(hello, session_thread)
+                    await self.backfill_latest_assistant_message(
+                        session_thread.thread,
+                        hello,
+                    )
+                except Exception:
+                    self.sessions.remove_if_current(session)
+                    await session.websocket.close(message=b"attach failed", drain=False)
+                    raise
+                self.metrics.attach_seconds.observe(time.monotonic() - started_at)
+        if rejecting_stopping_session:
+            await session.websocket.close(message=b"bridge shutdown", drain=False)
+            return
+        if session_thread is not None:
+            protocol_version = self.negotiate_protocol_version(hello)
+            await self.write_session_frame(
+                session.websocket,
+                PROTOCOL_VERSION_JSON,
+                {
+                    "type": "hello_ack",
+                    "thread_id": session_thread.thread.id,
+                    "protocol_version": protocol_version,
+                    "resumable": hello.resumable and self.bot.config.every_code.session_resume_grace_seconds > 0,
+                },
+            )
+            session.protocol_version = protocol_version
+
+    def bind_session_thread(self, hello: SessionHello, session_thread: SessionThread) -> None:
+        self.sessions.bind_thread(
+            hello.session_id,
+            session_thread.thread.id,
+            session_thread.notification_message_id,
+        )
+        self.state_index().record_session_thread(
+            hello,
+            session_thread.thread.id,
+            session_thread.notification_message_id,
+        )
+        if session_thread.notification_message_id is not None:
+            self.notification_index().record(session_thread.thread.id, session_thread.notification_message_id)
 
     async def find_or_create_session_thread(self, hello: SessionHello) -> SessionThread:
-        thread = await self.find_existing_session_thread(hello)
-        if thread is None:
-            return await create_session_thread(self.bot, hello)
+        known_notification_message_id: int | None = None
+        indexed_thread = await self.find_indexed_session_thread(hello)
+        if indexed_thread is not None:
+            thread, known_notification_message_id = indexed_thread
+            self.metrics.session_attaches.inc("indexed")
+        else:
+            existing_thread = await self.find_existing_session_thread(hello)
+            if existing_thread is None:
+                self.metrics.session_attaches.inc("created")
+                return await create_session_thread(self.bot, hello, self.metrics.observe_discord_request)
+            thread = existing_thread
+            self.metrics.session_attaches.inc("scanned")
 
         if thread.archived or thread.locked:
             try:
-                await thread.edit(
+                await self.edit_thread(
+                    thread,
                     archived=False,
                     locked=False,
                     reason="Reattaching live Every Code session after bridge restart",
                 )
             except discord.DiscordException:
                 logger.warning("Unable to reopen Every Code thread %s", thread.id)
-        await auto_join_configured_users(self.bot, thread)
-        notification_message_id = await self.ensure_session_notification(hello, thread)
+        await auto_join_configured_users(self.bot, thread, self.metrics.observe_discord_request)
+        notification_message_id = known_notification_message_id
+        if notification_message_id is None:
+            notification_message_id = await self.ensure_session_notification(hello, thread)
         return SessionThread(thread=thread, notification_message_id=notification_message_id)
 
+    async def find_indexed_session_thread(self, hello: SessionHello) -> tuple[discord.Thread, int | None] | None:
+        indexed = self.state_index().lookup_session_thread(hello)
+        if indexed is None:
+            return None
+        mapped_session_id = self.sessions.by_thread.get(indexed.thread_id)
+        if mapped_session_id is not None and mapped_session_id != hello.session_id:
+            return None
+
+        thread = await self.get_thread(indexed.thread_id)
+        expected_starts = self.expected_session_start_messages(hello)
+        if thread is None:
+            matches = False
+        elif indexed.pid_relaxed:
+            matches = await self.session_thread_matches_without_pid(
+                thread,
+                self.session_start_messages_without_pid(expected_starts),
+            )
+        else:
+            matches = await self.session_thread_matches(thread, expected_starts)
+        if thread is None or not matches:
+            logger.info("Every Code state index entry for thread %s is stale; scanning Discord", indexed.thread_id)
+            self.state_index().forget_thread(indexed.thread_id)
+            return None
+        return thread, indexed.notification_message_id
+
     async def ensure_session_notification(self, hello: SessionHello, thread: discord.Thread) -> int | None:
         existing_message_id = await self.find_session_notification_for_thread(thread.id)
         if existing_message_id is not None:
             return existing_message_id
         try:
             channel = await get_every_code_channel(self.bot)
-            message = await send_every_code_message(channel, session_notification_message(hello, thread))
+            message = await self.send_message(channel, session_notification_message(hello, thread))
         except (discord.DiscordException, ValueError):
             logger.warning("Unable to create Every Code notification for thread %s", thread.id)
             return None
+        self.notification_index().record(thread.id, message.id)
         return message.id
 
     async def find_session_notification_for_thread(self, thread_id: int) -> int | None:
-        try:
-            channel = await get_every_code_channel(self.bot)
-        except ValueError:
-            return None
-        bot_user = self.bot.user
-        if bot_user is None:
-            return None
-        try:
-            async for message in channel.history(limit=None):
-                if message.author.id != bot_user.id:
-                    continue
-                if not message.content.startswith(SESSION_NOTIFICATION_PREFIXES):
-                    continue
-                if self.notification_thread_id(message.content) == thread_id:
-                    return message.id
-        except discord.DiscordException:
-            logger.warning("Unable to scan Every Code notifications for thread %s", thread_id)
-        return None
+        await self.warm_notification_index()
+        return self.notification_index().get(thread_id)
 
     @staticmethod
     def notification_thread_id(content: str) -> int | None:
@@ -681,25 +1367,26 @@ class EveryCodeBridge:
         expected_starts_without_pid = self.session_start_messages_without_pid(expected_starts)
         best_thread: discord.Thread | None = None
         best_score: tuple[int, int, int] | None = None
-        seen: set[int] = set()
-        skipped_mapped = 0
-        pid_relaxed_matches: list[tuple[discord.Thread, tuple[int, int, int]]] = []
-        for thread in await self.session_thread_candidates(channel):
-            if thread.id in seen:
-                continue
-            seen.add(thread.id)
+        seen = await self.known_session_thread_candidates(channel)
+        candidates: list[discord.Thread] = []
+        for thread in seen:
             mapped_session_id = self.sessions.by_thread.get(thread.id)
-            if mapped_session_id is not None and mapped_session_id != hello.session_id:
-                skipped_mapped += 1
+            if mapped_session_id is None or mapped_session_id == hello.session_id:
+                candidates.append(thread)
+        skipped_mapped = len(seen) - len(candidates)
+        semaphore = self.thread_scan_semaphore()
+        fingerprints = await asyncio.gather(*(self.thread_fingerprint(thread, semaphore=semaphore) for thread in candidates))
+        pid_relaxed_matches: list[tuple[discord.Thread, tuple[int, int, int]]] = []
+        for thread, fingerprint in zip(candidates, fingerprints, strict=True):
+            if fingerprint is None:
                 continue
-            if not await self.session_thread_matches(thread, expected_starts):
-                if await self.session_thread_matches_without_pid(thread, expected_starts_without_pid):
-                    pid_relaxed_matches.append((thread, await self.score_session_thread(thread)))
+            if not fingerprint.matches(expected_starts):
+                if fingerprint.matches_without_pid(expected_starts_without_pid):
+                    pid_relaxed_matches.append((thread, fingerprint.score))
                 continue
-            score = await self.score_session_thread(thread)
-            if best_score is None or score > best_score:
+            if best_score is None or fingerprint.score > best_score:
                 best_thread = thread
-                best_score = score
+                best_score = fingerprint.score
         if best_thread is not None:
             return best_thread
         if len(pid_relaxed_matches) == 1:
@@ -754,36 +1441,31 @@ class EveryCodeBridge:
 
     @staticmethod
     def session_start_without_pid(content: str) -> str | None:
-        lines = content.splitlines()
-        if not lines or lines[0] != SESSION_START_PREFIX:
-            return None
-        if not any(line.startswith("session: `") for line in lines):
-            return None
-        if not lines[-1].startswith("pid: `"):
-            return None
-        return "\n".join(lines[:-1])
+        return session_start_without_pid(content)
 
-    @staticmethod
     async def session_thread_candidates(
+        self,
         channel: discord.TextChannel,
     ) -> list[discord.Thread]:
         candidates = list(channel.threads)
         try:
-            async for thread in channel.archived_threads(
-                private=False,
-                joined=False,
-                limit=50,
-            ):
-                candidates.append(thread)
+            with self.metrics.discord_request("archived_threads"):
+                async for thread in channel.archived_threads(
+                    private=False,
+                    joined=False,
+                    limit=50,
+                ):
+                    candidates.append(thread)
         except (discord.DiscordException, ValueError):
             logger.warning("Unable to scan public archived Every Code threads")
         try:
-            async for thread in channel.archived_threads(
-                private=True,
-                joined=True,
-                limit=50,
-            ):
-                candidates.append(thread)
+            with self.metrics.discord_request("archived_threads"):
+                async for thread in channel.archived_threads(
+                    private=True,
+                    joined=True,
+                    limit=50,
+                ):
+                    candidates.append(thread)
         except (discord.DiscordException, ValueError):
             logger.warning("Unable to scan joined private archived Every Code threads")
         return candidates
@@ -793,18 +1475,8 @@ class EveryCodeBridge:
         thread: discord.Thread,
         expected_starts: set[str],
     ) -> bool:
-        bot_user = self.bot.user
-        if bot_user is None:
-            return False
-        try:
-            async for message in thread.history(limit=10, oldest_first=True):
-                if message.author.id != bot_user.id:
-                    continue
-                if message.content in expected_starts:
-                    return True
-        except discord.DiscordException:
-            logger.warning("Unable to inspect Every Code thread %s", thread.id)
-        return False
+        fingerprint = await self.thread_fingerprint(thread)
+        return fingerprint is not None and fingerprint.matches(expected_starts)
 
     async def session_thread_matches_without_pid(
         self,
@@ -813,32 +1485,8 @@ class EveryCodeBridge:
     ) -> bool:
         if not expected_starts_without_pid:
             return False
-        bot_user = self.bot.user
-        if bot_user is None:
-            return False
-        try:
-            async for message in thread.history(limit=10, oldest_first=True):
-                if message.author.id != bot_user.id:
-                    continue
-                start_without_pid = self.session_start_without_pid(message.content)
-                if start_without_pid in expected_starts_without_pid:
-                    return True
-        except discord.DiscordException:
-            logger.warning("Unable to inspect Every Code thread %s", thread.id)
-        return False
-
-    @staticmethod
-    async def score_session_thread(thread: discord.Thread) -> tuple[int, int, int]:
-        assistant_messages = 0
-        messages = 0
-        try:
-            async for message in thread.history(limit=50):
-                messages += 1
-                if message.content.startswith("**Assistant**"):
-                    assistant_messages += 1
-        except discord.DiscordException:
-            logger.warning("Unable to score Every Code thread %s", thread.id)
-        return assistant_messages, messages, thread.id
+        fingerprint = await self.thread_fingerprint(thread)
+        return fingerprint is not None and fingerprint.matches_without_pid(expected_starts_without_pid)
 
     async def backfill_latest_assistant_message(
         self,
@@ -854,17 +1502,20 @@ class EveryCodeBridge:
         if assistant_message is None:
             return
         for message in self.format_assistant_messages(assistant_message):
-            await send_every_code_message(
+            await self.send_message(
                 thread,
                 message[:DISCORD_MESSAGE_LIMIT],
             )
 
-    @staticmethod
-    async def thread_has_assistant_message(thread: discord.Thread) -> bool:
+    async def thread_has_assistant_message(self, thread: discord.Thread) -> bool:
+        fingerprint = await self.thread_fingerprint(thread)
+        if fingerprint is not None and (fingerprint.has_assistant_message or fingerprint.sample_is_complete):
+            return fingerprint.has_assistant_message
         try:
-            async for message in thread.history(limit=50):
-                if message.content.startswith("**Assistant**"):
-                    return True
+            with self.metrics.discord_request("thread_history"):
+                async for message in thread.history(limit=THREAD_HISTORY_SAMPLE_LIMIT):
+                    if message.content.startswith(ASSISTANT_MESSAGE_PREFIX):
+                        return True
         except discord.DiscordException:
             logger.warning("Unable to inspect Every Code assistant history %s", thread.id)
         return False
@@ -880,67 +1531,17 @@ class EveryCodeBridge:
 
     @staticmethod
     def resume_session_id_for_pid(pid: int) -> str | None:
-        if pid <= 0:
-            return None
-        try:
-            result = subprocess.run(
-                ["ps", "-p", str(pid), "-o", "command="],
-                capture_output=True,
-                text=True,
-                timeout=2,
-            )
-        except (OSError, subprocess.SubprocessError):
-            return None
-        if result.returncode != 0:
-            return None
-        match = RESUME_SESSION_RE.search(result.stdout)
-        return match.group(1) if match else None
+        return resume_session_id_for_pid(pid)
 
     @staticmethod
     def rollout_path_for_session(session_id: str) -> Path | None:
         code_home = Path.home() / ".code"
-        catalog_path = code_home / "sessions" / "index" / "catalog.jsonl"
-        try:
-            lines = catalog_path.read_text(errors="replace").splitlines()
-        except OSError:
-            return None
-        for line in reversed(lines):
-            try:
-                entry = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            if entry.get("session_id") != session_id:
-                continue
-            rollout_path = entry.get("rollout_path")
-            if not isinstance(rollout_path, str) or not rollout_path:
-                return None
-            return code_home / rollout_path
-        return None
+        rollout_path = catalog_rollout_path(code_home / "sessions" / "index" / "catalog.jsonl", session_id)
+        return code_home / rollout_path if rollout_path is not None else None
 
     @staticmethod
     def latest_assistant_message_from_rollout(rollout_path: Path) -> str | None:
-        try:
-            lines = rollout_path.read_text(errors="replace").splitlines()
-        except OSError:
-            return None
-        latest: str | None = None
-        for line in lines:
-            try:
-                entry = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            payload = entry.get("payload")
-            if not isinstance(payload, dict):
-                continue
-            message = payload.get("msg")
-            if not isinstance(message, dict):
-                continue
-            if message.get("type") != "agent_message":
-                continue
-            text = message.get("message")
-            if isinstance(text, str) and text.strip():
-                latest = text.strip()
-        return latest
+        return latest_agent_message(rollout_path)
 
     async def send_thread_reply(self, message: discord.Message) -> bool:
         if not isinstance(message.channel, discord.Thread):
@@ -971,7 +1572,7 @@ class EveryCodeBridge:
         )
         await self.set_message_reaction(message.channel.id, message.id, REACTION_QUEUED)
         await self.show_active_session_controls(session, message.channel, REACTION_QUEUED)
-        await session.websocket.send_json(command.to_message())
+        await self.send_session_message(session, command.to_message())
         return True
 
     async def send_continue_autonomously(
@@ -1003,7 +1604,7 @@ class EveryCodeBridge:
             kind="continue_autonomously",
             reject_notice="Agent session could not go ahead",
         )
-        await session.websocket.send_json(command.to_message())
+        await self.send_session_message(session, command.to_message())
         return CONTINUE_AUTONOMOUSLY_DELIVERED
 
     async def send_pause_current_turn(
@@ -1035,7 +1636,7 @@ class EveryCodeBridge:
             kind="pause_current_turn",
             reject_notice="Agent session could not pause the current turn",
         )
-        await session.websocket.send_json(command.to_message())
+        await self.send_session_message(session, command.to_message())
         return PAUSE_CURRENT_TURN_DELIVERED
 
     async def send_new_session(
@@ -1067,7 +1668,7 @@ class EveryCodeBridge:
             kind="new_session",
             reject_notice="Agent session could not start a new session",
         )
-        await session.websocket.send_json(command.to_message())
+        await self.send_session_message(session, command.to_message())
         return "Asked the agent session to start a new session in this folder."
 
     async def send_end_session(
@@ -1099,7 +1700,7 @@ class EveryCodeBridge:
             kind="end_session",
             reject_notice="Agent session could not end the session",
         )
-        await session.websocket.send_json(command.to_message())
+        await self.send_session_message(session, command.to_message())
         return "Asked the agent session to end this session."
 
     async def handle_go_ahead_interaction(
@@ -1164,14 +1765,15 @@ class EveryCodeBridge:
         title = session_thread_name(session.hello)
         state = "offline" if session.websocket.closed else "online"
         status = session.last_status_message or "No status update received yet."
-        return "\n".join(
-            [
-                f"Agent session `{title}`",
-                f"state: {state}",
-                f"host: {session.hello.host_label}",
-                f"status: {status}",
-            ]
-        )
+        lines = [
+            f"Agent session `{title}`",
+            f"state: {state}",
+            f"host: {session.hello.host_label}",
+            f"status: {status}",
+        ]
+        if session.inbound_queue_depth:
+            lines.append(f"inbound queue: {session.inbound_queue_depth} pending")
+        return "\n".join(lines)
 
     async def handle_command_ack(self, payload: dict[str, object]) -> None:
         command_context = self.command_context(payload)
@@ -1246,13 +1848,15 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
 
-        message = await send_every_code_message(
+        message = await self.send_message(
             channel,
             self.format_approval_request(approval),
+            priority=OutboundPriority.PROMPT,
         )
         await self.add_message_reactions(
             message,
             [REACTION_APPROVAL_APPROVE, REACTION_APPROVAL_DENY],
+            priority=OutboundPriority.PROMPT,
         )
         session.pending_approvals[approval.approval_id] = PendingRemoteApproval(
             thread_id=session.thread_id,
@@ -1280,15 +1884,17 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
 
-        message = await send_every_code_message(
+        message = await self.send_message(
             channel,
             self.format_request_user_input(request, {}),
+            priority=OutboundPriority.PROMPT,
             view=self.request_user_input_view(session.session_id, request),
         )
         session.pending_user_inputs[request.turn_id] = PendingRemoteUserInput(
             thread_id=session.thread_id,
             message_id=message.id,
             turn_id=request.turn_id,
+            call_id=request.call_id,
         )
 
     async def handle_request_user_input_interaction(
@@ -1330,7 +1936,8 @@ class EveryCodeBridge:
             message_id=pending.message_id,
             kind="request_user_input_response",
         )
-        await session.websocket.send_json(
+        await self.send_session_message(
+            session,
             RemoteCommand(
                 command_id=command_id,
                 session_id=session.session_id,
@@ -1340,7 +1947,7 @@ class EveryCodeBridge:
                 turn_id=turn_id,
                 response=response,
                 issued_by=str(interaction.user.id),
-            ).to_message()
+            ).to_message(),
         )
         await interaction.response.edit_message(
             content=self.format_request_user_input_pending(interaction.user, cancelled=cancelled),
@@ -1380,13 +1987,14 @@ class EveryCodeBridge:
 
         pending.decision = decision
         pending.decided_by = interaction.user.id
-        await session.websocket.send_json(
+        await self.send_session_message(
+            session,
             RemoteApprovalDecision(
                 approval_id=approval_id,
                 session_id=session.session_id,
                 session_epoch=session.session_epoch,
                 decision=decision,
-            ).to_message()
+            ).to_message(),
         )
         await interaction.response.edit_message(
             content=self.format_approval_pending(decision, interaction.user),
@@ -1411,16 +2019,17 @@ class EveryCodeBridge:
         if session.control_message_id == message_id:
             return await self.handle_session_control_reaction(session, thread, message_id, emoji, user)
 
-        for approval_id, pending in session.pending_approvals.items():
-            if pending.message_id == message_id:
-                return await self.handle_approval_reaction(
-                    session,
-                    thread,
-                    approval_id,
-                    emoji,
-                    user,
-                )
-        return False
+        pending_approval = self.sessions.pending_approval_for_message(thread.id, message_id)
+        if pending_approval is None:
+            return False
+        session, approval_id = pending_approval
+        return await self.handle_approval_reaction(
+            session,
+            thread,
+            approval_id,
+            emoji,
+            user,
+        )
 
     async def handle_session_control_reaction(
         self,
@@ -1560,13 +2169,14 @@ class EveryCodeBridge:
 
         pending.decision = decision
         pending.decided_by = user.id
-        await session.websocket.send_json(
+        await self.send_session_message(
+            session,
             RemoteApprovalDecision(
                 approval_id=approval_id,
                 session_id=session.session_id,
                 session_epoch=session.session_epoch,
                 decision=decision,
-            ).to_message()
+            ).to_message(),
         )
         await self.edit_approval_message(
             pending,
@@ -1605,12 +2215,12 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
         try:
-            message = await channel.fetch_message(pending.message_id)
-            await edit_every_code_message(
+            message = await self.fetch_message(channel, pending.message_id)
+            await self.edit_message(
                 message,
                 content=content[:DISCORD_MESSAGE_LIMIT],
             )
-            await self.clear_message_reactions(message)
+            await self.outbound.run(message.channel.id, OutboundPriority.COSMETIC, partial(self.clear_message_reactions, message))
         except discord.DiscordException:
             logger.warning("Unable to edit Every Code approval message %s", pending.message_id)
 
@@ -1680,10 +2290,16 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
 
-        await send_every_code_message(
+        notice = self.format_user_message_notice(user_message.message)[:DISCORD_MESSAGE_LIMIT]
+        if await self.fold_into_control_anchor(
+            session,
             channel,
-            self.format_user_message_notice(user_message.message)[:DISCORD_MESSAGE_LIMIT],
-        )
+            notice,
+            reaction=REACTION_IN_PROGRESS,
+            interruptions_enabled=True,
+        ):
+            return
+        await self.send_message(channel, notice)
         await self.spawn_session_controls(
             session,
             reaction=REACTION_IN_PROGRESS,
@@ -1740,7 +2356,48 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
         session.control_status_reaction = reaction
-        await self.show_or_refresh_session_controls(session, channel)
+        await self.request_session_controls_refresh(session, channel)
+
+    async def request_session_controls_refresh(
+        self,
+        session: EveryCodeSession,
+        thread: discord.Thread,
+    ) -> None:
+        window = self.bot.config.every_code.control_refresh_debounce_seconds
+        now = time.monotonic()
+        if window <= 0 or (session.control_refresh_task is None and now - session.control_refreshed_at >= window):
+            session.control_refresh_due = False
+            session.control_refreshed_at = now
+            await self.show_or_refresh_session_controls(session, thread)
+            return
+        session.control_refresh_due = True
+        if session.control_refresh_task is None:
+            delay = max(0.0, session.control_refreshed_at + window - now)
+            session.control_refresh_task = asyncio.create_task(self.flush_session_controls_later(session, delay))
+
+    async def flush_session_controls_later(self, session: EveryCodeSession, delay: float) -> None:
+        await asyncio.sleep(delay)
+        session.control_refresh_task = None
+        if session.inbound_queue is not None and not session.inbound_open:
+            return
+        await self.enqueue_session_inbound(session, "controls_refresh", partial(self.flush_session_controls, session))
+
+    async def flush_session_controls(self, session: EveryCodeSession) -> None:
+        if not session.control_refresh_due or session.thread_id is None:
+            return
+        session.control_refresh_due = False
+        thread = self.bot.get_channel(session.thread_id)
+        if not isinstance(thread, discord.Thread):
+            return
+        session.control_refreshed_at = time.monotonic()
+        await self.show_or_refresh_session_controls(session, thread)
+
+    @staticmethod
+    def cancel_session_controls_refresh(session: EveryCodeSession) -> None:
+        session.control_refresh_due = False
+        if session.control_refresh_task is not None:
+            session.control_refresh_task.cancel()
+            session.control_refresh_task = None
 
     async def show_active_session_controls(
         self,
@@ -1761,33 +2418,56 @@ class EveryCodeBridge:
             await self.refresh_session_controls(session, thread)
             if session.control_message_id is not None:
                 return
-        message = await send_every_code_message(
+        message = await self.send_message(
             thread,
             self.format_waiting_for_direction(session),
         )
         await self.add_message_reactions(message, self.session_control_reactions(session))
         session.control_message_id = message.id
+        session.control_anchor_folded = False
 
     async def set_message_reaction(self, thread_id: int, message_id: int, reaction: str) -> None:
         channel = self.bot.get_channel(thread_id)
         if not isinstance(channel, discord.Thread):
             return
+        applied = self.applied_reactions.get(message_id)
+        if applied is not None and reaction in applied and not set(applied) & (TRANSIENT_REACTIONS - {reaction}):
+            return
         try:
-            message = await channel.fetch_message(message_id)
+            message = await self.fetch_message(channel, message_id)
         except discord.DiscordException:
             logger.warning("Unable to fetch Every Code reply message %s", message_id)
             return
 
-        bot_user = self.bot.user
         try:
-            await message.add_reaction(reaction)
-            if bot_user is not None:
-                for existing in TRANSIENT_REACTIONS - {reaction}:
-                    with suppress(discord.DiscordException):
-                        await message.remove_reaction(existing, bot_user)
+            await self.outbound.run_latest(
+                thread_id,
+                OutboundPriority.COSMETIC,
+                ("reactions", message_id),
+                partial(self.apply_transient_reaction, message, reaction),
+            )
         except discord.DiscordException:
+            self.applied_reactions.forget(message_id)
             logger.warning("Unable to update Every Code reply reaction %s", message_id)
 
+    async def apply_transient_reaction(self, message: discord.Message, reaction: str) -> None:
+        applied = self.applied_reactions.get(message.id)
+        bot_user = self.bot.user
+        if applied is None or reaction not in applied:
+            with self.metrics.discord_request("add_reaction"):
+                await message.add_reaction(reaction)
+        if bot_user is None:
+            self.applied_reactions.forget(message.id)
+            return
+        stale = TRANSIENT_REACTIONS - {reaction} if applied is None else set(applied) & TRANSIENT_REACTIONS - {reaction}
+        for existing in stale:
+            with suppress(discord.DiscordException), self.metrics.discord_request("remove_reaction"):
+                await message.remove_reaction(existing, bot_user)
+        kept = [] if applied is None else [existing for existing in applied if existing not in stale]
+        if reaction not in kept:
+            kept.append(reaction)
+        self.applied_reactions.set(message.id, kept)
+
     async def clear_message_transient_reactions(self, thread_id: int, message_id: int) -> None:
         channel = self.bot.get_channel(thread_id)
         if not isinstance(channel, discord.Thread):
@@ -1795,15 +2475,29 @@ class EveryCodeBridge:
         bot_user = self.bot.user
         if bot_user is None:
             return
+        applied = self.applied_reactions.get(message_id)
+        if applied is not None and not set(applied) & TRANSIENT_REACTIONS:
+            return
         try:
-            message = await channel.fetch_message(message_id)
+            message = await self.fetch_message(channel, message_id)
         except discord.DiscordException:
             logger.warning("Unable to fetch Every Code reply message %s", message_id)
             return
 
-        for existing in TRANSIENT_REACTIONS:
-            with suppress(discord.DiscordException):
+        await self.outbound.run_latest(
+            thread_id,
+            OutboundPriority.COSMETIC,
+            ("reactions", message_id),
+            partial(self.remove_transient_reactions, message, bot_user),
+        )
+
+    async def remove_transient_reactions(self, message: discord.Message, bot_user: discord.ClientUser) -> None:
+        applied = self.applied_reactions.get(message.id)
+        stale = TRANSIENT_REACTIONS if applied is None else set(applied) & TRANSIENT_REACTIONS
+        for existing in stale:
+            with suppress(discord.DiscordException), self.metrics.discord_request("remove_reaction"):
                 await message.remove_reaction(existing, bot_user)
+        self.applied_reactions.set(message.id, [] if applied is None else [r for r in applied if r not in stale])
 
     async def post_assistant_message(self, thread_id: int, text: str) -> None:
         for message in self.format_assistant_messages(text):
@@ -1819,6 +2513,7 @@ class EveryCodeBridge:
         channel = self.bot.get_channel(session.thread_id)
         if not isinstance(channel, discord.Thread):
             return
+        self.cancel_session_controls_refresh(session)
         session.pending_control_confirmation = None
         session.control_status_reaction = None
         session.control_interruptions_enabled = False
@@ -1832,7 +2527,7 @@ class EveryCodeBridge:
                 return
             session.control_message_id = None
 
-        message = await send_every_code_message(
+        message = await self.send_message(
             channel,
             self.format_waiting_for_direction(session),
         )
@@ -1841,6 +2536,7 @@ class EveryCodeBridge:
             self.session_control_reactions(session),
         )
         session.control_message_id = message.id
+        session.control_anchor_folded = False
 
     async def clear_pending_user_inputs(
         self,
@@ -1853,20 +2549,23 @@ class EveryCodeBridge:
         pending_items = list(session.pending_user_inputs.values())
         session.pending_user_inputs.clear()
         for pending in pending_items:
-            channel = self.bot.get_channel(pending.thread_id)
-            if not isinstance(channel, discord.Thread):
-                continue
-            try:
-                message = await channel.fetch_message(pending.message_id)
-                await edit_every_code_message(
-                    message,
-                    content=content[:DISCORD_MESSAGE_LIMIT],
-                )
-            except discord.DiscordException:
-                logger.warning(
-                    "Unable to clear Every Code request_user_input message %s",
-                    pending.message_id,
-                )
+            await self.edit_user_input_message(pending, content)
+
+    async def edit_user_input_message(self, pending: PendingRemoteUserInput, content: str) -> None:
+        channel = self.bot.get_channel(pending.thread_id)
+        if not isinstance(channel, discord.Thread):
+            return
+        try:
+            message = await self.fetch_message(channel, pending.message_id)
+            await self.edit_message(
+                message,
+                content=content[:DISCORD_MESSAGE_LIMIT],
+            )
+        except discord.DiscordException:
+            logger.warning(
+                "Unable to clear Every Code request_user_input message %s",
+                pending.message_id,
+            )
 
     async def clear_session_controls(self, session: EveryCodeSession) -> None:
         if session.thread_id is None or session.control_message_id is None:
@@ -1874,9 +2573,13 @@ class EveryCodeBridge:
         channel = self.bot.get_channel(session.thread_id)
         if not isinstance(channel, discord.Thread):
             return
+        self.cancel_session_controls_refresh(session)
         try:
-            message = await channel.fetch_message(session.control_message_id)
-            await message.delete()
+            message = await self.fetch_message(channel, session.control_message_id)
+            if session.control_anchor_folded:
+                await self.outbound.run(channel.id, OutboundPriority.COSMETIC, partial(self.clear_message_reactions, message))
+            else:
+                await self.delete_message(message)
         except discord.NotFound:
             session.control_message_id = None
         except discord.DiscordException:
@@ -1895,9 +2598,9 @@ class EveryCodeBridge:
         if not isinstance(channel, discord.Thread):
             return
         try:
-            message = await channel.fetch_message(message_id)
-            await self.clear_message_reactions(message)
-            await message.delete()
+            message = await self.fetch_message(channel, message_id)
+            await self.outbound.run(channel.id, OutboundPriority.COSMETIC, partial(self.clear_message_reactions, message))
+            await self.delete_message(message)
         except discord.NotFound:
             return
         except discord.DiscordException:
@@ -1917,6 +2620,7 @@ class EveryCodeBridge:
             return False
 
         old_control_message_id = session.control_message_id
+        old_control_anchor_folded = session.control_anchor_folded
         old_pending_control_confirmation = session.pending_control_confirmation
         old_control_status_reaction = session.control_status_reaction
         old_control_interruptions_enabled = session.control_interruptions_enabled
@@ -1925,8 +2629,17 @@ class EveryCodeBridge:
         session.control_status_reaction = reaction
         session.control_interruptions_enabled = interruptions_enabled
 
+        if old_control_message_id is not None and self.control_anchor_is_latest(session):
+            self.cancel_session_controls_refresh(session)
+            if await self.replace_message_reactions(
+                channel,
+                old_control_message_id,
+                self.session_control_reactions(session),
+            ):
+                return True
+
         try:
-            message = await send_every_code_message(
+            message = await self.send_message(
                 channel,
                 self.format_waiting_for_direction(session),
             )
@@ -1937,31 +2650,161 @@ class EveryCodeBridge:
             session.control_interruptions_enabled = old_control_interruptions_enabled
             return False
 
+        self.cancel_session_controls_refresh(session)
         session.control_message_id = message.id
+        session.control_anchor_folded = False
         if old_control_message_id is not None and old_control_message_id != message.id:
             self.rebind_session_control_commands(session, old_control_message_id, message.id)
-            await self.delete_session_message(session.thread_id, old_control_message_id)
+            if old_control_anchor_folded:
+                await self.clear_session_message_reactions(session.thread_id, old_control_message_id)
+            else:
+                await self.delete_session_message(session.thread_id, old_control_message_id)
         return True
 
+    async def fold_into_control_anchor(
+        self,
+        session: EveryCodeSession,
+        thread: discord.Thread,
+        content: str,
+        *,
+        reaction: str | None,
+        interruptions_enabled: bool,
+    ) -> bool:
+        if session.control_anchor_folded or session.control_message_id is None:
+            return False
+        if not self.control_anchor_is_latest(session):
+            return False
+        try:
+            message = await self.fetch_message(thread, session.control_message_id)
+            await self.edit_message(message, content=content)
+        except discord.DiscordException:
+            logger.warning("Unable to edit Every Code control message %s", session.control_message_id)
+            return False
+        self.cancel_session_controls_refresh(session)
+        session.control_anchor_folded = True
+        session.pending_control_confirmation = None
+        session.control_status_reaction = reaction
+        session.control_interruptions_enabled = interruptions_enabled
+        await self.replace_message_reactions(thread, message.id, self.session_control_reactions(session))
+        return True
+
+    async def clear_session_message_reactions(self, thread_id: int, message_id: int) -> None:
+        channel = self.bot.get_channel(thread_id)
+        if not isinstance(channel, discord.Thread):
+            return
+        try:
+            message = await self.fetch_message(channel, message_id)
+            await self.outbound.run(channel.id, OutboundPriority.COSMETIC, partial(self.clear_message_reactions, message))
+        except discord.DiscordException:
+            logger.warning("Unable to clear Every Code control reactions on %s", message_id)
+
     @staticmethod
     def rebind_session_control_commands(
         session: EveryCodeSession,
         old_message_id: int,
         new_message_id: int,
     ) -> None:
-        for command in session.pending_commands.values():
-            if command.message_id == old_message_id:
-                command.message_id = new_message_id
+        session.pending_commands.rebind_message(old_message_id, new_message_id)
+
+    async def send_message(
+        self,
+        destination: discord.Thread | discord.TextChannel,
+        content: str,
+        *,
+        priority: OutboundPriority = OutboundPriority.TEXT,
+        view: discord.ui.View | None = None,
+    ) -> discord.Message:
+        message = await self.outbound.run(
+            destination.id,
+            priority,
+            partial(
+                self.metrics.timed_discord_request,
+                "send_message",
+                partial(send_every_code_message, destination, content, view=view),
+            ),
+        )
+        self.message_cache.remember(message)
+        self.observe_thread_message(destination.id, message.id)
+        return message
+
+    def observe_thread_message(self, channel_id: int, message_id: int) -> None:
+        self.thread_fingerprints.forget(channel_id)
+        if self._startup_snapshot is not None:
+            self._startup_snapshot.forget_thread(channel_id)
+        if channel_id in self.sessions.by_thread and message_id > self.latest_thread_messages.get(channel_id, 0):
+            self.latest_thread_messages[channel_id] = message_id
+
+    def control_anchor_is_latest(self, session: EveryCodeSession) -> bool:
+        if self.bot.config.every_code.control_anchor_mode != CONTROL_ANCHOR_EDIT:
+            return False
+        if session.thread_id is None or session.control_message_id is None:
+            return False
+        return self.latest_thread_messages.get(session.thread_id) == session.control_message_id
+
+    async def edit_message(self, message: discord.Message, *, content: str) -> discord.Message:
+        edited = await self.outbound.run(
+            message.channel.id,
+            OutboundPriority.TEXT,
+            partial(self.metrics.timed_discord_request, "edit_message", partial(edit_every_code_message, message, content=content)),
+        )
+        self.message_cache.remember(edited)
+        return edited
+
+    async def fetch_message(self, channel: discord.Thread | discord.TextChannel, message_id: int) -> discord.Message:
+        cached = self.message_cache.get(channel.id, message_id)
+        if cached is not None:
+            return cached
+        with self.metrics.discord_request("fetch_message"):
+            message = await channel.fetch_message(message_id)
+        bot_user = self.bot.user
+        if bot_user is not None and message.author.id == bot_user.id:
+            self.message_cache.remember(message)
+        return message
+
+    async def delete_message(self, message: discord.Message) -> None:
+        try:
+            await self.outbound.run(
+                message.channel.id,
+                OutboundPriority.COSMETIC,
+                partial(self.metrics.timed_discord_request, "delete_message", message.delete),
+            )
+        except discord.NotFound:
+            self.forget_message(message.channel.id, message.id)
+            raise
+        self.forget_message(message.channel.id, message.id)
+
+    def forget_message(self, channel_id: int, message_id: int) -> None:
+        self.message_cache.forget(channel_id, message_id)
+        self.applied_reactions.forget(message_id)
+        self.thread_fingerprints.forget(channel_id)
+        if self._startup_snapshot is not None:
+            self._startup_snapshot.forget_message(channel_id, message_id)
+        if self.latest_thread_messages.get(channel_id) == message_id:
+            del self.latest_thread_messages[channel_id]
+
+    async def edit_thread(self, thread: discord.Thread, *, archived: bool, locked: bool, reason: str) -> None:
+        await self.outbound.run(
+            thread.id,
+            OutboundPriority.TEXT,
+            partial(
+                self.metrics.timed_discord_request,
+                "edit_thread",
+                partial(thread.edit, archived=archived, locked=locked, reason=reason),
+            ),
+        )
 
     async def post_thread_notice(self, thread_id: int, text: str) -> None:
         channel = self.bot.get_channel(thread_id)
         if isinstance(channel, discord.Thread):
-            await send_every_code_message(
+            await self.send_message(
                 channel,
                 text[:DISCORD_MESSAGE_LIMIT],
             )
 
     async def close_session_thread(self, session: EveryCodeSession) -> None:
+        self.cancel_session_controls_refresh(session)
+        if session.thread_id is not None:
+            self.latest_thread_messages.pop(session.thread_id, None)
         if session.notification_message_id is not None:
             await self.delete_session_notification(session.notification_message_id)
 
@@ -1980,7 +2823,8 @@ class EveryCodeBridge:
     async def close_thread(self, thread: discord.Thread) -> None:
         if thread.archived:
             try:
-                await thread.edit(
+                await self.edit_thread(
+                    thread,
                     archived=False,
                     locked=False,
                     reason="Preparing to close Every Code session thread",
@@ -1989,7 +2833,7 @@ class EveryCodeBridge:
                 logger.warning("Unable to unarchive Every Code thread %s", thread.id)
 
         try:
-            await send_every_code_message(
+            await self.send_message(
                 thread,
                 "Every Code session disconnected",
             )
@@ -1998,7 +2842,8 @@ class EveryCodeBridge:
         await self.remove_thread_members(thread)
 
         try:
-            await thread.edit(
+            await self.edit_thread(
+                thread,
                 archived=True,
                 locked=True,
                 reason="Every Code session disconnected",
@@ -2007,17 +2852,23 @@ class EveryCodeBridge:
             logger.warning("Unable to archive Every Code thread %s", thread.id)
 
         try:
-            await thread.leave()
+            with self.metrics.discord_request("leave_thread"):
+                await thread.leave()
         except discord.DiscordException:
             logger.warning("Unable to leave Every Code thread %s", thread.id)
 
-    async def delete_session_notification(self, message_id: int) -> None:
+    async def delete_session_notification(self, message_id: int) -> bool:
+        self.notification_index().forget_message(message_id)
         try:
             channel = await get_every_code_channel(self.bot)
-            message = await channel.fetch_message(message_id)
-            await message.delete()
+            message = await self.fetch_message(channel, message_id)
+            await self.delete_message(message)
+        except discord.NotFound:
+            return False
         except (discord.DiscordException, ValueError):
             logger.warning("Unable to delete Every Code notification message %s", message_id)
+            return False
+        return True
 
     async def delete_session_notification_for_thread(self, thread_id: int) -> None:
         try:
@@ -2026,21 +2877,16 @@ class EveryCodeBridge:
             logger.warning("Unable to delete Every Code notification for thread %s: channel is unavailable", thread_id)
             return
 
-        bot_user = self.bot.user
-        if bot_user is None:
+        await self.warm_notification_index()
+        message_id = self.notification_index().get(thread_id)
+        if message_id is None:
             return
-
-        mention = f"<#{thread_id}>"
+        self.notification_index().forget_message(message_id)
         try:
-            async for message in channel.history(limit=None):
-                if message.author.id != bot_user.id:
-                    continue
-                if not message.content.startswith(SESSION_NOTIFICATION_PREFIXES):
-                    continue
-                if mention not in message.content:
-                    continue
-                await message.delete()
-                return
+            message = await self.fetch_message(channel, message_id)
+            await self.delete_message(message)
+        except discord.NotFound:
+            return
         except discord.DiscordException:
             logger.warning("Unable to delete Every Code notification for thread %s", thread_id)
 
@@ -2049,7 +2895,8 @@ class EveryCodeBridge:
         if isinstance(channel, discord.Thread):
             return channel
         try:
-            fetched = await self.bot.fetch_channel(thread_id)
+            with self.metrics.discord_request("fetch_channel"):
+                fetched = await self.bot.fetch_channel(thread_id)
         except discord.DiscordException:
             return None
         return fetched if isinstance(fetched, discord.Thread) else None
@@ -2058,7 +2905,8 @@ class EveryCodeBridge:
         bot_user = self.bot.user
         bot_user_id = bot_user.id if bot_user is not None else None
         try:
-            members = await thread.fetch_members()
+            with self.metrics.discord_request("fetch_thread_members"):
+                members = await thread.fetch_members()
         except discord.DiscordException:
             members = thread.members
 
@@ -2066,7 +2914,8 @@ class EveryCodeBridge:
             if member.id == bot_user_id:
                 continue
             try:
-                await thread.remove_user(discord.Object(id=member.id))
+                with self.metrics.discord_request("remove_thread_member"):
+                    await thread.remove_user(discord.Object(id=member.id))
             except discord.DiscordException:
                 logger.warning(
                     "Unable to remove user %s from Every Code thread %s",
@@ -2215,12 +3064,13 @@ class EveryCodeBridge:
         if replaced:
             return
         session.control_message_id = None
-        message = await send_every_code_message(
+        message = await self.send_message(
             thread,
             self.format_waiting_for_direction(session),
         )
         await self.add_message_reactions(message, self.session_control_reactions(session))
         session.control_message_id = message.id
+        session.control_anchor_folded = False
 
     def _authorized(self, request: web.Request) -> bool:
         token = self.bot.config.every_code.token
@@ -2229,32 +3079,76 @@ class EveryCodeBridge:
         expected = f"Bearer {token}"
         return request.headers.get("Authorization") == expected
 
-    @staticmethod
     async def add_message_reactions(
+        self,
+        message: discord.Message,
+        reactions: list[str],
+        *,
+        priority: OutboundPriority = OutboundPriority.COSMETIC,
+    ) -> None:
+        self.applied_reactions.set(message.id, [])
+        await self.outbound.run(message.channel.id, priority, partial(self.apply_message_reactions, message, reactions))
+
+    async def apply_message_reactions(
+        self,
         message: discord.Message,
         reactions: list[str],
     ) -> None:
+        applied = self.applied_reactions.get(message.id)
         for reaction in reactions:
             try:
-                await message.add_reaction(reaction)
+                with self.metrics.discord_request("add_reaction"):
+                    await message.add_reaction(reaction)
             except discord.DiscordException:
                 logger.warning("Unable to add Every Code reaction %s to %s", reaction, message.id)
+                continue
+            if applied is not None and reaction not in applied:
+                applied.append(reaction)
 
-    @staticmethod
-    async def clear_message_reactions(message: discord.Message) -> None:
-        with suppress(discord.DiscordException):
-            await message.clear_reactions()
+    async def clear_message_reactions(self, message: discord.Message) -> None:
+        try:
+            with self.metrics.discord_request("clear_reactions"):
+                await message.clear_reactions()
+        except discord.DiscordException:
+            self.applied_reactions.forget(message.id)
+            return
+        self.applied_reactions.set(message.id, [])
+
+    async def apply_reaction_state(self, message: discord.Message, reactions: list[str]) -> None:
+        applied = self.applied_reactions.get(message.id)
+        bot_user = self.bot.user
+        plan = None if applied is None or bot_user is None else reaction_diff(applied, reactions)
+        if plan is None or bot_user is None:
+            await self.clear_message_reactions(message)
+            await self.apply_message_reactions(message, reactions)
+            return
+        removals, additions = plan
+        for reaction in removals:
+            try:
+                with self.metrics.discord_request("remove_reaction"):
+                    await message.remove_reaction(reaction, bot_user)
+            except discord.DiscordException:
+                self.applied_reactions.forget(message.id)
+                await self.clear_message_reactions(message)
+                await self.apply_message_reactions(message, reactions)
+                return
+        self.applied_reactions.set(message.id, [reaction for reaction in reactions if reaction not in additions])
+        await self.apply_message_reactions(message, additions)
 
-    @staticmethod
     async def remove_message_reaction(
+        self,
         thread: discord.Thread,
         message_id: int,
         reaction: str,
         user: discord.User | discord.Member,
     ) -> None:
         try:
-            message = await thread.fetch_message(message_id)
-            await message.remove_reaction(reaction, user)
+            message = await self.fetch_message(thread, message_id)
+            await self.outbound.run(
+                thread.id,
+                OutboundPriority.COSMETIC,
+                partial(self.metrics.timed_discord_request, "remove_reaction", partial(message.remove_reaction, reaction, user)),
+            )
         except discord.DiscordException:
             logger.warning("Unable to remove Every Code reaction %s from %s", reaction, message_id)
 
@@ -2267,17 +3161,33 @@ class EveryCodeBridge:
         remove_user_reaction: tuple[str, discord.User | discord.Member] | None = None,
     ) -> bool:
         try:
-            message = await thread.fetch_message(message_id)
-            if remove_user_reaction is not None:
-                reaction, user = remove_user_reaction
-                with suppress(discord.DiscordException):
-                    await message.remove_reaction(reaction, user)
-            await self.clear_message_reactions(message)
-            await self.add_message_reactions(message, reactions)
-            return True
+            replaced = await self.outbound.run_latest(
+                thread.id,
+                OutboundPriority.COSMETIC,
+                ("reactions", message_id),
+                partial(self.apply_replaced_reactions, thread, message_id, reactions, remove_user_reaction),
+            )
         except discord.DiscordException:
             logger.warning("Unable to replace Every Code reactions on %s", message_id)
             return False
+        if replaced is None and remove_user_reaction is not None:
+            await self.remove_message_reaction(thread, message_id, *remove_user_reaction)
+        return True
+
+    async def apply_replaced_reactions(
+        self,
+        thread: discord.Thread,
+        message_id: int,
+        reactions: list[str],
+        remove_user_reaction: tuple[str, discord.User | discord.Member] | None,
+    ) -> bool:
+        message = await self.fetch_message(thread, message_id)
+        if remove_user_reaction is not None:
+            reaction, user = remove_user_reaction
+            with suppress(discord.DiscordException), self.metrics.discord_request("remove_reaction"):
+                await message.remove_reaction(reaction, user)
+        await self.apply_reaction_state(message, reactions)
+        return True
 
     @staticmethod
     def _split_discord_message(text: str, limit: int) -> list[str]:
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+JSON_CODEC_AUTO = "auto"
+JSON_CODEC_STDLIB = "json"
+JSON_CODEC_ORJSON = "orjson"
+BINARY_CODEC_MSGPACK = "msgpack"
+
+
+@dataclass(frozen=True, slots=True)
+class JsonCodec:
+    name: str
+    loads: Callable[[str | bytes], object]
+    dumps: Callable[[object], bytes]
+
+
+@dataclass(frozen=True, slots=True)
+class BinaryCodec:
+    name: str
+    loads: Callable[[bytes], object]
+    dumps: Callable[[object], bytes]
+
+
+def stdlib_dumps(payload: object) -> bytes:
+    return json.dumps(payload).encode()
+
+
+JSON_CODECS: dict[str, JsonCodec] = {
+    JSON_CODEC_STDLIB: JsonCodec(JSON_CODEC_STDLIB, json.loads, stdlib_dumps),
+}
+
+try:
+    import orjson  # type: ignore[import-not-found, unused-ignore]
+except ImportError:
+    pass
+else:
+    JSON_CODECS[JSON_CODEC_ORJSON] = JsonCodec(JSON_CODEC_ORJSON, orjson.loads, orjson.dumps)
+
+BINARY_CODECS: dict[str, BinaryCodec] = {}
+
+try:
+    import msgpack  # type: ignore[import-not-found, import-untyped, unused-ignore]
+except ImportError:
+    pass
+else:
+    BINARY_CODECS[BINARY_CODEC_MSGPACK] = BinaryCodec(BINARY_CODEC_MSGPACK, msgpack.unpackb, msgpack.packb)
+
+
+def select_json_codec(name: str = JSON_CODEC_AUTO) -> JsonCodec:
+    codec = JSON_CODECS.get(name)
+    if codec is not None:
+        return codec
+    selected = JSON_CODECS.get(JSON_CODEC_ORJSON) or JSON_CODECS[JSON_CODEC_STDLIB]
+    if name != JSON_CODEC_AUTO:
+        logger.warning("Every Code JSON codec %r is not available; using %s", name, selected.name)
+    return selected
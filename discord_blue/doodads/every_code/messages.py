@@ -2,12 +2,14 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections import OrderedDict
 
 import discord
 
 logger = logging.getLogger(__name__)
 MISSING_MANAGE_MESSAGES_DESTINATIONS: set[int] = set()
 MISSING_MANAGE_MESSAGES_NOTICE_LOCK = asyncio.Lock()
+BRIDGE_MESSAGE_CACHE_LIMIT = 1024
 
 
 def every_code_allowed_mentions() -> discord.AllowedMentions:
@@ -82,3 +84,29 @@ async def notify_missing_manage_messages(destination: discord.abc.Messageable) -
 
 async def edit_every_code_message(message: discord.Message, *, content: str) -> discord.Message:
     return await message.edit(content=content, allowed_mentions=every_code_allowed_mentions(), view=None)
+
+
+class BridgeMessageCache:
+    def __init__(self, limit: int = BRIDGE_MESSAGE_CACHE_LIMIT) -> None:
+        self.limit = limit
+        self.by_message: OrderedDict[tuple[int, int], discord.Message] = OrderedDict()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.by_message
+
+    def get(self, channel_id: int, message_id: int) -> discord.Message | None:
+        key = (channel_id, message_id)
+        message = self.by_message.get(key)
+        if message is not None:
+            self.by_message.move_to_end(key)
+        return message
+
+    def remember(self, message: discord.Message) -> None:
+        key = (message.channel.id, message.id)
+        self.by_message[key] = message
+        self.by_message.move_to_end(key)
+        while len(self.by_message) > self.limit:
+            self.by_message.popitem(last=False)
+
+    def forget(self, channel_id: int, message_id: int) -> None:
+        self.by_message.pop((channel_id, message_id), None)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import math
+import time
+import zlib
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass, field
+from typing import TypeVar
+from weakref import WeakKeyDictionary
+
+T = TypeVar("T")
+RequestObserver = Callable[[str, float, bool], None]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+INFINITE_BUCKET_LABEL = 'le="+Inf"'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+DEFLATE_SAMPLE_INTERVAL = 16
+DEFLATE_SYNC_FLUSH_TRAILER = b"\x00\x00\xff\xff"
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def standalone_deflated_size(payload: bytes) -> int:
+    compressor = zlib.compressobj(zlib.Z_BEST_SPEED, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return len(deflated.removesuffix(DEFLATE_SYNC_FLUSH_TRAILER))
+
+
+@contextmanager
+def observed_request(observer: RequestObserver | None, operation: str) -> Iterator[None]:
+    started_at = time.monotonic()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        if observer is not None:
+            observer(operation, time.monotonic() - started_at, failed)
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+@dataclass(slots=True)
+class Counter:
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    values: dict[tuple[str, ...], float] = field(default_factory=dict)
+    kind = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self.values.get(label_values, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}"
+
+
+@dataclass(slots=True)
+class Gauge:
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    values: dict[tuple[str, ...], float] = field(default_factory=dict)
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str) -> None:
+        self.values[label_values] = value
+
+    def value(self, *label_values: str) -> float:
+        return self.values.get(label_values, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}"
+
+
+@dataclass(slots=True)
+class HistogramSeries:
+    buckets: list[int]
+    total: float = 0.0
+    count: int = 0
+
+
+@dataclass(slots=True)
+class Histogram:
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    series: dict[tuple[str, ...], HistogramSeries] = field(default_factory=dict)
+    kind = "histogram"
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = HistogramSeries(buckets=[0] * len(self.buckets))
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series.buckets[index] += 1
+        series.total += value
+        series.count += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self.series.get(label_values)
+        return series.count if series is not None else 0
+
+    def samples(self) -> Iterator[str]:
+        for label_values, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series.buckets, strict=True):
+                cumulative += bucket_count
+                labels = format_labels(self.labels, label_values, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(self.labels, label_values, INFINITE_BUCKET_LABEL)} {series.count}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {format_value(series.total)}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {series.count}"
+
+
+Metric = Counter | Gauge | Histogram
+
+
+class BridgeMetrics:
+    def __init__(self) -> None:
+        self.inbound_messages = Counter(
+            "every_code_inbound_messages_total",
+            "Agent session WebSocket messages received, by message type.",
+            ("type",),
+        )
+        self.handler_seconds = Histogram(
+            "every_code_handler_seconds",
+            "Time spent handling agent session messages, by message type.",
+            ("type",),
+        )
+        self.handler_errors = Counter(
+            "every_code_handler_errors_total",
+            "Agent session message handlers that raised, by message type.",
+            ("type",),
+        )
+        self.discord_request_seconds = Histogram(
+            "every_code_discord_request_seconds",
+            "Latency of individual Discord REST calls and paginated scans made by the bridge, by operation.",
+            ("operation",),
+        )
+        self.discord_request_errors = Counter(
+            "every_code_discord_request_errors_total",
+            "Discord REST calls made by the bridge that failed, including ones the bridge tolerated, by operation.",
+            ("operation",),
+        )
+        self.session_attaches = Counter(
+            "every_code_session_attaches_total",
+            "Session hellos attached to a thread, by how the thread was found.",
+            ("outcome",),
+        )
+        self.attach_seconds = Histogram(
+            "every_code_session_attach_seconds",
+            "Time from taking the attach locks to binding the session thread.",
+        )
+        self.attach_lock_wait_seconds = Histogram(
+            "every_code_attach_lock_wait_seconds",
+            "Time session hellos waited for their attach locks.",
+        )
+        self.sessions = Gauge("every_code_sessions", "Live agent sessions.")
+        self.pending = Gauge(
+            "every_code_pending_items",
+            "Pending commands, approvals and user-input prompts across live sessions.",
+            ("kind",),
+        )
+        self.pending_evictions = Counter(
+            "every_code_pending_evictions_total",
+            "Pending items dropped before the agent answered, by kind and reason.",
+            ("kind", "reason"),
+        )
+        self.inbound_duplicates = Counter(
+            "every_code_inbound_duplicates_total",
+            "Agent session messages dropped because their sequence number was already seen.",
+        )
+        self.session_resumes = Counter(
+            "every_code_session_resumes_total",
+            "Dropped agent sockets that resumed, were rejected, or expired before resuming.",
+            ("outcome",),
+        )
+        self.websocket_connections = Counter(
+            "every_code_websocket_connections_total",
+            "Agent WebSocket connections, by negotiated permessage-deflate compression.",
+            ("compression",),
+        )
+        self.websocket_payload_bytes = Counter(
+            "every_code_websocket_payload_bytes_total",
+            "Uncompressed agent WebSocket payload bytes, by direction and frame encoding.",
+            ("direction", "encoding"),
+        )
+        self.websocket_deflate_estimate_bytes = Counter(
+            "every_code_websocket_deflate_estimate_bytes_total",
+            "Raw and standalone-deflated sizes of sampled outbound frames on compressed connections; "
+            "each frame is deflated without the connection's shared context, so this overstates the deflated size.",
+            ("stage",),
+        )
+        self.loop_lag_seconds = Histogram(
+            "discord_blue_event_loop_lag_seconds",
+            "How late the event loop ran the lag sampler.",
+            buckets=LOOP_LAG_BUCKETS,
+        )
+        self.loop_stalls = Counter(
+            "discord_blue_event_loop_stalls_total",
+            "Lag samples at or above the configured warning threshold.",
+        )
+        self.metrics: list[Metric] = [
+            self.inbound_messages,
+            self.handler_seconds,
+            self.handler_errors,
+            self.discord_request_seconds,
+            self.discord_request_errors,
+            self.session_attaches,
+            self.attach_seconds,
+            self.attach_lock_wait_seconds,
+            self.sessions,
+            self.pending,
+            self.pending_evictions,
+            self.inbound_duplicates,
+            self.session_resumes,
+            self.websocket_connections,
+            self.websocket_payload_bytes,
+            self.websocket_deflate_estimate_bytes,
+            self.loop_lag_seconds,
+            self.loop_stalls,
+        ]
+        self.outbound_frames: WeakKeyDictionary[object, int] = WeakKeyDictionary()
+
+    def observe_outbound_frame(self, connection: object, encoding: str, payload: bytes, compressed: bool) -> None:
+        self.websocket_payload_bytes.inc("outbound", encoding, amount=len(payload))
+        if not compressed:
+            return
+        frame_count = self.outbound_frames.get(connection, 0)
+        self.outbound_frames[connection] = frame_count + 1
+        if frame_count % DEFLATE_SAMPLE_INTERVAL:
+            return
+        self.websocket_deflate_estimate_bytes.inc("raw", amount=len(payload))
+        self.websocket_deflate_estimate_bytes.inc("deflated", amount=standalone_deflated_size(payload))
+
+    def observe_discord_request(self, operation: str, seconds: float, failed: bool) -> None:
+        self.discord_request_seconds.observe(seconds, operation)
+        if failed:
+            self.discord_request_errors.inc(operation)
+
+    def discord_request(self, operation: str) -> AbstractContextManager[None]:
+        return observed_request(self.observe_discord_request, operation)
+
+    async def timed_discord_request(self, operation: str, call: Callable[[], Awaitable[T]]) -> T:
+        with self.discord_request(operation):
+            return await call()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import suppress
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, TypeVar, cast
+
+import discord
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+APPLIED_REACTIONS_LIMIT = 2048
+
+
+class OutboundPriority(IntEnum):
+    PROMPT = 0
+    TEXT = 1
+    COSMETIC = 2
+
+
+@dataclass(order=True, slots=True)
+class OutboundJob:
+    priority: int
+    sequence: int
+    operation: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future[Any] = field(compare=False)
+    supersede_key: Hashable | None = field(compare=False, default=None)
+
+
+@dataclass(slots=True)
+class OutboundRoute:
+    queue: list[OutboundJob] = field(default_factory=list)
+    busy: bool = False
+    resume_at: float = 0.0
+    worker: asyncio.Task[None] | None = None
+
+
+class OutboundScheduler:
+    def __init__(self) -> None:
+        self.routes: dict[int, OutboundRoute] = {}
+        self._sequence = itertools.count()
+
+    async def run(
+        self,
+        route_id: int,
+        priority: OutboundPriority,
+        operation: Callable[[], Awaitable[T]],
+    ) -> T:
+        return cast(T, await self._submit(route_id, priority, operation, None))
+
+    async def run_latest(
+        self,
+        route_id: int,
+        priority: OutboundPriority,
+        supersede_key: Hashable,
+        operation: Callable[[], Awaitable[T]],
+    ) -> T | None:
+        return await self._submit(route_id, priority, operation, supersede_key)
+
+    def queued(self, route_id: int) -> int:
+        route = self.routes.get(route_id)
+        if route is None:
+            return 0
+        return sum(1 for job in route.queue if not job.future.done())
+
+    async def close(self) -> None:
+        routes = list(self.routes.values())
+        self.routes.clear()
+        for route in routes:
+            for job in route.queue:
+                job.future.cancel()
+            route.queue.clear()
+            if route.worker is not None:
+                route.worker.cancel()
+        for route in routes:
+            if route.worker is not None:
+                with suppress(asyncio.CancelledError):
+                    await route.worker
+
+    async def _submit(
+        self,
+        route_id: int,
+        priority: OutboundPriority,
+        operation: Callable[[], Awaitable[T]],
+        supersede_key: Hashable | None,
+    ) -> T | None:
+        route = self.routes.setdefault(route_id, OutboundRoute())
+        if supersede_key is not None:
+            for queued in route.queue:
+                if queued.supersede_key == supersede_key and not queued.future.done():
+                    queued.future.set_result(None)
+
+        if not route.busy and not route.queue:
+            route.busy = True
+            try:
+                await self._wait_for_route(route)
+                return await self._perform(route, operation)
+            finally:
+                route.busy = False
+                self._release(route_id, route)
+
+        loop = asyncio.get_running_loop()
+        job = OutboundJob(
+            priority=int(priority),
+            sequence=next(self._sequence),
+            operation=operation,
+            future=loop.create_future(),
+            supersede_key=supersede_key,
+        )
+        heapq.heappush(route.queue, job)
+        result: T | None = await job.future
+        return result
+
+    def _release(self, route_id: int, route: OutboundRoute) -> None:
+        if route.busy or route.worker is not None:
+            return
+        if route.queue:
+            route.worker = asyncio.create_task(self._drain(route_id, route))
+        elif self.routes.get(route_id) is route and route.resume_at <= asyncio.get_running_loop().time():
+            del self.routes[route_id]
+
+    async def _drain(self, route_id: int, route: OutboundRoute) -> None:
+        route.busy = True
+        try:
+            while route.queue:
+                job = heapq.heappop(route.queue)
+                if job.future.done():
+                    continue
+                await self._wait_for_route(route)
+                if job.future.done():
+                    continue
+                try:
+                    result = await self._perform(route, job.operation)
+                except Exception as exc:
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+        finally:
+            route.busy = False
+            route.worker = None
+            self._release(route_id, route)
+
+    @staticmethod
+    async def _wait_for_route(route: OutboundRoute) -> None:
+        delay = route.resume_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _perform(route: OutboundRoute, operation: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await operation()
+        except discord.RateLimited as exc:
+            route.resume_at = asyncio.get_running_loop().time() + exc.retry_after
+            logger.warning("Every Code outbound route rate limited for %.2f seconds", exc.retry_after)
+            raise
+
+
+class AppliedReactions:
+    def __init__(self, limit: int = APPLIED_REACTIONS_LIMIT) -> None:
+        self.limit = limit
+        self.by_message: OrderedDict[int, list[str]] = OrderedDict()
+
+    def get(self, message_id: int) -> list[str] | None:
+        reactions = self.by_message.get(message_id)
+        if reactions is not None:
+            self.by_message.move_to_end(message_id)
+        return reactions
+
+    def set(self, message_id: int, reactions: list[str]) -> None:
+        self.by_message[message_id] = list(reactions)
+        self.by_message.move_to_end(message_id)
+        while len(self.by_message) > self.limit:
+            self.by_message.popitem(last=False)
+
+    def forget(self, message_id: int) -> None:
+        self.by_message.pop(message_id, None)
+
+
+def reaction_diff(applied: list[str], wanted: list[str]) -> tuple[list[str], list[str]] | None:
+    kept = 0
+    removals: list[str] = []
+    for reaction in applied:
+        if kept < len(wanted) and reaction == wanted[kept]:
+            kept += 1
+        else:
+            removals.append(reaction)
+    additions = wanted[kept:]
+    if len(removals) + len(additions) > 1 + len(wanted):
+        return None
+    return removals, additions
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+PROC_ROOT = Path("/proc")
+RESUME_SESSION_CACHE_LIMIT = 512
+RESUME_SESSION_RE = re.compile(
+    r"\bresume\s+([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\b",
+    re.IGNORECASE,
+)
+RESUME_SESSIONS: OrderedDict[tuple[int, int], str | None] = OrderedDict()
+RESUME_SESSIONS_LOCK = threading.Lock()
+
+
+def process_start_time(pid: int) -> int | None:
+    try:
+        stat = (PROC_ROOT / str(pid) / "stat").read_bytes()
+    except OSError:
+        return None
+    fields = stat.rpartition(b")")[2].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def proc_command_line(pid: int) -> str | None:
+    try:
+        command_line = (PROC_ROOT / str(pid) / "cmdline").read_bytes()
+    except OSError:
+        return None
+    return command_line.replace(b"\0", b" ").decode(errors="replace").strip()
+
+
+def ps_command_line(pid: int) -> str | None:
+    try:
+        result = subprocess.run(
+            ["ps", "-p", str(pid), "-o", "command="],
+            capture_output=True,
+            text=True,
+            timeout=2,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def resume_session_id(command_line: str | None) -> str | None:
+    if command_line is None:
+        return None
+    match = RESUME_SESSION_RE.search(command_line)
+    return match.group(1) if match else None
+
+
+def resume_session_id_for_pid(pid: int) -> str | None:
+    if pid <= 0:
+        return None
+    start_time = process_start_time(pid)
+    if start_time is None:
+        return resume_session_id(ps_command_line(pid))
+
+    key = (pid, start_time)
+    with RESUME_SESSIONS_LOCK:
+        if key in RESUME_SESSIONS:
+            RESUME_SESSIONS.move_to_end(key)
+            return RESUME_SESSIONS[key]
+    session_id = resume_session_id(proc_command_line(pid))
+    with RESUME_SESSIONS_LOCK:
+        RESUME_SESSIONS[key] = session_id
+        while len(RESUME_SESSIONS) > RESUME_SESSION_CACHE_LIMIT:
+            RESUME_SESSIONS.popitem(last=False)
+    return session_id
@@ -3,6 +3,9 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Literal
 
+PROTOCOL_VERSION_JSON = 1
+PROTOCOL_VERSION_MSGPACK = 2
+
 
 @dataclass(slots=True)
 class SessionOrigin:
@@ -37,11 +40,17 @@ class SessionHello:
     branch: str | None
     pid: int
     origin: SessionOrigin | None = None
+    protocol_version: int = PROTOCOL_VERSION_JSON
+    resumable: bool = False
 
     @classmethod
     def from_payload(cls, payload: dict[str, Any]) -> "SessionHello":
         origin_payload = payload.get("origin")
         origin = SessionOrigin.from_payload(origin_payload) if isinstance(origin_payload, dict) else None
+        try:
+            protocol_version = int(payload.get("protocol_version") or PROTOCOL_VERSION_JSON)
+        except (TypeError, ValueError):
+            protocol_version = PROTOCOL_VERSION_JSON
         return cls(
             session_id=str(payload["session_id"]),
             session_epoch=str(payload["session_epoch"]),
@@ -50,6 +59,8 @@ class SessionHello:
             branch=str(payload["branch"]) if payload.get("branch") else None,
             pid=int(payload.get("pid") or 0),
             origin=origin,
+            protocol_version=protocol_version,
+            resumable=payload.get("resumable") is True,
         )
 
 
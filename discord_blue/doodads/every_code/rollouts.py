@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+REVERSE_READ_CHUNK_SIZE = 64 * 1024
+AGENT_MESSAGE_MARKER = b"agent_message"
+
+
+def reverse_lines(path: Path, chunk_size: int = REVERSE_READ_CHUNK_SIZE) -> Iterator[bytes]:
+    with path.open("rb") as handle:
+        position = handle.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            handle.seek(position)
+            chunk = handle.read(read_size) + remainder
+            lines = chunk.split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+def decode_json_line(line: bytes) -> dict[str, Any] | None:
+    try:
+        entry = json.loads(line.decode(errors="replace"))
+    except json.JSONDecodeError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def latest_agent_message(rollout_path: Path) -> str | None:
+    try:
+        for line in reverse_lines(rollout_path):
+            if AGENT_MESSAGE_MARKER not in line:
+                continue
+            entry = decode_json_line(line)
+            if entry is None:
+                continue
+            payload = entry.get("payload")
+            if not isinstance(payload, dict):
+                continue
+            message = payload.get("msg")
+            if not isinstance(message, dict) or message.get("type") != "agent_message":
+                continue
+            text = message.get("message")
+            if isinstance(text, str) and text.strip():
+                return text.strip()
+    except OSError:
+        return None
+    return None
+
+
+class SessionCatalog:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.inode: int | None = None
+        self.offset = 0
+        self.mtime_ns = 0
+        self.rollout_paths: dict[str, str | None] = {}
+        self._lock = threading.Lock()
+
+    def rollout_path(self, session_id: str) -> str | None:
+        with self._lock:
+            self.refresh()
+            return self.rollout_paths.get(session_id)
+
+    def refresh(self) -> None:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            self.reset(None)
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reset(stat.st_ino)
+        if stat.st_size == self.offset and stat.st_mtime_ns == self.mtime_ns:
+            return
+        try:
+            with self.path.open("rb") as handle:
+                handle.seek(self.offset)
+                appended = handle.read(stat.st_size - self.offset)
+        except OSError:
+            return
+        complete, newline, partial = appended.rpartition(b"\n")
+        for line in complete.split(b"\n"):
+            self.add_entry(line)
+        self.add_entry(partial)
+        if newline:
+            self.offset += len(complete) + 1
+        self.mtime_ns = stat.st_mtime_ns
+
+    def reset(self, inode: int | None) -> None:
+        self.inode = inode
+        self.offset = 0
+        self.mtime_ns = 0
+        self.rollout_paths.clear()
+
+    def add_entry(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        entry = decode_json_line(line)
+        if entry is None:
+            return
+        session_id = entry.get("session_id")
+        if not isinstance(session_id, str):
+            return
+        rollout_path = entry.get("rollout_path")
+        self.rollout_paths[session_id] = rollout_path if isinstance(rollout_path, str) and rollout_path else None
+
+
+SESSION_CATALOGS: dict[Path, SessionCatalog] = {}
+SESSION_CATALOGS_LOCK = threading.Lock()
+
+
+def catalog_rollout_path(catalog_path: Path, session_id: str) -> str | None:
+    with SESSION_CATALOGS_LOCK:
+        catalog = SESSION_CATALOGS.get(catalog_path)
+        if catalog is None:
+            catalog = SESSION_CATALOGS[catalog_path] = SessionCatalog(catalog_path)
+    return catalog.rollout_path(session_id)
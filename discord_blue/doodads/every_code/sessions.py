@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator, MutableMapping
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from datetime import UTC, datetime
-from typing import Literal
+from typing import Literal, TypeVar
 
 from aiohttp import web
 
+from discord_blue.doodads.every_code.protocol import PROTOCOL_VERSION_JSON
 from discord_blue.doodads.every_code.protocol import SessionHello
 
 
@@ -36,6 +43,113 @@ class PendingRemoteUserInput:
     thread_id: int
     message_id: int
     turn_id: str
+    call_id: str = ""
+
+
+PendingItem = TypeVar("PendingItem", PendingRemoteCommand, PendingRemoteApproval, PendingRemoteUserInput)
+
+
+class PendingItems(MutableMapping[str, PendingItem]):
+    def __init__(self) -> None:
+        self.items_by_key: dict[str, PendingItem] = {}
+        self.keys_by_message: dict[int, dict[str, None]] = {}
+        self.added_at: dict[str, float] = {}
+
+    def __getitem__(self, key: str) -> PendingItem:
+        return self.items_by_key[key]
+
+    def __setitem__(self, key: str, item: PendingItem) -> None:
+        if key in self.items_by_key:
+            del self[key]
+        self.items_by_key[key] = item
+        self.added_at[key] = time.monotonic()
+        if item.message_id is not None:
+            self.keys_by_message.setdefault(item.message_id, {})[key] = None
+
+    def __delitem__(self, key: str) -> None:
+        item = self.items_by_key.pop(key)
+        del self.added_at[key]
+        if item.message_id is None:
+            return
+        keys = self.keys_by_message.get(item.message_id)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self.keys_by_message[item.message_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.items_by_key)
+
+    def __len__(self) -> int:
+        return len(self.items_by_key)
+
+    def __repr__(self) -> str:
+        return f"PendingItems({self.items_by_key!r})"
+
+    def keys_for_message(self, message_id: int) -> list[str]:
+        return list(self.keys_by_message.get(message_id, ()))
+
+    def rebind_message(self, old_message_id: int, new_message_id: int) -> None:
+        for key in self.keys_for_message(old_message_id):
+            item = self.items_by_key[key]
+            keys = self.keys_by_message[old_message_id]
+            del keys[key]
+            if not keys:
+                del self.keys_by_message[old_message_id]
+            item.message_id = new_message_id
+            self.keys_by_message.setdefault(new_message_id, {})[key] = None
+
+    def evictions(self, ttl_seconds: float, limit: int, *, keep: str | None = None) -> list[tuple[str, str]]:
+        added_before = time.monotonic() - ttl_seconds if ttl_seconds > 0 else float("-inf")
+        overflow = len(self.added_at) - limit if limit > 0 else 0
+        evicted: list[tuple[str, str]] = []
+        for key, added_at in self.added_at.items():
+            if key == keep:
+                continue
+            if added_at <= added_before:
+                evicted.append((key, "ttl"))
+            elif overflow > len(evicted):
+                evicted.append((key, "limit"))
+            else:
+                break
+        return evicted
+
+
+class ReplayBuffer:
+    def __init__(self) -> None:
+        self.messages: deque[tuple[int, dict[str, object]]] = deque()
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def record(self, message: dict[str, object], limit: int) -> dict[str, object]:
+        self.last_seq += 1
+        sequenced = {**message, "seq": self.last_seq}
+        self.messages.append((self.last_seq, sequenced))
+        while len(self.messages) > max(1, limit):
+            self.messages.popleft()
+        return sequenced
+
+    def acknowledge(self, seq: int) -> None:
+        while self.messages and self.messages[0][0] <= seq:
+            self.messages.popleft()
+
+    def covers(self, seq: int) -> bool:
+        if seq < 0 or seq > self.last_seq:
+            return False
+        oldest = self.messages[0][0] if self.messages else self.last_seq + 1
+        return seq >= oldest - 1
+
+    def after(self, seq: int) -> list[tuple[int, dict[str, object]]]:
+        return [(message_seq, message) for message_seq, message in self.messages if message_seq > seq]
+
+
+@dataclass(slots=True)
+class InboundWork:
+    message_type: str
+    run: Callable[[], Awaitable[None]]
+    seq: int | None = None
 
 
 @dataclass(slots=True)
@@ -45,16 +159,30 @@ class EveryCodeSession:
     thread_id: int | None = None
     notification_message_id: int | None = None
     control_message_id: int | None = None
-    last_seen: datetime = field(default_factory=lambda: datetime.now(UTC))
-    pending_commands: dict[str, PendingRemoteCommand] = field(default_factory=dict)
-    pending_approvals: dict[str, PendingRemoteApproval] = field(default_factory=dict)
-    pending_user_inputs: dict[str, PendingRemoteUserInput] = field(default_factory=dict)
+    last_seen: float = field(default_factory=time.monotonic)
+    protocol_version: int = PROTOCOL_VERSION_JSON
+    pending_commands: PendingItems[PendingRemoteCommand] = field(default_factory=PendingItems)
+    pending_approvals: PendingItems[PendingRemoteApproval] = field(default_factory=PendingItems)
+    pending_user_inputs: PendingItems[PendingRemoteUserInput] = field(default_factory=PendingItems)
     rejected_command_messages: list[RejectedCommandMessage] = field(default_factory=list)
     active_command_id: str | None = None
     last_status_message: str | None = None
     control_status_reaction: str | None = None
     control_interruptions_enabled: bool = False
     pending_control_confirmation: Literal["end_session"] | None = None
+    inbound_queue: asyncio.Queue[InboundWork | None] | None = None
+    inbound_task: asyncio.Task[None] | None = None
+    inbound_work_started_at: float | None = None
+    inbound_closed: bool = False
+    control_anchor_folded: bool = False
+    control_refresh_due: bool = False
+    control_refresh_task: asyncio.Task[None] | None = None
+    control_refreshed_at: float = 0.0
+    replay: ReplayBuffer = field(default_factory=ReplayBuffer)
+    last_inbound_seq: int = 0
+    handled_inbound_seq: int = 0
+    detached_task: asyncio.Task[None] | None = None
+    resuming: bool = False
 
     @property
     def session_id(self) -> str:
@@ -64,19 +192,29 @@ class EveryCodeSession:
     def session_epoch(self) -> str:
         return self.hello.session_epoch
 
+    @property
+    def inbound_queue_depth(self) -> int:
+        return self.inbound_queue.qsize() if self.inbound_queue is not None else 0
+
+    @property
+    def inbound_open(self) -> bool:
+        task = self.inbound_task
+        return self.inbound_queue is not None and task is not None and not task.done() and not self.inbound_closed
+
     def touch(self) -> None:
-        self.last_seen = datetime.now(UTC)
+        self.last_seen = time.monotonic()
 
 
 class EveryCodeSessionRegistry:
     def __init__(self) -> None:
         self.by_session: dict[str, EveryCodeSession] = {}
         self.by_thread: dict[int, str] = {}
+        self.thread_by_session: dict[str, int] = {}
 
     def register(self, session: EveryCodeSession) -> None:
         self.by_session[session.session_id] = session
         if session.thread_id is not None:
-            self.by_thread[session.thread_id] = session.session_id
+            self.map_thread(session.session_id, session.thread_id)
 
     def bind_thread(
         self,
@@ -85,12 +223,22 @@ class EveryCodeSessionRegistry:
         notification_message_id: int | None = None,
     ) -> None:
         if session := self.by_session.get(session_id):
-            for existing_thread_id, existing_session_id in list(self.by_thread.items()):
-                if existing_session_id == session_id:
-                    self.by_thread.pop(existing_thread_id, None)
             session.thread_id = thread_id
             session.notification_message_id = notification_message_id
-            self.by_thread[thread_id] = session_id
+            self.map_thread(session_id, thread_id)
+
+    def map_thread(self, session_id: str, thread_id: int) -> None:
+        self.unmap_thread(session_id)
+        previous_session_id = self.by_thread.get(thread_id)
+        if previous_session_id is not None:
+            self.thread_by_session.pop(previous_session_id, None)
+        self.by_thread[thread_id] = session_id
+        self.thread_by_session[session_id] = thread_id
+
+    def unmap_thread(self, session_id: str) -> None:
+        thread_id = self.thread_by_session.pop(session_id, None)
+        if thread_id is not None and self.by_thread.get(thread_id) == session_id:
+            del self.by_thread[thread_id]
 
     def get_by_thread(self, thread_id: int) -> EveryCodeSession | None:
         session_id = self.by_thread.get(thread_id)
@@ -103,12 +251,105 @@ class EveryCodeSessionRegistry:
 
     def remove(self, session_id: str) -> EveryCodeSession | None:
         session = self.by_session.pop(session_id, None)
-        if session and session.thread_id is not None:
-            self.by_thread.pop(session.thread_id, None)
+        if session is not None:
+            self.unmap_thread(session_id)
         return session
 
+    def pending_approval_for_message(self, thread_id: int, message_id: int) -> tuple[EveryCodeSession, str] | None:
+        session = self.get_by_thread(thread_id)
+        if session is None:
+            return None
+        approval_ids = session.pending_approvals.keys_for_message(message_id)
+        return (session, approval_ids[0]) if approval_ids else None
+
     def remove_if_current(self, session: EveryCodeSession) -> EveryCodeSession | None:
         current = self.by_session.get(session.session_id)
         if current is not session:
             return None
         return self.remove(session.session_id)
+
+
+class HeartbeatDeadlines:
+    def __init__(self) -> None:
+        self.heap: list[tuple[float, int, EveryCodeSession]] = []
+        self.changed = asyncio.Event()
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def track(self, session: EveryCodeSession, deadline: float) -> None:
+        heapq.heappush(self.heap, (deadline, next(self._sequence), session))
+        if self.heap[0][2] is session:
+            self.changed.set()
+
+    def next_deadline(self) -> float | None:
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> list[EveryCodeSession]:
+        due: list[EveryCodeSession] = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
+
+
+class SessionAttachLocks:
+    def __init__(self, on_wait: Callable[[float], None] | None = None) -> None:
+        self.locks: dict[str, asyncio.Lock] = {}
+        self.lock_users: dict[str, int] = {}
+        self.on_wait = on_wait
+        self._exclusive = asyncio.Lock()
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @staticmethod
+    def keys_for(hello: SessionHello) -> list[str]:
+        host_label = "Agent" if hello.host_label == "Every Code" else hello.host_label
+        return sorted(
+            {
+                f"session:{hello.session_id}",
+                f"fingerprint:{host_label}\0{hello.cwd}\0{hello.branch or ''}",
+            }
+        )
+
+    @asynccontextmanager
+    async def attaching(self, hello: SessionHello) -> AsyncIterator[None]:
+        started_at = time.monotonic()
+        async with self._exclusive:
+            self._active += 1
+            self._idle.clear()
+        acquired: list[str] = []
+        try:
+            for key in self.keys_for(hello):
+                lock = self.locks.setdefault(key, asyncio.Lock())
+                self.lock_users[key] = self.lock_users.get(key, 0) + 1
+                try:
+                    await lock.acquire()
+                except BaseException:
+                    self.release_key(key, locked=False)
+                    raise
+                acquired.append(key)
+            if self.on_wait is not None:
+                self.on_wait(time.monotonic() - started_at)
+            yield
+        finally:
+            for key in reversed(acquired):
+                self.release_key(key, locked=True)
+            self._active -= 1
+            if not self._active:
+                self._idle.set()
+
+    def release_key(self, key: str, *, locked: bool) -> None:
+        if locked:
+            self.locks[key].release()
+        self.lock_users[key] -= 1
+        if not self.lock_users[key]:
+            del self.lock_users[key]
+            del self.locks[key]
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[None]:
+        async with self._exclusive:
+            await self._idle.wait()
+            yield
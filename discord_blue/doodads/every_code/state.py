@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from discord_blue.doodads.every_code.protocol import SessionHello
+from discord_blue.doodads.every_code.threads import session_start_message
+
+logger = logging.getLogger(__name__)
+STATE_FILE_NAME = "every-code.sqlite3"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_threads (
+    fingerprint TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    host_label TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    thread_id INTEGER NOT NULL,
+    notification_message_id INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_threads_identity ON session_threads (session_id, host_label, cwd, branch);
+CREATE INDEX IF NOT EXISTS session_threads_thread ON session_threads (thread_id);
+CREATE TABLE IF NOT EXISTS session_notifications (
+    thread_id INTEGER PRIMARY KEY,
+    message_id INTEGER NOT NULL
+);
+"""
+
+
+@dataclass(slots=True)
+class IndexedSessionThread:
+    thread_id: int
+    notification_message_id: int | None
+    pid_relaxed: bool = False
+
+
+def default_state_dir() -> Path:
+    return Path.home() / ".local" / "state" / "discord-blue"
+
+
+def session_fingerprint(hello: SessionHello) -> str:
+    return hashlib.sha256(session_start_message(hello).encode()).hexdigest()
+
+
+class EveryCodeStateIndex:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._unavailable = False
+
+    def connection(self) -> sqlite3.Connection | None:
+        if self._connection is not None or self._unavailable:
+            return self._connection
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path)
+            connection.executescript(SCHEMA)
+        except (OSError, sqlite3.Error):
+            logger.warning("Every Code state index %s is unavailable", self.path, exc_info=True)
+            self._unavailable = True
+            return None
+        self._connection = connection
+        return connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def lookup_session_thread(self, hello: SessionHello) -> IndexedSessionThread | None:
+        connection = self.connection()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                "SELECT thread_id, notification_message_id FROM session_threads WHERE fingerprint = ?",
+                (session_fingerprint(hello),),
+            ).fetchone()
+            if row is not None:
+                return IndexedSessionThread(thread_id=row[0], notification_message_id=row[1])
+            rows = connection.execute(
+                "SELECT DISTINCT thread_id, notification_message_id FROM session_threads "
+                "WHERE session_id = ? AND host_label = ? AND cwd = ? AND branch = ?",
+                (hello.session_id, hello.host_label, hello.cwd, hello.branch or ""),
+            ).fetchall()
+        except sqlite3.Error:
+            logger.warning("Unable to read Every Code state index %s", self.path, exc_info=True)
+            return None
+        if len(rows) != 1:
+            return None
+        return IndexedSessionThread(thread_id=rows[0][0], notification_message_id=rows[0][1], pid_relaxed=True)
+
+    def record_session_thread(
+        self,
+        hello: SessionHello,
+        thread_id: int,
+        notification_message_id: int | None,
+    ) -> None:
+        connection = self.connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute("DELETE FROM session_threads WHERE thread_id = ?", (thread_id,))
+                connection.execute(
+                    "INSERT OR REPLACE INTO session_threads "
+                    "(fingerprint, session_id, host_label, cwd, branch, pid, thread_id, notification_message_id, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        session_fingerprint(hello),
+                        hello.session_id,
+                        hello.host_label,
+                        hello.cwd,
+                        hello.branch or "",
+                        hello.pid,
+                        thread_id,
+                        notification_message_id,
+                        time.time(),
+                    ),
+                )
+        except sqlite3.Error:
+            logger.warning("Unable to update Every Code state index %s", self.path, exc_info=True)
+
+    def forget_thread(self, thread_id: int) -> None:
+        connection = self.connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute("DELETE FROM session_threads WHERE thread_id = ?", (thread_id,))
+        except sqlite3.Error:
+            logger.warning("Unable to update Every Code state index %s", self.path, exc_info=True)
+
+    def load_notifications(self) -> dict[int, int]:
+        connection = self.connection()
+        if connection is None:
+            return {}
+        try:
+            rows = connection.execute("SELECT thread_id, message_id FROM session_notifications").fetchall()
+        except sqlite3.Error:
+            logger.warning("Unable to read Every Code state index %s", self.path, exc_info=True)
+            return {}
+        return {thread_id: message_id for thread_id, message_id in rows}
+
+    def record_notification(self, thread_id: int, message_id: int) -> None:
+        connection = self.connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO session_notifications (thread_id, message_id) VALUES (?, ?)",
+                    (thread_id, message_id),
+                )
+        except sqlite3.Error:
+            logger.warning("Unable to update Every Code state index %s", self.path, exc_info=True)
+
+    def forget_notification(self, message_id: int) -> None:
+        connection = self.connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute("DELETE FROM session_notifications WHERE message_id = ?", (message_id,))
+                connection.execute(
+                    "UPDATE session_threads SET notification_message_id = NULL WHERE notification_message_id = ?",
+                    (message_id,),
+                )
+        except sqlite3.Error:
+            logger.warning("Unable to update Every Code state index %s", self.path, exc_info=True)
+
+
+class SessionNotificationIndex:
+    def __init__(self, state_index: EveryCodeStateIndex) -> None:
+        self.state_index = state_index
+        self.by_thread = state_index.load_notifications()
+        self.by_message = {message_id: thread_id for thread_id, message_id in self.by_thread.items()}
+
+    def get(self, thread_id: int) -> int | None:
+        return self.by_thread.get(thread_id)
+
+    def record(self, thread_id: int, message_id: int) -> None:
+        previous_message_id = self.by_thread.get(thread_id)
+        if previous_message_id == message_id:
+            return
+        if previous_message_id is not None:
+            self.by_message.pop(previous_message_id, None)
+        previous_thread_id = self.by_message.get(message_id)
+        if previous_thread_id is not None:
+            self.by_thread.pop(previous_thread_id, None)
+        self.by_thread[thread_id] = message_id
+        self.by_message[message_id] = thread_id
+        self.state_index.record_notification(thread_id, message_id)
+
+    def forget_message(self, message_id: int) -> None:
+        thread_id = self.by_message.pop(message_id, None)
+        if thread_id is not None:
+            self.by_thread.pop(thread_id, None)
+        self.state_index.forget_notification(message_id)
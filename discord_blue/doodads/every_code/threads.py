@@ -1,18 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections import OrderedDict
+from contextlib import AbstractAsyncContextManager, nullcontext
 from dataclasses import dataclass
 from pathlib import Path
 
 import discord
 
 from discord_blue.doodads.every_code.messages import send_every_code_message
+from discord_blue.doodads.every_code.metrics import RequestObserver, observed_request
 from discord_blue.doodads.every_code.protocol import SessionHello
 from discord_blue.plugs.discord_plug import BlueBot
 
 logger = logging.getLogger(__name__)
 DISCORD_THREAD_NAME_LIMIT = 100
 DEFAULT_BRANCH_NAMES = {"main", "master", "develop", "development", "dev", "trunk"}
+SESSION_START_PREFIX = "Every Code session connected"
+ASSISTANT_MESSAGE_PREFIX = "**Assistant**"
+THREAD_HISTORY_SAMPLE_LIMIT = 50
+THREAD_START_SCAN_LIMIT = 10
+THREAD_FINGERPRINT_TTL_SECONDS = 30.0
+THREAD_FINGERPRINT_CACHE_LIMIT = 512
 
 
 @dataclass(slots=True)
@@ -21,6 +31,125 @@ class SessionThread:
     notification_message_id: int | None
 
 
+@dataclass(frozen=True, slots=True)
+class ThreadFingerprint:
+    thread_id: int
+    starts: tuple[str, ...]
+    starts_without_pid: tuple[str, ...]
+    assistant_messages: int
+    messages: int
+
+    @property
+    def is_session_thread(self) -> bool:
+        return any(start.startswith(SESSION_START_PREFIX) for start in self.starts)
+
+    @property
+    def has_assistant_message(self) -> bool:
+        return self.assistant_messages > 0
+
+    @property
+    def sample_is_complete(self) -> bool:
+        return self.messages < THREAD_HISTORY_SAMPLE_LIMIT
+
+    @property
+    def score(self) -> tuple[int, int, int]:
+        return self.assistant_messages, self.messages, self.thread_id
+
+    def matches(self, expected_starts: set[str]) -> bool:
+        return any(start in expected_starts for start in self.starts)
+
+    def matches_without_pid(self, expected_starts_without_pid: set[str]) -> bool:
+        return any(start in expected_starts_without_pid for start in self.starts_without_pid)
+
+
+@dataclass(slots=True)
+class ChannelSnapshot:
+    notifications: list[discord.Message]
+    threads: list[discord.Thread]
+    fingerprints: dict[int, ThreadFingerprint]
+
+    def forget_thread(self, thread_id: int) -> None:
+        self.fingerprints.pop(thread_id, None)
+
+    def forget_message(self, channel_id: int, message_id: int) -> None:
+        self.forget_thread(channel_id)
+        self.notifications = [message for message in self.notifications if message.id != message_id]
+
+
+class ThreadFingerprintCache:
+    def __init__(
+        self,
+        ttl_seconds: float = THREAD_FINGERPRINT_TTL_SECONDS,
+        limit: int = THREAD_FINGERPRINT_CACHE_LIMIT,
+        observer: RequestObserver | None = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.limit = limit
+        self.observer = observer
+        self.entries: OrderedDict[int, tuple[float, asyncio.Task[ThreadFingerprint | None]]] = OrderedDict()
+
+    async def get(
+        self,
+        thread: discord.Thread,
+        bot_user_id: int,
+        *,
+        semaphore: asyncio.Semaphore | None = None,
+    ) -> ThreadFingerprint | None:
+        now = asyncio.get_running_loop().time()
+        entry = self.entries.get(thread.id)
+        if entry is not None and now - entry[0] < self.ttl_seconds:
+            task = entry[1]
+            self.entries.move_to_end(thread.id)
+        else:
+            task = asyncio.create_task(read_thread_fingerprint(thread, bot_user_id, semaphore or nullcontext(), self.observer))
+            self.entries[thread.id] = (now, task)
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+        fingerprint = await asyncio.shield(task)
+        if fingerprint is None and self.entries.get(thread.id, (0.0, None))[1] is task:
+            del self.entries[thread.id]
+        return fingerprint
+
+    def forget(self, thread_id: int) -> None:
+        self.entries.pop(thread_id, None)
+
+
+async def read_thread_fingerprint(
+    thread: discord.Thread,
+    bot_user_id: int,
+    limiter: AbstractAsyncContextManager[object],
+    observer: RequestObserver | None = None,
+) -> ThreadFingerprint | None:
+    history: list[discord.Message] = []
+    try:
+        async with limiter:
+            with observed_request(observer, "thread_history"):
+                async for message in thread.history(limit=THREAD_HISTORY_SAMPLE_LIMIT, oldest_first=True):
+                    history.append(message)
+    except discord.DiscordException:
+        logger.warning("Unable to inspect Every Code thread %s", thread.id)
+        return None
+    starts = tuple(message.content for message in history[:THREAD_START_SCAN_LIMIT] if message.author.id == bot_user_id)
+    return ThreadFingerprint(
+        thread_id=thread.id,
+        starts=starts,
+        starts_without_pid=tuple(start_without_pid for start in starts if (start_without_pid := session_start_without_pid(start))),
+        assistant_messages=sum(1 for message in history if message.content.startswith(ASSISTANT_MESSAGE_PREFIX)),
+        messages=len(history),
+    )
+
+
+def session_start_without_pid(content: str) -> str | None:
+    lines = content.splitlines()
+    if not lines or lines[0] != SESSION_START_PREFIX:
+        return None
+    if not any(line.startswith("session: `") for line in lines):
+        return None
+    if not lines[-1].startswith("pid: `"):
+        return None
+    return "\n".join(lines[:-1])
+
+
 def session_thread_name(hello: SessionHello) -> str:
     repo = session_display_name(hello)
     if hello.origin and hello.origin.kind == "every_code":
@@ -66,7 +195,7 @@ def session_start_message(hello: SessionHello) -> str:
     branch = hello.branch or "unknown"
     return "\n".join(
         [
-            "Every Code session connected",
+            SESSION_START_PREFIX,
             "",
             f"session: `{hello.session_id}`",
             *session_origin_lines(hello),
@@ -97,22 +226,34 @@ async def get_every_code_channel(bot: BlueBot) -> discord.TextChannel:
     raise ValueError(f"Every Code channel {channel_id} is not available")
 
 
-async def create_session_thread(bot: BlueBot, hello: SessionHello) -> SessionThread:
+async def create_session_thread(
+    bot: BlueBot,
+    hello: SessionHello,
+    observer: RequestObserver | None = None,
+) -> SessionThread:
     channel = await get_every_code_channel(bot)
-    thread = await channel.create_thread(
-        name=session_thread_name(hello),
-        auto_archive_duration=1440,
-    )
-    notification = await send_every_code_message(channel, session_notification_message(hello, thread))
-    await send_every_code_message(thread, session_start_message(hello))
-    await auto_join_configured_users(bot, thread)
+    with observed_request(observer, "create_thread"):
+        thread = await channel.create_thread(
+            name=session_thread_name(hello),
+            auto_archive_duration=1440,
+        )
+    with observed_request(observer, "send_message"):
+        notification = await send_every_code_message(channel, session_notification_message(hello, thread))
+    with observed_request(observer, "send_message"):
+        await send_every_code_message(thread, session_start_message(hello))
+    await auto_join_configured_users(bot, thread, observer)
     return SessionThread(thread=thread, notification_message_id=notification.id)
 
 
-async def auto_join_configured_users(bot: BlueBot, thread: discord.Thread) -> None:
+async def auto_join_configured_users(
+    bot: BlueBot,
+    thread: discord.Thread,
+    observer: RequestObserver | None = None,
+) -> None:
     for user_id in bot.config.every_code.auto_join_user_ids:
         try:
-            await thread.add_user(discord.Object(id=user_id))
+            with observed_request(observer, "add_thread_member"):
+                await thread.add_user(discord.Object(id=user_id))
         except discord.DiscordException:
             logger.warning(
                 "Unable to auto-join user %s to Every Code thread %s",
@@ -25,6 +25,11 @@ class EveryCodeDoodad(commands.Cog):
             return
         await self.bridge.start()
 
+    @commands.Cog.listener("on_message")
+    async def observe_thread_message(self, message: discord.Message) -> None:
+        if isinstance(message.channel, discord.Thread):
+            self.bridge.observe_thread_message(message.channel.id, message.id)
+
     @commands.Cog.listener("on_message")
     async def route_thread_reply(self, message: discord.Message) -> None:
         if message.author.bot:
@@ -37,6 +42,10 @@ class EveryCodeDoodad(commands.Cog):
         if delivered:
             logger.info("Delivered Every Code thread reply from %s", message.author.id)
 
+    @commands.Cog.listener("on_raw_message_delete")
+    async def forget_deleted_message(self, payload: discord.RawMessageDeleteEvent) -> None:
+        self.bridge.forget_message(payload.channel_id, payload.message_id)
+
     @commands.Cog.listener("on_raw_reaction_add")
     async def route_quick_reaction(
         self,
@@ -54,33 +54,83 @@ def runtime_identity() -> dict[str, Any] | None:
     return parsed_identity
 
 
-def health_payload(
+def static_health_fields() -> dict[str, Any]:
+    fields: dict[str, Any] = {"version": package_version()}
+    current_source_git_ref = source_git_ref()
+    if current_source_git_ref is not None:
+        fields["source_git_ref"] = current_source_git_ref
+    current_image_reference = image_reference()
+    if current_image_reference is not None:
+        fields["image_reference"] = current_image_reference
+    current_runtime_identity = runtime_identity()
+    if current_runtime_identity is not None:
+        fields["runtime_identity"] = current_runtime_identity
+    return fields
+
+
+def dynamic_health_fields(
     *,
     discord_status: Literal["ok", "unhealthy"],
-    every_code_enabled: bool = False,
-    active_every_code_sessions: int = 0,
+    every_code_enabled: bool,
+    active_every_code_sessions: int,
+    event_loop: dict[str, Any] | None,
 ) -> dict[str, Any]:
-    payload: dict[str, Any] = {
+    components: dict[str, Any] = {
+        "discord": {"status": discord_status},
+        "every_code": {
+            "status": "ok" if every_code_enabled else "disabled",
+            "enabled": every_code_enabled,
+            "active_sessions": active_every_code_sessions,
+        },
+    }
+    if event_loop is not None:
+        components["event_loop"] = event_loop
+    return {
         "schema_version": 1,
         "service": SERVICE_NAME,
         "status": "ok" if discord_status == "ok" else "unhealthy",
-        "version": package_version(),
-        "components": {
-            "discord": {"status": discord_status},
-            "every_code": {
-                "status": "ok" if every_code_enabled else "disabled",
-                "enabled": every_code_enabled,
-                "active_sessions": active_every_code_sessions,
-            },
-        },
+        "components": components,
     }
-    current_source_git_ref = source_git_ref()
-    if current_source_git_ref is not None:
-        payload["source_git_ref"] = current_source_git_ref
-    current_image_reference = image_reference()
-    if current_image_reference is not None:
-        payload["image_reference"] = current_image_reference
-    current_runtime_identity = runtime_identity()
-    if current_runtime_identity is not None:
-        payload["runtime_identity"] = current_runtime_identity
-    return payload
+
+
+def health_payload(
+    *,
+    discord_status: Literal["ok", "unhealthy"],
+    every_code_enabled: bool = False,
+    active_every_code_sessions: int = 0,
+    event_loop: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    return (
+        dynamic_health_fields(
+            discord_status=discord_status,
+            every_code_enabled=every_code_enabled,
+            active_every_code_sessions=active_every_code_sessions,
+            event_loop=event_loop,
+        )
+        | static_health_fields()
+    )
+
+
+class HealthPayloadEncoder:
+    def __init__(self) -> None:
+        self.static_fields = static_health_fields()
+        self._static_json = json.dumps(self.static_fields, separators=(",", ":"))[1:-1].encode()
+
+    def encode(
+        self,
+        *,
+        discord_status: Literal["ok", "unhealthy"],
+        every_code_enabled: bool = False,
+        active_every_code_sessions: int = 0,
+        event_loop: dict[str, Any] | None = None,
+    ) -> bytes:
+        dynamic_json = json.dumps(
+            dynamic_health_fields(
+                discord_status=discord_status,
+                every_code_enabled=every_code_enabled,
+                active_every_code_sessions=active_every_code_sessions,
+                event_loop=event_loop,
+            ),
+            separators=(",", ":"),
+        )
+        return b"".join((dynamic_json[:-1].encode(), b",", self._static_json, b"}"))
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from contextlib import suppress
+
+logger = logging.getLogger(__name__)
+STALL_STACK_DEPTH = 3
+
+
+class LoopLagMonitor:
+    def __init__(
+        self,
+        *,
+        interval_seconds: float,
+        warning_seconds: float,
+        detect_blocking: bool = False,
+        on_sample: Callable[[float], None] | None = None,
+        on_stall: Callable[[], None] | None = None,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.warning_seconds = warning_seconds
+        self.detect_blocking = detect_blocking
+        self.on_sample = on_sample
+        self.on_stall = on_stall
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.last_culprit: str | None = None
+        self.last_culprit_at: float | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    @property
+    def lagging(self) -> bool:
+        return self.lag_seconds >= self.warning_seconds
+
+    def start(self) -> None:
+        if self._task is not None or self.interval_seconds <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self.sample_forever(), name="loop-lag-monitor")
+        if self.detect_blocking and self.warning_seconds > 0:
+            self._watchdog = threading.Thread(
+                target=self.watch_loop,
+                args=(loop, threading.get_ident()),
+                name="loop-lag-watchdog",
+                daemon=True,
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def sample_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            sampled_from = time.monotonic()
+            expected_at = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.record(max(0.0, loop.time() - expected_at), since=sampled_from)
+
+    def record(self, lag_seconds: float, *, since: float | None = None) -> None:
+        self.lag_seconds = lag_seconds
+        self.max_lag_seconds = max(self.max_lag_seconds, lag_seconds)
+        if self.on_sample is not None:
+            self.on_sample(lag_seconds)
+        if lag_seconds < self.warning_seconds:
+            return
+        if self.on_stall is not None:
+            self.on_stall()
+        if self.detect_blocking:
+            culprit_at = self.last_culprit_at
+            culprit = self.last_culprit if since is not None and culprit_at is not None and culprit_at >= since else None
+            logger.warning(
+                "Event loop lagged %.3f seconds; blocked in %s",
+                lag_seconds,
+                culprit or "an unidentified callback",
+            )
+        else:
+            logger.warning("Event loop lagged %.3f seconds", lag_seconds)
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int) -> None:
+        while not self._stopped.is_set() and not loop.is_closed():
+            answered = threading.Event()
+            try:
+                loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return
+            if not answered.wait(self.warning_seconds):
+                self.last_culprit = self.describe_blocking(loop, loop_thread_id)
+                self.last_culprit_at = time.monotonic()
+                logger.warning(
+                    "Event loop blocked for more than %.3f seconds in %s",
+                    self.warning_seconds,
+                    self.last_culprit,
+                )
+                while not answered.wait(self.interval_seconds):
+                    if self._stopped.is_set() or loop.is_closed():
+                        return
+            self._stopped.wait(self.interval_seconds)
+
+    @staticmethod
+    def describe_blocking(loop: asyncio.AbstractEventLoop, loop_thread_id: int) -> str:
+        task = asyncio.current_task(loop)
+        task_name = f"task {task.get_name()}" if task is not None else "a callback outside any task"
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            return task_name
+        stack = traceback.extract_stack(frame)[-STALL_STACK_DEPTH:]
+        location = " <- ".join(f"{entry.name} ({entry.filename}:{entry.lineno})" for entry in reversed(stack))
+        return f"{task_name} at {location}"
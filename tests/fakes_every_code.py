@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from collections.abc import AsyncIterator
 from types import SimpleNamespace
 from typing import Protocol, TYPE_CHECKING
 
 import discord
+from aiohttp import WSMessage, WSMsgType
 
 from discord_blue.doodads.every_code.protocol import SessionHello
 
@@ -19,15 +22,50 @@ class UserLike(Protocol):
 class FakeWebSocket:
     def __init__(self, *, closed: bool = False) -> None:
         self.closed = closed
+        self.compress = 0
         self.sent_json: list[dict[str, object]] = []
+        self.sent_bytes: list[bytes] = []
         self.close_messages: list[bytes] = []
+        self.inbound: asyncio.Queue[WSMessage | None] = asyncio.Queue()
 
-    async def send_json(self, payload: dict[str, object]) -> None:
-        self.sent_json.append(payload)
+    def feed(self, payload: dict[str, object]) -> None:
+        self.inbound.put_nowait(WSMessage(WSMsgType.TEXT, json.dumps(payload), None))
+
+    def feed_bytes(self, data: bytes) -> None:
+        self.inbound.put_nowait(WSMessage(WSMsgType.BINARY, data, None))
+
+    def finish(self) -> None:
+        self.inbound.put_nowait(None)
+
+    def __aiter__(self) -> FakeWebSocket:
+        return self
+
+    async def __anext__(self) -> WSMessage:
+        message = await self.inbound.get()
+        if message is None:
+            self.closed = True
+            raise StopAsyncIteration
+        return message
+
+    async def send_frame(self, message: bytes, opcode: WSMsgType, compress: int | None = None) -> None:
+        if self.closed:
+            raise ConnectionResetError("Cannot write to closing transport")
+        if not isinstance(message, bytes):
+            raise TypeError(f"send_frame payload must be bytes, not {type(message).__name__}")
+        if opcode == WSMsgType.BINARY:
+            self.sent_bytes.append(message)
+        elif opcode == WSMsgType.TEXT:
+            payload = json.loads(message.decode("utf-8"))
+            if not isinstance(payload, dict):
+                raise TypeError("text frames must carry a JSON object")
+            self.sent_json.append(payload)
+        else:
+            raise ValueError(f"unexpected data frame opcode {opcode!r}")
 
     async def close(self, *, message: bytes = b"", drain: bool = True) -> bool:
         self.close_messages.append(message)
         self.closed = True
+        self.inbound.put_nowait(None)
         return True
 
 
@@ -45,6 +83,7 @@ class FakeReplyMessage:
         self.content = content
         self.author = SimpleNamespace(id=author_id)
         self.reactions: list[str] = []
+        self.reaction_calls: list[str] = []
         self.replies: list[str] = []
         self.reply_mentions: list[bool] = []
         self.edits: list[tuple[str, bool]] = []
@@ -53,23 +92,27 @@ class FakeReplyMessage:
         self.delete_raises = False
 
     async def add_reaction(self, reaction: str) -> None:
+        self.reaction_calls.append(f"add {reaction}")
         self.reactions.append(reaction)
 
     async def remove_reaction(self, reaction: str, _user: object) -> None:
+        self.reaction_calls.append(f"remove {reaction}")
         if reaction in self.reactions:
             self.reactions.remove(reaction)
 
     async def clear_reactions(self) -> None:
+        self.reaction_calls.append("clear")
         self.reactions.clear()
 
     async def reply(self, content: str, *, mention_author: bool) -> None:
         self.replies.append(content)
         self.reply_mentions.append(mention_author)
 
-    async def edit(self, content: str, **kwargs: object) -> None:
+    async def edit(self, content: str, **kwargs: object) -> FakeReplyMessage:
         self.content = content
         self.edits.append((content, kwargs.get("view") is None))
         self.edit_kwargs.append(kwargs)
+        return self
 
     async def delete(self) -> None:
         if self.delete_raises:
@@ -108,6 +151,7 @@ class FakeThread:
         self.left = False
         self._member_ids = list(members or [])
         self.removed_user_ids: list[int] = []
+        self.history_calls: list[int] = []
 
     def add_message(self, message: FakeReplyMessage) -> None:
         self._messages[message.id] = message
@@ -137,6 +181,7 @@ class FakeThread:
         limit: int,
         oldest_first: bool = False,
     ) -> AsyncIterator[FakeReplyMessage]:
+        self.history_calls.append(limit)
         messages = self._history[:limit] if oldest_first else list(reversed(self._history))[:limit]
         for message in messages:
             yield message
@@ -196,6 +241,7 @@ class FakeTextChannel:
         self.sent_messages: list[str] = []
         self.sent_kwargs: list[dict[str, object]] = []
         self.archived_thread_calls: list[dict[str, object]] = []
+        self.history_calls: list[int | None] = []
 
     def add_message(self, message: FakeReplyMessage) -> None:
         self._messages[message.id] = message
@@ -222,6 +268,7 @@ class FakeTextChannel:
         limit: int | None = None,
         oldest_first: bool = False,
     ) -> AsyncIterator[FakeReplyMessage]:
+        self.history_calls.append(limit)
         messages = list(self._history)
         if not oldest_first:
             messages.reverse()
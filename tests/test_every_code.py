@@ -4,16 +4,21 @@ import asyncio
 import json
 import os
 import importlib
+import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import unittest
+from functools import partial
 from pathlib import Path
+from random import Random
 from types import SimpleNamespace
 from typing import Any, cast
 from unittest.mock import patch
 
-from aiohttp import web
+from aiohttp import WSMsgType, web
+from aiohttp.test_utils import TestClient, TestServer
 
 from tests.fakes_every_code import FakeBot
 from tests.fakes_every_code import FakeInteraction
@@ -62,9 +67,16 @@ write_default_config()
 
 Config = importlib.import_module("discord_blue.config").Config
 bridge_module = importlib.import_module("discord_blue.doodads.every_code.bridge")
+codec_module = importlib.import_module("discord_blue.doodads.every_code.codec")
 EveryCodeBridge = bridge_module.EveryCodeBridge
 messages_module = importlib.import_module("discord_blue.doodads.every_code.messages")
+metrics_module = importlib.import_module("discord_blue.doodads.every_code.metrics")
+outbound_module = importlib.import_module("discord_blue.doodads.every_code.outbound")
+OutboundPriority = outbound_module.OutboundPriority
+OutboundScheduler = outbound_module.OutboundScheduler
+processes_module = importlib.import_module("discord_blue.doodads.every_code.processes")
 protocol_module = importlib.import_module("discord_blue.doodads.every_code.protocol")
+rollouts_module = importlib.import_module("discord_blue.doodads.every_code.rollouts")
 RemoteCommand = protocol_module.RemoteCommand
 RemoteApprovalRequest = protocol_module.RemoteApprovalRequest
 RemoteRequestUserInput = protocol_module.RemoteRequestUserInput
@@ -77,6 +89,11 @@ sessions_module = importlib.import_module("discord_blue.doodads.every_code.sessi
 EveryCodeSession = sessions_module.EveryCodeSession
 EveryCodeSessionRegistry = sessions_module.EveryCodeSessionRegistry
 PendingRemoteApproval = sessions_module.PendingRemoteApproval
+PendingRemoteCommand = sessions_module.PendingRemoteCommand
+PendingRemoteUserInput = sessions_module.PendingRemoteUserInput
+SessionAttachLocks = sessions_module.SessionAttachLocks
+state_module = importlib.import_module("discord_blue.doodads.every_code.state")
+EveryCodeStateIndex = state_module.EveryCodeStateIndex
 threads_module = importlib.import_module("discord_blue.doodads.every_code.threads")
 create_session_thread = threads_module.create_session_thread
 session_notification_message = threads_module.session_notification_message
@@ -163,6 +180,331 @@ class SessionRegistryTests(unittest.TestCase):
         self.assertIs(registry.remove("session-1"), session)
         self.assertIsNone(registry.get_by_thread(555))
 
+    def assert_registry_invariants(self, registry_object: object) -> None:
+        registry = cast(Any, registry_object)
+        self.assertEqual({thread_id: session_id for session_id, thread_id in registry.thread_by_session.items()}, registry.by_thread)
+        for session_id in registry.thread_by_session:
+            self.assertIn(session_id, registry.by_session)
+        for session in registry.by_session.values():
+            for pending in (session.pending_commands, session.pending_approvals, session.pending_user_inputs):
+                expected: dict[int, list[str]] = {}
+                for key, item in pending.items():
+                    if item.message_id is not None:
+                        expected.setdefault(item.message_id, []).append(key)
+                self.assertEqual({message_id: list(keys) for message_id, keys in pending.keys_by_message.items()}, expected)
+
+    def test_registry_indexes_stay_consistent_through_random_operations(self) -> None:
+        registry = EveryCodeSessionRegistry()
+        random = Random(20261018)
+        for _step in range(500):
+            session_id = f"session-{random.randrange(6)}"
+            thread_id = 500 + random.randrange(6)
+            operation = random.randrange(6)
+            if operation == 0:
+                session = EveryCodeSession(
+                    hello=SessionHello(
+                        session_id=session_id,
+                        session_epoch="epoch-1",
+                        host_label="Mac Studio",
+                        cwd="/tmp/project",
+                        branch="main",
+                        pid=42,
+                    ),
+                    websocket=FakeWebSocket(),
+                    thread_id=random.choice([None, thread_id]),
+                )
+                registry.register(session)
+            elif operation == 1:
+                registry.bind_thread(session_id, thread_id)
+            elif operation == 2:
+                registry.remove(session_id)
+            elif (session := registry.get(session_id)) is not None:
+                message_id = 900 + random.randrange(4)
+                key = f"item-{random.randrange(4)}"
+                if operation == 3:
+                    session.pending_approvals[key] = PendingRemoteApproval(thread_id=thread_id, message_id=message_id)
+                elif operation == 4:
+                    session.pending_commands[key] = PendingRemoteCommand(
+                        thread_id=thread_id,
+                        message_id=random.choice([None, message_id]),
+                        kind="reply",
+                    )
+                    session.pending_approvals.pop(key, None)
+                else:
+                    session.pending_commands.rebind_message(message_id, 900 + random.randrange(4))
+            self.assert_registry_invariants(registry)
+
+    def test_pending_approval_lookup_by_message_id(self) -> None:
+        registry = EveryCodeSessionRegistry()
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        registry.register(session)
+        session.pending_approvals["approval-1"] = PendingRemoteApproval(thread_id=555, message_id=901)
+        session.pending_approvals["approval-2"] = PendingRemoteApproval(thread_id=555, message_id=902)
+
+        self.assertEqual(registry.pending_approval_for_message(555, 902), (session, "approval-2"))
+        del session.pending_approvals["approval-2"]
+        self.assertIsNone(registry.pending_approval_for_message(555, 902))
+        self.assertIsNone(registry.pending_approval_for_message(556, 901))
+
+
+class SessionAttachLockTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unrelated_sessions_attach_in_parallel(self) -> None:
+        waits: list[float] = []
+        locks = SessionAttachLocks(on_wait=waits.append)
+        hello = make_hello()
+        other_hello = SessionHello(
+            session_id="session-2",
+            session_epoch="epoch-1",
+            host_label=hello.host_label,
+            cwd="/tmp/other-project",
+            branch=hello.branch,
+            pid=43,
+        )
+        same_fingerprint_hello = SessionHello(
+            session_id="session-3",
+            session_epoch="epoch-1",
+            host_label=hello.host_label,
+            cwd=hello.cwd,
+            branch=hello.branch,
+            pid=44,
+        )
+        first_attach = locks.attaching(hello)
+        await first_attach.__aenter__()
+
+        async with asyncio.timeout(1), locks.attaching(other_hello):
+            pass
+        same_fingerprint_task = asyncio.create_task(locks.attaching(same_fingerprint_hello).__aenter__())
+        await asyncio.sleep(0)
+        self.assertFalse(same_fingerprint_task.done())
+        exclusive_task = asyncio.create_task(locks.exclusive().__aenter__())
+        await asyncio.sleep(0)
+        self.assertFalse(exclusive_task.done())
+
+        await first_attach.__aexit__(None, None, None)
+        await same_fingerprint_task
+
+        self.assertFalse(exclusive_task.done())
+        self.assertEqual(len(waits), 3)
+        self.assertGreater(max(waits), 0)
+        exclusive_task.cancel()
+
+
+class StateIndexTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.index = EveryCodeStateIndex(Path(self.state_dir.name) / "state.sqlite3")
+
+    def tearDown(self) -> None:
+        self.index.close()
+        self.state_dir.cleanup()
+
+    def test_lookup_matches_exact_session_start_fingerprint(self) -> None:
+        hello = make_hello()
+
+        self.index.record_session_thread(hello, 555, 777)
+        indexed = self.index.lookup_session_thread(hello)
+
+        self.assertIsNotNone(indexed)
+        assert indexed is not None
+        self.assertEqual(indexed.thread_id, 555)
+        self.assertEqual(indexed.notification_message_id, 777)
+        self.assertFalse(indexed.pid_relaxed)
+
+    def test_lookup_relaxes_pid_only_for_unambiguous_identity(self) -> None:
+        hello = make_hello()
+        restarted_hello = SessionHello(
+            session_id=hello.session_id,
+            session_epoch="epoch-2",
+            host_label=hello.host_label,
+            cwd=hello.cwd,
+            branch=hello.branch,
+            pid=hello.pid + 1,
+        )
+
+        self.index.record_session_thread(hello, 555, 777)
+        indexed = self.index.lookup_session_thread(restarted_hello)
+
+        self.assertIsNotNone(indexed)
+        assert indexed is not None
+        self.assertEqual(indexed.thread_id, 555)
+        self.assertTrue(indexed.pid_relaxed)
+
+        other_pid_hello = SessionHello(
+            session_id=hello.session_id,
+            session_epoch="epoch-3",
+            host_label=hello.host_label,
+            cwd=hello.cwd,
+            branch=hello.branch,
+            pid=hello.pid + 2,
+        )
+        self.index.record_session_thread(other_pid_hello, 556, None)
+
+        self.assertIsNone(self.index.lookup_session_thread(restarted_hello))
+
+    def test_rebinding_thread_replaces_previous_fingerprint(self) -> None:
+        hello = make_hello()
+        other_hello = SessionHello(
+            session_id="session-2",
+            session_epoch="epoch-1",
+            host_label=hello.host_label,
+            cwd="/tmp/other",
+            branch=None,
+            pid=7,
+        )
+
+        self.index.record_session_thread(hello, 555, 777)
+        self.index.record_session_thread(other_hello, 555, None)
+        self.index.forget_notification(777)
+
+        self.assertIsNone(self.index.lookup_session_thread(hello))
+        indexed = self.index.lookup_session_thread(other_hello)
+        self.assertIsNotNone(indexed)
+        assert indexed is not None
+        self.assertIsNone(indexed.notification_message_id)
+
+
+class OutboundSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_prompts_run_before_queued_cosmetic_work_on_the_same_route(self) -> None:
+        scheduler = OutboundScheduler()
+        release = asyncio.Event()
+        order: list[str] = []
+
+        async def blocking() -> None:
+            order.append("running")
+            await release.wait()
+
+        async def record(name: str) -> str:
+            order.append(name)
+            return name
+
+        running = asyncio.create_task(scheduler.run(1, OutboundPriority.COSMETIC, blocking))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(scheduler.run(1, OutboundPriority.COSMETIC, partial(record, "reaction"))),
+            asyncio.create_task(scheduler.run(1, OutboundPriority.TEXT, partial(record, "text-1"))),
+            asyncio.create_task(scheduler.run(1, OutboundPriority.TEXT, partial(record, "text-2"))),
+            asyncio.create_task(scheduler.run(1, OutboundPriority.PROMPT, partial(record, "prompt"))),
+        ]
+        other_route = await scheduler.run(2, OutboundPriority.COSMETIC, partial(record, "other-route"))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.queued(1), 4)
+
+        release.set()
+        await running
+        results = await asyncio.gather(*queued)
+
+        self.assertEqual(other_route, "other-route")
+        self.assertEqual(results, ["reaction", "text-1", "text-2", "prompt"])
+        self.assertEqual(order, ["running", "other-route", "prompt", "text-1", "text-2", "reaction"])
+        self.assertEqual(scheduler.routes, {})
+
+    async def test_newer_work_supersedes_queued_work_with_the_same_key(self) -> None:
+        scheduler = OutboundScheduler()
+        release = asyncio.Event()
+        applied: list[str] = []
+
+        async def apply(name: str) -> bool:
+            if name == "first":
+                await release.wait()
+            applied.append(name)
+            return True
+
+        first = asyncio.create_task(scheduler.run_latest(1, OutboundPriority.COSMETIC, "controls", partial(apply, "first")))
+        await asyncio.sleep(0)
+        stale = asyncio.create_task(scheduler.run_latest(1, OutboundPriority.COSMETIC, "controls", partial(apply, "stale")))
+        await asyncio.sleep(0)
+        latest = asyncio.create_task(scheduler.run_latest(1, OutboundPriority.COSMETIC, "controls", partial(apply, "latest")))
+        await asyncio.sleep(0)
+
+        self.assertIsNone(await stale)
+        release.set()
+
+        self.assertTrue(await first)
+        self.assertTrue(await latest)
+        self.assertEqual(applied, ["first", "latest"])
+
+    async def test_failures_propagate_to_the_waiting_caller(self) -> None:
+        scheduler = OutboundScheduler()
+        release = asyncio.Event()
+
+        async def blocking() -> None:
+            await release.wait()
+
+        async def failing() -> None:
+            raise bridge_module.discord.DiscordException("boom")
+
+        running = asyncio.create_task(scheduler.run(1, OutboundPriority.TEXT, blocking))
+        await asyncio.sleep(0)
+        failed = asyncio.create_task(scheduler.run(1, OutboundPriority.TEXT, failing))
+        await asyncio.sleep(0)
+        release.set()
+        await running
+
+        with self.assertRaises(bridge_module.discord.DiscordException):
+            await failed
+
+
+class MetricsTests(unittest.TestCase):
+    def test_histogram_renders_cumulative_prometheus_buckets(self) -> None:
+        histogram = metrics_module.Histogram("latency_seconds", "Latency.", ("operation",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, 'send "x"')
+        histogram.observe(0.5, 'send "x"')
+        histogram.observe(3.0, 'send "x"')
+
+        self.assertEqual(
+            list(histogram.samples()),
+            [
+                'latency_seconds_bucket{operation="send \\"x\\"",le="0.1"} 1',
+                'latency_seconds_bucket{operation="send \\"x\\"",le="1"} 2',
+                'latency_seconds_bucket{operation="send \\"x\\"",le="+Inf"} 3',
+                'latency_seconds_sum{operation="send \\"x\\""} 3.55',
+                'latency_seconds_count{operation="send \\"x\\""} 3',
+            ],
+        )
+
+    def test_deflate_estimate_samples_each_compressed_connection_on_its_own(self) -> None:
+        metrics = metrics_module.BridgeMetrics()
+        first, second, plain = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        payload = b'{"type":"status_changed","status":"running"}' * 4
+
+        for _ in range(metrics_module.DEFLATE_SAMPLE_INTERVAL):
+            metrics.observe_outbound_frame(first, "json", payload, True)
+        metrics.observe_outbound_frame(second, "json", payload, True)
+        metrics.observe_outbound_frame(plain, "json", payload, False)
+
+        self.assertEqual(metrics.websocket_payload_bytes.value("outbound", "json"), len(payload) * 18)
+        self.assertEqual(metrics.websocket_deflate_estimate_bytes.value("raw"), len(payload) * 2)
+        self.assertEqual(
+            metrics.websocket_deflate_estimate_bytes.value("deflated"),
+            metrics_module.standalone_deflated_size(payload) * 2,
+        )
+        self.assertLess(metrics_module.standalone_deflated_size(payload), len(payload))
+
+
+class CodecTests(unittest.TestCase):
+    def test_every_json_codec_round_trips_bridge_messages(self) -> None:
+        message = RemoteCommand(
+            command_id="command-1",
+            session_id="session-1",
+            session_epoch="epoch-1",
+            kind="reply",
+            text="déjà vu ✅",
+        ).to_message()
+
+        for codec in codec_module.JSON_CODECS.values():
+            with self.subTest(codec=codec.name):
+                self.assertIsInstance(codec.dumps(message), bytes)
+                self.assertEqual(codec.loads(codec.dumps(message)), message)
+                with self.assertRaises(ValueError):
+                    codec.loads("{not json")
+
+    def test_unknown_json_codec_warns_and_falls_back_to_auto(self) -> None:
+        auto = codec_module.select_json_codec()
+        with self.assertLogs(codec_module.logger, level="WARNING") as logs:
+            self.assertIs(codec_module.select_json_codec("orjosn"), auto)
+        self.assertIn(f"'orjosn' is not available; using {auto.name}", logs.output[0])
+        self.assertEqual(codec_module.select_json_codec("json").name, "json")
+
 
 class ProtocolTests(unittest.TestCase):
     def test_session_hello_from_payload_applies_defaults(self) -> None:
@@ -374,7 +716,9 @@ class ThreadFormattingTests(unittest.IsolatedAsyncioTestCase):
         archived_thread = FakeThread(556, archived=True)
         channel = FakeTextChannel(321, [active_thread, archived_thread])
 
-        candidates = await bridge_module.EveryCodeBridge.session_thread_candidates(channel)
+        bridge = EveryCodeBridge(FakeBot(Config(), active_thread))
+
+        candidates = await bridge.session_thread_candidates(cast(Any, channel))
 
         self.assertIn(active_thread, candidates)
         self.assertIn(archived_thread, candidates)
@@ -528,6 +872,7 @@ class FakeThreadTests(unittest.IsolatedAsyncioTestCase):
 class BridgeTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self) -> None:
         write_default_config()
+        shutil.rmtree(state_module.default_state_dir(), ignore_errors=True)
         self.original_thread_type = bridge_module.discord.Thread
         self.original_text_channel_type = bridge_module.discord.TextChannel
         bridge_module.discord.Thread = FakeThread
@@ -562,6 +907,478 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(agent_session_route.handler, bridge.handle_connect)
         self.assertEqual(every_code_route.handler, bridge.handle_connect)
 
+    async def test_session_websocket_touches_heartbeat_while_handler_is_busy(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        channel = FakeTextChannel(321, [])
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+        websocket = FakeWebSocket()
+        release = asyncio.Event()
+        handled: list[str] = []
+
+        async def slow_user_message(message: object) -> None:
+            handled.append(cast(Any, message).message)
+            await release.wait()
+
+        bridge.handle_user_message = slow_user_message  # type: ignore[method-assign]
+        serve_task = asyncio.create_task(bridge.serve_session_websocket(websocket))  # type: ignore[arg-type]
+        hello = make_hello()
+        websocket.feed(
+            {
+                "type": "hello",
+                "session_id": hello.session_id,
+                "session_epoch": hello.session_epoch,
+                "host_label": hello.host_label,
+                "cwd": hello.cwd,
+                "branch": hello.branch,
+                "pid": hello.pid,
+            }
+        )
+        for text in ["first", "second"]:
+            websocket.feed({"type": "user_message", "session_id": "session-1", "session_epoch": "epoch-1", "message": text})
+        while handled != ["first"]:
+            await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        stale_seen = time.monotonic() - 10_000
+        session.last_seen = stale_seen
+        bridge.track_session_heartbeat(session)
+
+        await bridge.close_timed_out_sessions()
+        websocket.feed({"type": "heartbeat"})
+        while session.last_seen == stale_seen:
+            await asyncio.sleep(0)
+
+        self.assertEqual(websocket.close_messages, [])
+        self.assertEqual(session.inbound_queue_depth, 1)
+        release.set()
+        websocket.finish()
+        await serve_task
+
+        self.assertEqual(handled, ["first", "second"])
+        self.assertEqual(websocket.sent_json[0]["type"], "hello_ack")
+        self.assertNotIn("session-1", bridge.sessions.by_session)
+
+    async def test_heartbeat_times_out_session_whose_handler_is_stuck(self) -> None:
+        config = Config()
+        config.every_code.heartbeat_timeout_seconds = 100
+        bridge = EveryCodeBridge(FakeBot(config, FakeThread(555)))
+        websocket = FakeWebSocket()
+        session = EveryCodeSession(hello=make_hello(), websocket=websocket)
+        bridge.sessions.register(session)
+        bridge.start_session_inbound(session)
+        stuck = asyncio.Event()
+        for _ in range(2):
+            await bridge.enqueue_session_inbound(session, "user_message", stuck.wait)
+        while session.inbound_work_started_at is None:
+            await asyncio.sleep(0)
+        session.inbound_work_started_at -= 101
+        session.last_seen = time.monotonic() - 101
+        bridge.track_session_heartbeat(session)
+
+        with self.assertLogs(bridge_module.logger, level="WARNING"):
+            await bridge.close_timed_out_sessions()
+        await bridge.stop_session_inbound(session, drain=True)
+
+        self.assertEqual(websocket.close_messages, [b"heartbeat timeout"])
+        self.assertIsNone(bridge.sessions.get("session-1"))
+        self.assertTrue(cast(asyncio.Task[None], session.inbound_task).done())
+
+    async def test_control_refresh_is_not_queued_behind_a_stopped_inbound_consumer(self) -> None:
+        bridge = EveryCodeBridge(FakeBot(Config(), FakeThread(555)))
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        bridge.start_session_inbound(session)
+        release = asyncio.Event()
+        await bridge.enqueue_session_inbound(session, "user_message", release.wait)
+        while session.inbound_work_started_at is None:
+            await asyncio.sleep(0)
+        stopping = asyncio.create_task(bridge.stop_session_inbound(session, drain=True))
+        await asyncio.sleep(0)
+
+        await bridge.flush_session_controls_later(session, 0)
+        release.set()
+        await stopping
+
+        self.assertEqual(session.inbound_queue_depth, 0)
+        self.assertFalse(session.inbound_open)
+
+    async def test_failed_attach_unregisters_session_and_closes_socket(self) -> None:
+        bridge = EveryCodeBridge(FakeBot(Config(), FakeThread(555)))
+        websocket = FakeWebSocket()
+        session = EveryCodeSession(hello=make_hello(), websocket=websocket)
+
+        async def fail_thread(_hello: object) -> None:
+            raise RuntimeError("thread creation failed")
+
+        bridge.find_or_create_session_thread = fail_thread  # type: ignore[method-assign]
+
+        with self.assertRaises(RuntimeError):
+            await bridge.attach_session(session)
+
+        self.assertIsNone(bridge.sessions.get("session-1"))
+        self.assertEqual(websocket.close_messages, [b"attach failed"])
+
+    async def test_heartbeat_monitor_wakes_at_next_deadline_and_reschedules_touched_sessions(self) -> None:
+        config = Config()
+        config.every_code.heartbeat_timeout_seconds = 100
+        config.every_code.heartbeat_check_interval_seconds = 3600
+        bridge = EveryCodeBridge(FakeBot(config, FakeThread(555)))
+        expiring_websocket = FakeWebSocket()
+        expiring = EveryCodeSession(hello=make_hello(), websocket=expiring_websocket)
+        touched = EveryCodeSession(
+            hello=SessionHello(
+                session_id="session-2",
+                session_epoch="epoch-1",
+                host_label="Mac Studio",
+                cwd="/tmp/other-project",
+                branch="main",
+                pid=43,
+            ),
+            websocket=FakeWebSocket(),
+        )
+        for session in (expiring, touched):
+            session.last_seen = time.monotonic() - 99.95
+            bridge.sessions.register(session)
+            bridge.track_session_heartbeat(session)
+        touched.touch()
+
+        monitor = asyncio.create_task(bridge.monitor_heartbeats())
+        while expiring_websocket.close_messages == []:
+            await asyncio.sleep(0.01)
+        monitor.cancel()
+
+        self.assertEqual(expiring_websocket.close_messages, [b"heartbeat timeout"])
+        self.assertIs(bridge.sessions.get("session-2"), touched)
+        self.assertEqual(len(bridge.heartbeat_deadlines), 1)
+        self.assertGreater(cast(float, bridge.heartbeat_deadlines.next_deadline()), time.monotonic() + 99)
+
+    async def test_discord_request_metrics_time_each_call_and_count_tolerated_failures(self) -> None:
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(Config(), thread))
+        add_bot_message(thread, 901, "Approval requested")
+
+        async def refuse_clear() -> None:
+            raise bridge_module.discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Cannot clear reactions")
+
+        message = await bridge.fetch_message(cast(Any, thread), 901)
+        message.clear_reactions = refuse_clear  # type: ignore[method-assign]
+        reactions = [bridge_module.REACTION_FINISHED, bridge_module.REACTION_REJECTED]
+        await bridge.outbound.run(555, OutboundPriority.COSMETIC, partial(bridge.apply_reaction_state, message, reactions))
+
+        metrics = bridge.metrics
+        self.assertEqual(metrics.discord_request_seconds.count("fetch_message"), 1)
+        self.assertEqual(metrics.discord_request_seconds.count("add_reaction"), 2)
+        self.assertEqual(metrics.discord_request_errors.value("clear_reactions"), 1)
+        self.assertEqual(metrics.discord_request_seconds.count("apply_reaction_state"), 0)
+
+    async def test_metrics_endpoint_reports_inbound_handlers_attaches_and_discord_calls(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        channel = FakeTextChannel(321, [])
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+        websocket = FakeWebSocket()
+        hello = make_hello()
+        serve_task = asyncio.create_task(bridge.serve_session_websocket(websocket))  # type: ignore[arg-type]
+        websocket.feed(
+            {
+                "type": "hello",
+                "session_id": hello.session_id,
+                "session_epoch": hello.session_epoch,
+                "host_label": hello.host_label,
+                "cwd": hello.cwd,
+                "branch": hello.branch,
+                "pid": hello.pid,
+            }
+        )
+        websocket.feed({"type": "heartbeat"})
+        websocket.feed({"type": "made_up"})
+        while not websocket.sent_json:
+            await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        session.pending_approvals["approval-1"] = PendingRemoteApproval(thread_id=555, message_id=901)
+
+        response = await bridge.handle_metrics(cast(web.Request, SimpleNamespace(headers={})))
+        websocket.finish()
+        await serve_task
+
+        body = cast(bytes, response.body).decode()
+        self.assertEqual(response.headers["Content-Type"], metrics_module.PROMETHEUS_CONTENT_TYPE)
+        self.assertIn('every_code_inbound_messages_total{type="hello"} 1', body)
+        self.assertIn('every_code_inbound_messages_total{type="heartbeat"} 1', body)
+        self.assertIn('every_code_inbound_messages_total{type="unknown"} 1', body)
+        self.assertIn('every_code_handler_seconds_count{type="hello"} 1', body)
+        self.assertIn('every_code_session_attaches_total{outcome="created"} 1', body)
+        self.assertIn("every_code_session_attach_seconds_count 1", body)
+        self.assertIn("every_code_attach_lock_wait_seconds_count 1", body)
+        self.assertIn("every_code_sessions 1", body)
+        self.assertIn('every_code_pending_items{kind="approval"} 1', body)
+        self.assertIn('every_code_discord_request_seconds_count{operation="create_thread"} 1', body)
+        self.assertIn('every_code_discord_request_seconds_count{operation="send_message"} 2', body)
+
+    @unittest.skipUnless(codec_module.BINARY_CODECS, "msgpack is not installed")
+    async def test_hello_negotiates_messagepack_frames_alongside_json(self) -> None:
+        msgpack_codec = codec_module.BINARY_CODECS["msgpack"]
+        hello = SessionHello.from_payload({"session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "protocol_version": 2})
+        with patch.dict(codec_module.BINARY_CODECS, clear=True):
+            self.assertEqual(EveryCodeBridge.negotiate_protocol_version(hello), 1)
+
+        config = Config()
+        config.every_code.channel_id = 321
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        websocket = FakeWebSocket()
+        serve_task = asyncio.create_task(bridge.serve_session_websocket(websocket))  # type: ignore[arg-type]
+        websocket.feed({"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "protocol_version": 2})
+        while not websocket.sent_json:
+            await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        websocket.feed_bytes(msgpack_codec.dumps({"type": "heartbeat"}))
+        websocket.feed_bytes(b"\xc1")
+        websocket.feed({"type": "heartbeat"})
+        await bridge.send_session_message(session, {"type": "command", "command_id": "command-1"})
+        websocket.finish()
+        await serve_task
+
+        self.assertEqual(websocket.sent_json[0]["protocol_version"], 2)
+        self.assertEqual(bridge.metrics.inbound_messages.value("heartbeat"), 2)
+        self.assertEqual(
+            [msgpack_codec.loads(frame) for frame in websocket.sent_bytes],
+            [{"type": "command", "command_id": "command-1"}],
+        )
+
+    async def test_hello_falls_back_to_json_frames_without_messagepack(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        websocket = FakeWebSocket()
+        with patch.dict(codec_module.BINARY_CODECS, clear=True):
+            serve_task = asyncio.create_task(bridge.serve_session_websocket(websocket))  # type: ignore[arg-type]
+            websocket.feed(
+                {"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "protocol_version": 2}
+            )
+            while not websocket.sent_json:
+                await asyncio.sleep(0)
+            session = bridge.sessions.by_session["session-1"]
+            websocket.feed_bytes(b"\x81\xa4type\xa9heartbeat")
+            websocket.feed({"type": "heartbeat"})
+            with self.assertLogs(bridge_module.logger, level="WARNING") as logs:
+                while bridge.metrics.inbound_messages.value("heartbeat") == 0:
+                    await asyncio.sleep(0)
+            await bridge.send_session_message(session, {"type": "command", "command_id": "command-1"})
+            websocket.finish()
+            await serve_task
+
+        self.assertEqual(websocket.sent_json[0]["protocol_version"], 1)
+        self.assertEqual(session.protocol_version, 1)
+        self.assertIn("MessagePack is not installed", "\n".join(logs.output))
+        self.assertEqual(bridge.metrics.inbound_messages.value("heartbeat"), 1)
+        self.assertEqual(websocket.sent_bytes, [])
+        self.assertEqual(websocket.sent_json[1], {"type": "command", "command_id": "command-1"})
+
+    async def test_resumable_session_replays_unacknowledged_messages_on_resume(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        first_socket = FakeWebSocket()
+        first_serve = asyncio.create_task(bridge.serve_session_websocket(first_socket))  # type: ignore[arg-type]
+        first_socket.feed({"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "resumable": True})
+        while not first_socket.sent_json:
+            await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        await bridge.send_session_message(session, {"type": "command", "command_id": "command-1"})
+        await bridge.send_session_message(session, {"type": "command", "command_id": "command-2"})
+        first_socket.feed({"type": "heartbeat", "seq": 1, "ack": 1})
+        first_socket.finish()
+        await first_serve
+        await bridge.send_session_message(session, {"type": "command", "command_id": "command-3"})
+
+        rejected_socket = FakeWebSocket()
+        rejected_socket.feed({"type": "resume", "session_id": "session-1", "session_epoch": "epoch-2", "last_seq": 1})
+        rejected_socket.finish()
+        await bridge.serve_session_websocket(rejected_socket)  # type: ignore[arg-type]
+        second_socket = FakeWebSocket()
+        send_replayed_frame = second_socket.send_frame
+
+        async def send_during_replay(message: bytes, opcode: WSMsgType, compress: int | None = None) -> None:
+            await send_replayed_frame(message, opcode, compress)
+            if json.loads(message).get("seq") == 2:
+                await bridge.send_session_message(session, {"type": "command", "command_id": "command-4"})
+
+        second_socket.send_frame = send_during_replay  # type: ignore[method-assign]
+        second_serve = asyncio.create_task(bridge.serve_session_websocket(second_socket))  # type: ignore[arg-type]
+        second_socket.feed({"type": "resume", "session_id": "session-1", "session_epoch": "epoch-1", "last_seq": 1})
+        second_socket.feed({"type": "heartbeat", "seq": 1})
+        second_socket.feed({"type": "heartbeat", "seq": 2})
+        async with asyncio.timeout(5):
+            while session.last_inbound_seq < 2:
+                await asyncio.sleep(0)
+
+        self.assertTrue(first_socket.sent_json[0]["resumable"])
+        self.assertEqual([message.get("seq") for message in first_socket.sent_json], [None, 1, 2])
+        self.assertEqual(rejected_socket.sent_json[0]["type"], "resume_reject")
+        self.assertEqual(second_socket.sent_json[0]["type"], "resume_ack")
+        self.assertEqual(second_socket.sent_json[0]["last_seq"], 1)
+        self.assertEqual(
+            [(message["seq"], message["command_id"]) for message in second_socket.sent_json[1:]],
+            [(2, "command-2"), (3, "command-3"), (4, "command-4")],
+        )
+        self.assertIs(bridge.sessions.get("session-1"), session)
+        self.assertIs(session.websocket, second_socket)
+        self.assertEqual(bridge.metrics.inbound_duplicates.value(), 1)
+        self.assertEqual(bridge.metrics.session_resumes.value("resumed"), 1)
+        self.assertEqual(bridge.metrics.session_resumes.value("rejected"), 1)
+
+        second_socket.finish()
+        await second_serve
+        await bridge.disconnect_active_sessions()
+
+    async def test_resume_acknowledges_only_inbound_work_that_finished(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.heartbeat_timeout_seconds = 100
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        release = asyncio.Event()
+        handled: list[str] = []
+
+        async def stuck_user_message(message: object) -> None:
+            text = cast(Any, message).message
+            if text == "second" and not release.is_set():
+                await asyncio.Event().wait()
+            handled.append(text)
+
+        bridge.handle_user_message = stuck_user_message  # type: ignore[method-assign]
+        first_socket = FakeWebSocket()
+        first_serve = asyncio.create_task(bridge.serve_session_websocket(first_socket))  # type: ignore[arg-type]
+        first_socket.feed({"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "resumable": True})
+        for seq, text in enumerate(["first", "second", "third"], start=1):
+            first_socket.feed(
+                {"type": "user_message", "session_id": "session-1", "session_epoch": "epoch-1", "message": text, "seq": seq}
+            )
+        first_socket.feed({"type": "heartbeat", "seq": 4})
+        async with asyncio.timeout(5):
+            while handled != ["first"] or not bridge.sessions.by_session["session-1"].inbound_queue_depth:
+                await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        session.inbound_work_started_at = time.monotonic() - 101
+        session.last_seen = time.monotonic() - 101
+        bridge.track_session_heartbeat(session)
+        with self.assertLogs(bridge_module.logger, level="WARNING"):
+            await bridge.close_timed_out_sessions()
+        async with asyncio.timeout(5):
+            await first_serve
+
+        release.set()
+        second_socket = FakeWebSocket()
+        second_serve = asyncio.create_task(bridge.serve_session_websocket(second_socket))  # type: ignore[arg-type]
+        second_socket.feed({"type": "resume", "session_id": "session-1", "session_epoch": "epoch-1", "last_seq": 0})
+        for seq, text in [(2, "second"), (3, "third")]:
+            second_socket.feed(
+                {"type": "user_message", "session_id": "session-1", "session_epoch": "epoch-1", "message": text, "seq": seq}
+            )
+        async with asyncio.timeout(5):
+            while len(handled) < 3:
+                await asyncio.sleep(0)
+
+        self.assertEqual(second_socket.sent_json[0]["type"], "resume_ack")
+        self.assertEqual(second_socket.sent_json[0]["last_seq"], 1)
+        self.assertEqual(handled, ["first", "second", "third"])
+        self.assertEqual(bridge.metrics.inbound_duplicates.value(), 0)
+        second_socket.finish()
+        await second_serve
+        await bridge.disconnect_active_sessions()
+
+    async def test_resume_abandons_inbound_work_stuck_on_the_previous_socket(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.heartbeat_timeout_seconds = 0.05
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        started = asyncio.Event()
+
+        async def stuck_user_message(_message: object) -> None:
+            started.set()
+            await asyncio.Event().wait()
+
+        bridge.handle_user_message = stuck_user_message  # type: ignore[method-assign]
+        first_socket = FakeWebSocket()
+        first_serve = asyncio.create_task(bridge.serve_session_websocket(first_socket))  # type: ignore[arg-type]
+        first_socket.feed({"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "resumable": True})
+        first_socket.feed(
+            {"type": "user_message", "session_id": "session-1", "session_epoch": "epoch-1", "message": "stuck", "seq": 1}
+        )
+        async with asyncio.timeout(5):
+            await started.wait()
+
+        second_socket = FakeWebSocket()
+        second_socket.feed({"type": "resume", "session_id": "session-1", "session_epoch": "epoch-1", "last_seq": 0})
+        second_socket.finish()
+        with self.assertLogs(bridge_module.logger, level="WARNING") as logs:
+            async with asyncio.timeout(5):
+                await bridge.serve_session_websocket(second_socket)  # type: ignore[arg-type]
+                await first_serve
+
+        self.assertIn("did not drain", "\n".join(logs.output))
+        self.assertEqual(second_socket.sent_json[0]["type"], "resume_ack")
+        self.assertEqual(second_socket.sent_json[0]["last_seq"], 0)
+        await bridge.disconnect_active_sessions()
+
+    async def test_resume_takes_over_half_open_socket_and_heartbeat_timeout_detaches(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.heartbeat_timeout_seconds = 100
+        bridge = EveryCodeBridge(FakeBot(config, channel=FakeTextChannel(321, [])))
+        first_socket = FakeWebSocket()
+        first_serve = asyncio.create_task(bridge.serve_session_websocket(first_socket))  # type: ignore[arg-type]
+        first_socket.feed({"type": "hello", "session_id": "session-1", "session_epoch": "epoch-1", "pid": 42, "resumable": True})
+        while not first_socket.sent_json:
+            await asyncio.sleep(0)
+        session = bridge.sessions.by_session["session-1"]
+        await bridge.send_session_message(session, {"type": "command", "command_id": "command-1"})
+
+        second_socket = FakeWebSocket()
+        second_serve = asyncio.create_task(bridge.serve_session_websocket(second_socket))  # type: ignore[arg-type]
+        second_socket.feed({"type": "resume", "session_id": "session-1", "session_epoch": "epoch-1", "last_seq": 0})
+        async with asyncio.timeout(5):
+            await first_serve
+            while session.websocket is not second_socket:
+                await asyncio.sleep(0)
+
+        self.assertEqual(first_socket.close_messages, [b"session resumed"])
+        self.assertEqual([message["type"] for message in second_socket.sent_json], ["resume_ack", "command"])
+        self.assertIs(bridge.sessions.get("session-1"), session)
+        self.assertFalse(cast(asyncio.Task[None], session.inbound_task).done())
+
+        session.last_seen = time.monotonic() - 101
+        bridge.track_session_heartbeat(session)
+        await bridge.close_timed_out_sessions()
+        async with asyncio.timeout(5):
+            await second_serve
+
+        self.assertEqual(second_socket.close_messages, [b"heartbeat timeout"])
+        self.assertIsNotNone(session.detached_task)
+        self.assertIs(bridge.sessions.get("session-1"), session)
+        await bridge.disconnect_active_sessions()
+
+    async def test_connect_negotiates_deflate_and_closes_idle_sockets(self) -> None:
+        config = Config()
+        config.every_code.token = "shared-secret"
+        config.every_code.websocket_receive_timeout_seconds = 0.2
+        bridge = EveryCodeBridge(FakeBot(config))
+        app = web.Application()
+        app.router.add_get("/agent-session/connect", bridge.handle_connect)
+
+        async with TestClient(TestServer(app)) as client:
+            websocket = await client.ws_connect(
+                "/agent-session/connect",
+                headers={"Authorization": "Bearer shared-secret"},
+                compress=15,
+            )
+            await websocket.send_str('{"type": "made_up"}')
+            with self.assertLogs(bridge_module.logger, level="WARNING"):
+                closing = await websocket.receive()
+
+        self.assertEqual(closing.type, WSMsgType.CLOSE)
+        self.assertEqual(closing.extra, "receive timeout")
+        self.assertEqual(bridge.metrics.websocket_connections.value("deflate"), 1)
+        self.assertEqual(bridge.metrics.websocket_payload_bytes.value("inbound", "json"), 19)
+
     async def test_cleanup_stale_session_notifications_deletes_human_and_automated_notices(self) -> None:
         config = Config()
         config.every_code.channel_id = 321
@@ -592,6 +1409,20 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertFalse(unrelated_bot_notice.deleted)
         self.assertFalse(user_notice.deleted)
 
+    async def test_cleanup_stale_session_notifications_counts_only_successful_deletes(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        channel = FakeTextChannel(321, [])
+        stale_notice = add_bot_message(channel, 101, "Every Code session connected for `project` on `main`: <#555>")
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+        bridge.notification_index().record(556, 105)
+
+        with self.assertLogs(bridge_module.logger, level="INFO") as logs:
+            await bridge.cleanup_stale_session_notifications()
+
+        self.assertTrue(stale_notice.deleted)
+        self.assertIn("Deleted 1 stale Every Code notification(s)", "\n".join(logs.output))
+
     async def test_cleanup_stale_session_notifications_preserves_live_session_notice(self) -> None:
         config = Config()
         config.every_code.channel_id = 321
@@ -738,8 +1569,8 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
             "Every Code session connected for `project`: <#555>",
         )
         bridge = EveryCodeBridge(FakeBot(config, channel=channel))
-        session_attach_lock = bridge._session_attach_lock
-        await session_attach_lock.acquire()
+        session_attach = bridge.attach_locks.attaching(make_hello())
+        await session_attach.__aenter__()
         cleanup_task = asyncio.create_task(bridge.cleanup_stale_session_notifications())
         await asyncio.sleep(0)
         self.assertFalse(cleanup_task.done())
@@ -750,7 +1581,7 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         )
         bridge.sessions.register(session)
         bridge.sessions.bind_thread("session-1", 555)
-        session_attach_lock.release()
+        await session_attach.__aexit__(None, None, None)
 
         await cleanup_task
 
@@ -816,6 +1647,46 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(await bridge.find_session_notification_for_thread(555), matching_notice.id)
 
+    async def test_notification_lookups_reuse_one_bounded_warm_scan(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.notification_scan_limit = 25
+        channel = FakeTextChannel(321, [])
+        first_notice = add_bot_message(channel, 101, "Every Code session connected for `project`: <#555>")
+        second_notice = add_bot_message(channel, 102, "Every Code session connected for `other`: <#556>")
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+
+        self.assertEqual(await bridge.find_session_notification_for_thread(555), first_notice.id)
+        self.assertEqual(await bridge.find_session_notification_for_thread(556), second_notice.id)
+        self.assertIsNone(await bridge.find_session_notification_for_thread(557))
+        await bridge.delete_session_notification_for_thread(556)
+
+        self.assertEqual(channel.history_calls, [25])
+        self.assertTrue(second_notice.deleted)
+        self.assertIsNone(await bridge.find_session_notification_for_thread(556))
+
+    async def test_notification_index_persists_notices_older_than_scan_window(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.notification_scan_limit = 5
+        thread = FakeThread(555)
+        channel = FakeTextChannel(321, [thread])
+        hello = make_hello()
+        first_bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+        notification_message_id = await first_bridge.ensure_session_notification(hello, thread)
+        for index in range(10):
+            add_bot_message(channel, 200 + index, f"Every Code status summary {index}")
+        restarted_bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+
+        self.assertEqual(await restarted_bridge.find_session_notification_for_thread(555), notification_message_id)
+
+        await restarted_bridge.cleanup_stale_session_notifications()
+
+        assert notification_message_id is not None
+        with self.assertRaises(bridge_module.discord.NotFound):
+            await channel.fetch_message(notification_message_id)
+        self.assertIsNone(await restarted_bridge.find_session_notification_for_thread(555))
+
     async def test_close_session_thread_deletes_reused_thread_notification(self) -> None:
         config = Config()
         config.every_code.channel_id = 321
@@ -939,14 +1810,14 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         websocket = FakeWebSocket()
         session = EveryCodeSession(hello=make_hello(), websocket=websocket)
         bridge.sessions.register(session)
-        session_attach_lock = bridge._session_attach_lock
-        await session_attach_lock.acquire()
+        session_attach = bridge.attach_locks.attaching(make_hello())
+        await session_attach.__aenter__()
         disconnect_task = asyncio.create_task(bridge.disconnect_active_sessions())
         await asyncio.sleep(0)
         self.assertFalse(disconnect_task.done())
 
         bridge.sessions.bind_thread("session-1", 555, notification_message_id=777)
-        session_attach_lock.release()
+        await session_attach.__aexit__(None, None, None)
 
         await disconnect_task
 
@@ -1605,6 +2476,47 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(reply_message.reactions, [])
         self.assertEqual(session.rejected_command_messages, [])
 
+    async def test_reply_reaction_updates_only_send_the_applied_diff(self) -> None:
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(Config(), thread))
+        reply_message = FakeReplyMessage(802, thread, "Run the quick path")
+        thread.add_message(reply_message)
+
+        await bridge.set_message_reaction(555, 802, bridge_module.REACTION_QUEUED)
+        self.assertEqual(len(reply_message.reaction_calls), len(bridge_module.TRANSIENT_REACTIONS))
+
+        reply_message.reaction_calls.clear()
+        await bridge.set_message_reaction(555, 802, bridge_module.REACTION_IN_PROGRESS)
+        await bridge.set_message_reaction(555, 802, bridge_module.REACTION_IN_PROGRESS)
+        await bridge.clear_message_transient_reactions(555, 802)
+        await bridge.clear_message_transient_reactions(555, 802)
+
+        self.assertEqual(
+            reply_message.reaction_calls,
+            [
+                f"add {bridge_module.REACTION_IN_PROGRESS}",
+                f"remove {bridge_module.REACTION_QUEUED}",
+                f"remove {bridge_module.REACTION_IN_PROGRESS}",
+            ],
+        )
+        self.assertEqual(reply_message.reactions, [])
+
+    async def test_control_reaction_updates_diff_against_applied_reactions(self) -> None:
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(Config(), thread))
+        control_message = add_bot_message(thread, 801, "\u200b")
+        controls = ["▶️", bridge_module.REACTION_CONTROL_STATUS, "⏹️"]
+        await bridge.add_message_reactions(cast(Any, control_message), controls)
+
+        control_message.reaction_calls.clear()
+        await bridge.replace_message_reactions(cast(Any, thread), 801, controls[:2])
+        self.assertEqual(control_message.reaction_calls, ["remove ⏹️"])
+
+        control_message.reaction_calls.clear()
+        await bridge.replace_message_reactions(cast(Any, thread), 801, [bridge_module.REACTION_QUEUED])
+        self.assertEqual(control_message.reaction_calls, ["clear", f"add {bridge_module.REACTION_QUEUED}"])
+        self.assertEqual(control_message.reactions, [bridge_module.REACTION_QUEUED])
+
     async def test_turn_complete_clears_stale_reactions_before_deleting_old_anchor(self) -> None:
         config = Config()
         thread = FakeThread(555)
@@ -1718,6 +2630,42 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         )
         self.assertFalse(control_message.deleted)
 
+    async def test_status_changed_bursts_coalesce_into_final_control_update(self) -> None:
+        config = Config()
+        config.every_code.control_refresh_debounce_seconds = 0.01
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(config, thread))
+        control_message = add_bot_message(thread, 901, "\u200b")
+        session = EveryCodeSession(
+            hello=make_hello(),
+            websocket=FakeWebSocket(),
+            thread_id=555,
+            control_message_id=901,
+        )
+        bridge.sessions.register(session)
+        bridge.sessions.bind_thread("session-1", 555)
+
+        for message in ["Turn started", "Compacting context", "Turn aborted"]:
+            await bridge.handle_session_status(
+                "status_changed",
+                SessionStatus(
+                    session_id="session-1",
+                    session_epoch="epoch-1",
+                    message=message,
+                    assistant_message=None,
+                ),
+            )
+
+        self.assertEqual(control_message.reactions[0], bridge_module.REACTION_IN_PROGRESS)
+        self.assertIsNotNone(session.control_refresh_task)
+        control_message.reaction_calls.clear()
+        await cast(asyncio.Task[None], session.control_refresh_task)
+
+        self.assertEqual(session.control_status_reaction, bridge_module.REACTION_REJECTED)
+        self.assertEqual(control_message.reactions, bridge.session_control_reactions(session))
+        self.assertNotIn(f"add {bridge_module.REACTION_COMPACTING}", control_message.reaction_calls)
+        self.assertIsNone(session.control_refresh_task)
+
     async def test_pause_reaction_queues_remote_command(self) -> None:
         config = Config()
         config.discord.employee_role_name = ""
@@ -1750,6 +2698,120 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(control_message.reactions, [bridge_module.REACTION_QUEUED])
         self.assertEqual(websocket.sent_json[0]["kind"], "pause_current_turn")
 
+    async def test_bridge_sent_messages_are_reused_until_deleted(self) -> None:
+        thread = FakeThread(555)
+        doodad = EveryCodeDoodad(cast(Any, FakeBot(Config(), thread)))
+        bridge = doodad.bridge
+        message = await bridge.send_message(cast(Any, thread), "Waiting for direction")
+        fetched: list[int] = []
+        original_fetch_message = thread.fetch_message
+
+        async def counting_fetch_message(message_id: int) -> FakeReplyMessage:
+            fetched.append(message_id)
+            return await original_fetch_message(message_id)
+
+        thread.fetch_message = counting_fetch_message  # type: ignore[method-assign]
+
+        await bridge.replace_message_reactions(cast(Any, thread), message.id, [bridge_module.REACTION_QUEUED])
+        await bridge.set_message_reaction(555, message.id, bridge_module.REACTION_IN_PROGRESS)
+        self.assertEqual(fetched, [])
+
+        await doodad.forget_deleted_message(cast(Any, SimpleNamespace(channel_id=555, message_id=message.id)))
+        await bridge.delete_session_message(555, message.id)
+
+        self.assertEqual(fetched, [message.id])
+        self.assertNotIn((555, message.id), bridge.message_cache)
+
+    async def test_message_cache_holds_only_bridge_authored_messages(self) -> None:
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(Config(), thread))
+        thread.add_message(FakeReplyMessage(700, thread, "from a human"))
+        add_bot_message(thread, 701, "Approval requested")
+
+        await bridge.fetch_message(cast(Any, thread), 700)
+        bot_message = await bridge.fetch_message(cast(Any, thread), 701)
+        edited = await bridge.edit_message(bot_message, content="Approval expired")
+
+        self.assertNotIn((555, 700), bridge.message_cache)
+        self.assertIs(bridge.message_cache.get(555, 701), edited)
+
+    async def test_edit_mode_folds_user_message_into_latest_control_anchor(self) -> None:
+        config = Config()
+        config.every_code.control_anchor_mode = "edit"
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(config, thread))
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        bridge.sessions.register(session)
+        bridge.sessions.bind_thread("session-1", 555)
+        await bridge.post_session_controls(session)
+        anchor = await thread.fetch_message(901)
+
+        await bridge.handle_user_message(
+            protocol_module.UserMessage(session_id="session-1", session_epoch="epoch-1", message="Ship it")
+        )
+
+        self.assertEqual(len(thread.sent_messages), 1)
+        self.assertEqual(anchor.content, bridge.format_user_message_notice("Ship it"))
+        self.assertEqual(anchor.reactions, bridge.session_control_reactions(session))
+        self.assertTrue(session.control_anchor_folded)
+
+        await bridge.handle_session_status(
+            "turn_complete",
+            SessionStatus(
+                session_id="session-1",
+                session_epoch="epoch-1",
+                message="Waiting for direction",
+                assistant_message="Done.",
+            ),
+        )
+
+        self.assertFalse(anchor.deleted)
+        self.assertEqual(anchor.reactions, [])
+        self.assertEqual(session.control_message_id, 903)
+        self.assertFalse(session.control_anchor_folded)
+
+    async def test_latest_thread_messages_only_track_live_session_threads(self) -> None:
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(Config(), thread))
+
+        await bridge.send_message(thread, "Before attach")
+        self.assertEqual(bridge.latest_thread_messages, {})
+
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        bridge.sessions.register(session)
+        bridge.sessions.bind_thread("session-1", 555)
+        message = await bridge.send_message(thread, "While attached")
+        self.assertEqual(bridge.latest_thread_messages, {555: message.id})
+
+        bridge.sessions.remove("session-1")
+        await bridge.close_session_thread(session)
+        self.assertEqual(bridge.latest_thread_messages, {})
+
+    async def test_edit_mode_respawns_control_anchor_after_it_scrolls_away(self) -> None:
+        config = Config()
+        config.every_code.control_anchor_mode = "edit"
+        thread = FakeThread(555)
+        doodad = EveryCodeDoodad(cast(Any, FakeBot(config, thread)))
+        bridge = doodad.bridge
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        bridge.sessions.register(session)
+        bridge.sessions.bind_thread("session-1", 555)
+        await bridge.post_session_controls(session)
+
+        self.assertTrue(
+            await bridge.spawn_session_controls(session, reaction=bridge_module.REACTION_IN_PROGRESS, interruptions_enabled=True)
+        )
+        self.assertEqual(session.control_message_id, 901)
+
+        reply_message = FakeReplyMessage(950, thread, "Unrelated chatter")
+        thread.add_message(reply_message)
+        await doodad.observe_thread_message(cast(Any, reply_message))
+        await bridge.spawn_session_controls(session, reaction=None, interruptions_enabled=False)
+
+        self.assertEqual(session.control_message_id, 902)
+        with self.assertRaises(bridge_module.discord.NotFound):
+            await thread.fetch_message(901)
+
     async def test_pause_command_routes_to_registered_session_websocket(self) -> None:
         config = Config()
         config.every_code.enabled = True
@@ -1973,6 +3035,75 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(approval_message.reactions, [])
         self.assertEqual(session.pending_approvals, {})
 
+    async def test_stale_pending_items_expire_with_visible_notice(self) -> None:
+        config = Config()
+        config.every_code.pending_command_ttl_seconds = 60
+        config.every_code.pending_items_limit = 2
+        thread = FakeThread(555)
+        bridge = EveryCodeBridge(FakeBot(config, thread))
+        command_message = FakeReplyMessage(801, thread, "status?")
+        approval_message = FakeReplyMessage(901, thread, "**Approval requested**")
+        thread.add_message(command_message)
+        thread.add_message(approval_message)
+        websocket = FakeWebSocket()
+        session = EveryCodeSession(hello=make_hello(), websocket=websocket, thread_id=555)
+        bridge.sessions.register(session)
+        session.pending_commands["stale"] = PendingRemoteCommand(thread_id=555, message_id=801, kind="status_request")
+        session.pending_commands.added_at["stale"] -= 120
+        session.pending_commands["active"] = PendingRemoteCommand(thread_id=555, message_id=None, kind="reply")
+        session.pending_commands.added_at["active"] -= 120
+        session.active_command_id = "active"
+        for index in range(3):
+            session.pending_approvals[f"approval-{index}"] = PendingRemoteApproval(thread_id=555, message_id=901 + index)
+        session.pending_user_inputs["turn-1"] = PendingRemoteUserInput(
+            thread_id=555, message_id=910, turn_id="turn-1", call_id="call-1"
+        )
+        session.pending_user_inputs.added_at["turn-1"] -= config.every_code.pending_prompt_ttl_seconds + 1
+
+        await bridge.expire_pending_items(session)
+
+        self.assertEqual(list(session.pending_commands), ["active"])
+        self.assertEqual(command_message.reactions, ["⌛"])
+        self.assertEqual(list(session.pending_approvals), ["approval-1", "approval-2"])
+        self.assertTrue(approval_message.content.startswith("**Approval expired**"))
+        self.assertEqual(bridge.metrics.pending_evictions.value("command", "ttl"), 1)
+        self.assertEqual(bridge.metrics.pending_evictions.value("approval", "limit"), 1)
+        self.assertEqual(list(session.pending_user_inputs), [])
+        decision, user_input_response = websocket.sent_json
+        self.assertEqual(
+            (decision["type"], decision["approval_id"], decision["decision"]), ("approval_decision", "approval-0", "denied")
+        )
+        self.assertEqual(user_input_response["kind"], "request_user_input_response")
+        self.assertEqual((user_input_response["call_id"], user_input_response["turn_id"]), ("call-1", "turn-1"))
+        self.assertEqual(user_input_response["response"], {"answers": {}})
+
+    async def test_pending_sweep_skips_items_acked_while_it_awaits_discord(self) -> None:
+        config = Config()
+        config.every_code.pending_command_ttl_seconds = 60
+        bridge = EveryCodeBridge(FakeBot(config, FakeThread(555)))
+        session = EveryCodeSession(hello=make_hello(), websocket=FakeWebSocket(), thread_id=555)
+        bridge.sessions.register(session)
+        for command_id, message_id in (("command-1", 801), ("command-2", 802)):
+            session.pending_commands[command_id] = PendingRemoteCommand(thread_id=555, message_id=message_id, kind="reply")
+            session.pending_commands.added_at[command_id] -= 120
+        reacted: list[tuple[int, str]] = []
+
+        async def ack_during_reaction(_thread_id: int, message_id: int, reaction: str) -> None:
+            reacted.append((message_id, reaction))
+            if len(reacted) > 1:
+                return
+            await bridge.handle_command_reject({"session_id": "session-1", "command_id": "command-2"})
+
+        bridge.start_session_inbound(session)
+        with patch.object(bridge, "set_message_reaction", ack_during_reaction), patch.object(bridge, "post_thread_notice"):
+            bridge.schedule_pending_sweep(session)
+            await bridge.stop_session_inbound(session, drain=True)
+
+        self.assertEqual(reacted, [(801, "⌛"), (802, "❌")])
+        self.assertEqual(session.pending_commands, {})
+        self.assertEqual(bridge.metrics.pending_evictions.value("command", "ttl"), 1)
+        self.assertEqual(bridge.metrics.handler_errors.value("pending_sweep"), 0)
+
     async def test_approval_decision_reject_uses_default_reason_for_empty_reason(self) -> None:
         config = Config()
         thread = FakeThread(555)
@@ -2643,6 +3774,74 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertNotIn(session_thread.thread, [first_thread, second_thread])
         self.assertIn("2 pid-relaxed candidates matched", "\n".join(logs.output))
 
+    async def test_reconnect_reads_each_candidate_history_once_and_picks_best_score(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        config.every_code.thread_scan_concurrency = 1
+        hello = make_hello()
+        quiet_thread = FakeThread(555)
+        busy_thread = FakeThread(556)
+        other_thread = FakeThread(557)
+        add_bot_message(quiet_thread, 1, session_start_message(hello))
+        add_bot_message(busy_thread, 2, session_start_message(hello))
+        add_bot_message(busy_thread, 3, "**Assistant**\nEarlier answer")
+        add_bot_message(other_thread, 4, "Every Code session connected\n\nsession: `someone-else`")
+        channel = FakeTextChannel(321, [quiet_thread, busy_thread, other_thread])
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+
+        self.assertIs(await bridge.find_existing_session_thread(hello), busy_thread)
+        for thread in (quiet_thread, busy_thread, other_thread):
+            self.assertEqual(thread.history_calls, [bridge_module.THREAD_HISTORY_SAMPLE_LIMIT])
+
+    async def test_thread_fingerprint_is_shared_until_thread_changes(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        hello = make_hello()
+        thread = FakeThread(555)
+        add_bot_message(thread, 1, session_start_message(hello))
+        channel = FakeTextChannel(321, [thread])
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+
+        self.assertIs(await bridge.find_existing_session_thread(hello), thread)
+        self.assertFalse(await bridge.thread_has_assistant_message(thread))
+        self.assertEqual(len(thread.history_calls), 1)
+
+        add_bot_message(thread, 2, "**Assistant**\nLater answer")
+        bridge.observe_thread_message(thread.id, 2)
+
+        self.assertTrue(await bridge.thread_has_assistant_message(thread))
+        self.assertEqual(len(thread.history_calls), 2)
+
+    async def test_startup_snapshot_serves_reconnects_and_grace_sweep(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        hello = make_hello()
+        live_thread = FakeThread(555)
+        stale_thread = FakeThread(556)
+        add_bot_message(live_thread, 1, session_start_message(hello))
+        add_bot_message(stale_thread, 2, "Every Code session connected\n\nsession: `someone-else`")
+        channel = FakeTextChannel(321, [live_thread, stale_thread])
+        live_notice = add_bot_message(channel, 701, session_notification_message(hello, live_thread))
+        stale_notice = add_bot_message(channel, 702, "Every Code session connected for `other`: <#556>")
+        bridge = EveryCodeBridge(FakeBot(config, channel=channel))
+
+        await bridge.warm_startup_state()
+        scans = (list(channel.history_calls), len(channel.archived_thread_calls))
+        bridge.sessions.register(EveryCodeSession(hello=hello, websocket=FakeWebSocket()))
+        session_thread = await bridge.find_or_create_session_thread(hello)
+        bridge.bind_session_thread(hello, session_thread)
+        with patch.object(bridge_module, "STARTUP_RECONNECT_GRACE_SECONDS", 0):
+            await bridge.cleanup_stale_sessions()
+
+        self.assertIs(session_thread.thread, live_thread)
+        self.assertEqual(session_thread.notification_message_id, live_notice.id)
+        self.assertEqual((channel.history_calls, len(channel.archived_thread_calls)), scans)
+        self.assertEqual(live_thread.history_calls, [bridge_module.THREAD_HISTORY_SAMPLE_LIMIT])
+        self.assertTrue(stale_notice.deleted)
+        self.assertFalse(live_notice.deleted)
+        self.assertIn("Every Code session disconnected", stale_thread.sent_messages)
+        self.assertIsNone(bridge._startup_snapshot)
+
     async def test_reconnect_reuses_existing_parent_notification(self) -> None:
         config = Config()
         config.every_code.channel_id = 321
@@ -2690,6 +3889,44 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(bridge.sessions.remove_if_current(old_session))
         self.assertIs(bridge.sessions.get(hello.session_id), new_session)
 
+    async def test_reconnect_uses_state_index_without_scanning_channel(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        hello = make_hello()
+        original_thread = FakeThread(555, archived=True, locked=True)
+        add_bot_message(original_thread, 1, session_start_message(hello))
+        channel = FakeTextChannel(321, [original_thread])
+        notice = add_bot_message(channel, 701, session_notification_message(hello, original_thread))
+        first_bridge = EveryCodeBridge(FakeBot(config, thread=original_thread, channel=channel))
+        first_bridge.sessions.register(EveryCodeSession(hello=hello, websocket=FakeWebSocket()))
+
+        first_bridge.bind_session_thread(hello, await first_bridge.find_or_create_session_thread(hello))
+        channel.archived_thread_calls.clear()
+        restarted_bridge = EveryCodeBridge(FakeBot(config, thread=original_thread, channel=channel))
+
+        session_thread = await restarted_bridge.find_or_create_session_thread(hello)
+
+        self.assertIs(session_thread.thread, original_thread)
+        self.assertEqual(session_thread.notification_message_id, notice.id)
+        self.assertEqual(channel.archived_thread_calls, [])
+        self.assertEqual(channel.sent_messages, [])
+
+    async def test_reconnect_scans_discord_when_indexed_thread_no_longer_matches(self) -> None:
+        config = Config()
+        config.every_code.channel_id = 321
+        hello = make_hello()
+        stale_thread = FakeThread(555)
+        add_bot_message(stale_thread, 1, "Every Code session connected\n\nsession: `someone-else`")
+        channel = FakeTextChannel(321, [stale_thread])
+        bridge = EveryCodeBridge(FakeBot(config, thread=stale_thread, channel=channel))
+        bridge.state_index().record_session_thread(hello, stale_thread.id, None)
+
+        session_thread = await bridge.find_or_create_session_thread(hello)
+
+        self.assertIsNot(session_thread.thread, stale_thread)
+        self.assertEqual(len(channel.archived_thread_calls), 2)
+        self.assertIsNone(bridge.state_index().lookup_session_thread(hello))
+
     async def test_reconnect_ignores_thread_for_different_session_metadata(self) -> None:
         config = Config()
         config.every_code.channel_id = 321
@@ -2766,6 +4003,84 @@ class BridgeTests(unittest.IsolatedAsyncioTestCase):
                 "Second",
             )
 
+    def test_reverse_lines_reads_from_the_end_across_chunks(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "lines.jsonl"
+            path.write_bytes(b"first line\n\nsecond line that spans chunks\r\nthird")
+
+            lines = list(rollouts_module.reverse_lines(path, chunk_size=4))
+
+        self.assertEqual(lines, [b"third", b"second line that spans chunks\r", b"first line"])
+
+    def test_rollout_lookup_only_decodes_agent_message_lines(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            rollout = Path(tmp) / "rollout.jsonl"
+            rollout.write_text(
+                "\n".join(
+                    [
+                        json.dumps({"payload": {"msg": {"type": "agent_message", "message": "Answer"}}}),
+                        json.dumps({"payload": {"msg": {"type": "agent_message", "message": "  "}}}),
+                        *[json.dumps({"payload": {"msg": {"type": "token_count"}}}) for _ in range(50)],
+                    ]
+                )
+            )
+
+            with patch.object(rollouts_module.json, "loads", wraps=json.loads) as loads:
+                self.assertEqual(rollouts_module.latest_agent_message(rollout), "Answer")
+
+        self.assertEqual(loads.call_count, 2)
+
+    def test_session_catalog_parses_only_appended_entries(self) -> None:
+        def entry(session_id: str, rollout_path: str) -> str:
+            return json.dumps({"session_id": session_id, "rollout_path": rollout_path}) + "\n"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog_path = Path(tmp) / "catalog.jsonl"
+            catalog_path.write_text(entry("session-1", "old.jsonl") + entry("session-2", "other.jsonl"))
+            catalog = rollouts_module.SessionCatalog(catalog_path)
+
+            self.assertEqual(catalog.rollout_path("session-1"), "old.jsonl")
+            with catalog_path.open("a") as handle:
+                handle.write(entry("session-1", "new.jsonl") + '{"session_id": "session-3"')
+            with patch.object(rollouts_module.json, "loads", wraps=json.loads) as loads:
+                self.assertEqual(catalog.rollout_path("session-1"), "new.jsonl")
+                self.assertIsNone(catalog.rollout_path("session-3"))
+            self.assertEqual(loads.call_count, 3)
+
+            catalog_path.write_text(entry("session-4", "fresh.jsonl"))
+            self.assertIsNone(catalog.rollout_path("session-1"))
+            self.assertEqual(catalog.rollout_path("session-4"), "fresh.jsonl")
+
+            catalog_path.unlink()
+            self.assertIsNone(catalog.rollout_path("session-4"))
+
+    def test_resume_session_resolver_reads_proc_and_caches_by_start_time(self) -> None:
+        session_id = "0199a1b2-c3d4-4e5f-8a9b-0c1d2e3f4a5b"
+        other_session_id = "0199a1b2-c3d4-4e5f-8a9b-0c1d2e3f4a5c"
+
+        def write_process(proc_root: Path, start_time: int, resumed: str) -> None:
+            process_dir = proc_root / "4242"
+            process_dir.mkdir(exist_ok=True)
+            fields = ["S", *["0"] * 18, str(start_time), "0"]
+            (process_dir / "stat").write_text(f"4242 (code (agent)) {' '.join(fields)}")
+            (process_dir / "cmdline").write_bytes(f"code\0resume\0{resumed}\0".encode())
+
+        processes_module.RESUME_SESSIONS.clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            proc_root = Path(tmp)
+            write_process(proc_root, 100, session_id)
+            with (
+                patch.object(processes_module, "PROC_ROOT", proc_root),
+                patch.object(processes_module.subprocess, "run", side_effect=AssertionError("ps should not run")),
+            ):
+                self.assertEqual(EveryCodeBridge.resume_session_id_for_pid(4242), session_id)
+                (proc_root / "4242" / "cmdline").write_bytes(b"code\0")
+                self.assertEqual(EveryCodeBridge.resume_session_id_for_pid(4242), session_id)
+
+                write_process(proc_root, 200, other_session_id)
+                self.assertEqual(EveryCodeBridge.resume_session_id_for_pid(4242), other_session_id)
+        processes_module.RESUME_SESSIONS.clear()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import time
 import unittest
 from types import SimpleNamespace
 from typing import Any
@@ -11,7 +13,9 @@ from aiohttp import web
 
 from discord_blue.doodads.every_code.bridge import EveryCodeBridge
 from discord_blue.health import RUNTIME_IDENTITY_ENV
+from discord_blue.health import HealthPayloadEncoder
 from discord_blue.health import health_payload
+from discord_blue.loop_monitor import LoopLagMonitor
 from discord_blue.plugs.discord_plug import BlueBot
 from tests.fakes_every_code import FakeBot
 
@@ -83,6 +87,30 @@ class HealthPayloadTests(unittest.TestCase):
             },
         )
 
+    def test_encoder_matches_payload_and_keeps_startup_identity(self) -> None:
+        environment = {
+            RUNTIME_IDENTITY_ENV: json.dumps({"schema_version": 1, "instance": "discord-blue-1"}),
+            "LAUNCHPLANE_SOURCE_GIT_REF": "abc123",
+        }
+        with patch.dict("os.environ", environment, clear=True):
+            encoder = HealthPayloadEncoder()
+            expected = health_payload(
+                discord_status="unhealthy",
+                every_code_enabled=True,
+                active_every_code_sessions=3,
+                event_loop={"status": "ok", "lag_seconds": 0.001, "max_lag_seconds": 0.002},
+            )
+
+        with patch.dict("os.environ", {RUNTIME_IDENTITY_ENV: "{"}, clear=True):
+            encoded = encoder.encode(
+                discord_status="unhealthy",
+                every_code_enabled=True,
+                active_every_code_sessions=3,
+                event_loop={"status": "ok", "lag_seconds": 0.001, "max_lag_seconds": 0.002},
+            )
+
+        self.assertEqual(json.loads(encoded), expected)
+
 
 class HealthEndpointTests(unittest.IsolatedAsyncioTestCase):
     async def test_bridge_health_endpoint_returns_json_without_auth(self) -> None:
@@ -129,5 +157,75 @@ class HealthEndpointTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(body["components"]["discord"], {"status": "unhealthy"})
 
 
+class LoopLagMonitorTests(unittest.IsolatedAsyncioTestCase):
+    async def test_lag_samples_feed_metrics_and_warn_past_threshold(self) -> None:
+        samples: list[float] = []
+        stalls: list[None] = []
+        monitor = LoopLagMonitor(
+            interval_seconds=1,
+            warning_seconds=0.25,
+            on_sample=samples.append,
+            on_stall=lambda: stalls.append(None),
+        )
+
+        monitor.record(0.01)
+        self.assertFalse(monitor.lagging)
+        with self.assertLogs("discord_blue.loop_monitor", level="WARNING") as logs:
+            monitor.record(0.5)
+
+        self.assertTrue(monitor.lagging)
+        self.assertEqual(samples, [0.01, 0.5])
+        self.assertEqual(len(stalls), 1)
+        self.assertEqual(monitor.max_lag_seconds, 0.5)
+        self.assertIn("Event loop lagged 0.500 seconds", logs.output[0])
+
+    async def test_watchdog_names_the_blocking_task_and_frame(self) -> None:
+        monitor = LoopLagMonitor(interval_seconds=0.01, warning_seconds=0.05, detect_blocking=True)
+        monitor.start()
+        await asyncio.sleep(0.02)
+
+        with self.assertLogs("discord_blue.loop_monitor", level="WARNING") as logs:
+            time.sleep(0.3)
+            await asyncio.sleep(0.05)
+        await monitor.stop()
+
+        self.assertIn("test_watchdog_names_the_blocking_task_and_frame", monitor.last_culprit or "")
+        self.assertIn("Event loop blocked for more than 0.050 seconds", "\n".join(logs.output))
+        self.assertGreaterEqual(monitor.max_lag_seconds, 0.2)
+        lag_warnings = [line for line in logs.output if "Event loop lagged" in line]
+        self.assertTrue(lag_warnings)
+        self.assertIn("test_watchdog_names_the_blocking_task_and_frame", lag_warnings[0])
+
+    async def test_lag_sample_ignores_culprit_captured_before_its_interval(self) -> None:
+        monitor = LoopLagMonitor(interval_seconds=1, warning_seconds=0.25, detect_blocking=True)
+        monitor.last_culprit = "task stale-task at old_frame"
+        monitor.last_culprit_at = time.monotonic()
+
+        with self.assertLogs("discord_blue.loop_monitor", level="WARNING") as logs:
+            monitor.record(0.5, since=time.monotonic() + 1)
+            monitor.record(0.5, since=monitor.last_culprit_at)
+
+        self.assertNotIn("stale-task", logs.output[0])
+        self.assertIn("an unidentified callback", logs.output[0])
+        self.assertIn("stale-task", logs.output[1])
+
+    async def test_bridge_health_reports_event_loop_lag(self) -> None:
+        config = SimpleNamespace(every_code=SimpleNamespace(enabled=True))
+        bridge = EveryCodeBridge(cast(BlueBot, FakeBot(cast(Any, config))))
+        bridge.loop_monitor = LoopLagMonitor(interval_seconds=1, warning_seconds=0.25)
+        bridge.loop_monitor.lag_seconds = 0.3
+        bridge.loop_monitor.max_lag_seconds = 0.3
+
+        with patch.dict("os.environ", {}, clear=True):
+            response = await bridge.handle_health(cast(web.Request, SimpleNamespace(headers={})))
+
+        body = json.loads(cast(bytes, response.body).decode())
+        self.assertEqual(body["status"], "ok")
+        self.assertEqual(
+            body["components"]["event_loop"],
+            {"status": "lagging", "lag_seconds": 0.3, "max_lag_seconds": 0.3},
+        )
+
+
 if __name__ == "__main__":
     unittest.main()